@@ -0,0 +1,184 @@
+"""Streaming, token-aware chunking shared by the context systems."""
+
+import re
+import threading
+from typing import TYPE_CHECKING, Callable, Iterator
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+    from langchain_core.embeddings import Embeddings
+
+# characters read from a file at a time
+READ_BLOCK_CHARS = 64 * 1024
+# window used when the embedder exposes no tokenizer
+DEFAULT_CHUNK_TOKENS = 256
+# special tokens the embedder adds around every input ([CLS], [SEP])
+SPECIAL_TOKENS = 2
+
+_WORD = re.compile(r"\S+")
+
+
+def _word_offsets(text: str) -> list[tuple[int, int]]:
+    return [match.span() for match in _WORD.finditer(text)]
+
+
+class TokenChunker:
+    """
+    Splits text into chunks of at most chunk_tokens tokens, consecutive chunks sharing
+    overlap_tokens tokens.
+
+    Files are read in blocks, so memory is bounded by the block size rather than the
+    file size. Chunk ends are moved back to the nearest line break if one is close, so
+    chunks tend to end on paragraph or line boundaries.
+
+    Args:
+        token_offsets: Returns the (start, end) character offsets of the tokens of a text.
+        chunk_tokens: Maximum tokens per chunk.
+        overlap_tokens: Tokens shared by consecutive chunks.
+    """
+
+    def __init__(
+        self,
+        token_offsets: Callable[[str], list[tuple[int, int]]] = _word_offsets,
+        chunk_tokens: int = DEFAULT_CHUNK_TOKENS,
+        overlap_tokens: int = 0,
+    ) -> None:
+        if not 0 <= overlap_tokens < chunk_tokens:
+            raise ValueError(
+                f"overlap_tokens must be in [0, chunk_tokens), got {overlap_tokens} for {chunk_tokens}"
+            )
+        self.token_offsets = token_offsets
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+
+    def split_stream(self, blocks: Iterator[str]) -> Iterator[tuple[str, int, int]]:
+        """Chunks text arriving in blocks.
+
+        Args:
+            blocks: Consecutive pieces of the text.
+
+        Yields:
+            Each chunk with the character offsets of its start and end in the text.
+        """
+        buffer = ""
+        # offset of buffer[0] in the text
+        base = 0
+        blocks = iter(blocks)
+        # token index of buffer the next chunk has to end after, so that no chunk lies
+        # within the previous one
+        previous_end = 0
+        exhausted = False
+        while not exhausted:
+            block = next(blocks, None)
+            if block is None:
+                exhausted = True
+            else:
+                buffer += block
+                if len(buffer) < READ_BLOCK_CHARS:
+                    continue
+
+            offsets = self.token_offsets(buffer)
+            start = 0
+            # until the text ends, the last tokens of the buffer may continue in the next
+            # block, so they are only chunked once a full chunk follows them
+            while len(offsets) - start > (0 if exhausted else 2 * self.chunk_tokens):
+                end = self._chunk_end(buffer, offsets, start, previous_end)
+                chunk_start, chunk_end = offsets[start][0], offsets[end - 1][1]
+                yield buffer[chunk_start:chunk_end], base + chunk_start, base + chunk_end
+                if end == len(offsets):
+                    start = end
+                    break
+                previous_end = end
+                start = max(end - self.overlap_tokens, start + 1)
+
+            consumed = offsets[start][0] if start < len(offsets) else len(buffer)
+            buffer = buffer[consumed:]
+            base += consumed
+            previous_end = max(0, previous_end - start)
+
+    def _chunk_end(
+        self, text: str, offsets: list[tuple[int, int]], start: int, min_end: int = 0
+    ) -> int:
+        """Index after the last token of the chunk starting at token start, past min_end."""
+        end = min(start + self.chunk_tokens, len(offsets))
+        if end == len(offsets):
+            return end
+        # prefer ending before a token that starts a new line, within the last quarter
+        for candidate in range(end, max(end - self.chunk_tokens // 4, min_end), -1):
+            token_start = offsets[candidate][0]
+            if "\n" in text[offsets[candidate - 1][1] : token_start]:
+                return candidate
+        return end
+
+    def split_file(self, file: str) -> Iterator["Document"]:
+        """Streams the chunks of a text file.
+
+        Args:
+            file: Filepath to chunk.
+
+        Yields:
+            Chunks with their source and character offsets (start_index, end_index) as metadata.
+        """
+        from langchain_core.documents import Document
+
+        with open(file, encoding="utf-8", errors="replace") as f:
+            blocks = iter(lambda: f.read(READ_BLOCK_CHARS), "")
+            for text, start, end in self.split_stream(blocks):
+                yield Document(
+                    page_content=text,
+                    metadata={"source": file, "start_index": start, "end_index": end},
+                )
+
+
+def embedder_token_offsets(embedder: "Embeddings") -> tuple[Callable[[str], list[tuple[int, int]]], int]:
+    """Tokenizer offsets function and input window of embedder.
+
+    Falls back to whitespace separated words when the embedder exposes no tokenizer.
+    """
+    try:
+        tokenizer = embedder.tokenizer
+        window = embedder.max_seq_length - SPECIAL_TOKENS
+    except AttributeError:
+        return _word_offsets, DEFAULT_CHUNK_TOKENS
+
+    # fast tokenizers are not safe to call from several threads at once
+    lock = threading.Lock()
+
+    def _token_offsets(text: str) -> list[tuple[int, int]]:
+        with lock:
+            encoding = tokenizer(
+                text, add_special_tokens=False, return_offsets_mapping=True, verbose=False
+            )
+        return encoding["offset_mapping"]
+
+    return _token_offsets, window
+
+
+_chunker: TokenChunker | None = None
+_chunker_lock = threading.Lock()
+
+
+def get_chunker() -> TokenChunker:
+    """Returns the process-wide chunker, sized to the embedding service's input window."""
+    global _chunker
+    if _chunker is None:
+        with _chunker_lock:
+            if _chunker is None:
+                from . import parameters
+                from .embedding_service import get_embedding_service
+
+                token_offsets, window = embedder_token_offsets(get_embedding_service())
+                chunk_tokens = parameters.get_chunk_tokens() or window
+                _chunker = TokenChunker(
+                    token_offsets,
+                    chunk_tokens=min(chunk_tokens, window),
+                    overlap_tokens=parameters.get_chunk_overlap_tokens(),
+                )
+    return _chunker
+
+
+def set_chunker(chunker: TokenChunker | None) -> None:
+    """Replaces the process-wide chunker; None rebuilds it on next use."""
+    global _chunker
+    with _chunker_lock:
+        _chunker = chunker
@@ -0,0 +1,157 @@
+"""Assembles retrieved chunks into a deduplicated, diverse, token-budgeted context."""
+
+from collections import OrderedDict
+from dataclasses import dataclass, field
+import hashlib
+import threading
+from typing import Callable
+
+import numpy as np
+
+
+@dataclass
+class Candidate:
+    """A chunk returned by one of the context stores."""
+
+    content: str
+    score: float
+    store: str
+    vector: np.ndarray
+    metadata: dict = field(default_factory=dict)
+
+    @property
+    def content_hash(self) -> str:
+        return content_hash(self.content)
+
+
+def content_hash(text: str) -> str:
+    """Hash of text with whitespace normalized, so the same chunk from two stores matches."""
+    return hashlib.sha1(" ".join(text.split()).encode("utf-8")).hexdigest()
+
+
+class TokenCountCache:
+    """Bounded LRU cache of chunk token counts measured with the loaded tokenizer."""
+
+    def __init__(self, count_tokens: Callable[[str], int], max_size: int = 4096) -> None:
+        self.count_tokens = count_tokens
+        self.max_size = max_size
+        self._counts: OrderedDict[tuple[str, str], int] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def count(self, text: str, tokenizer_key: str = "") -> int:
+        """Returns the token count of text, measuring it only on a cache miss.
+
+        Args:
+            text: Text to count.
+            tokenizer_key: Identifies the tokenizer (e.g. the loaded model) so counts
+                from another tokenizer are not reused.
+        """
+        key = (tokenizer_key, content_hash(text))
+        with self._lock:
+            if key in self._counts:
+                self._counts.move_to_end(key)
+                return self._counts[key]
+        n_tokens = self.count_tokens(text)
+        with self._lock:
+            self._counts[key] = n_tokens
+            while len(self._counts) > self.max_size:
+                self._counts.popitem(last=False)
+        return n_tokens
+
+
+def deduplicate(candidates: list[Candidate]) -> list[Candidate]:
+    """Drops chunks with the same content, keeping the first occurrence."""
+    seen = set()
+    unique = []
+    for candidate in candidates:
+        if candidate.content_hash not in seen:
+            seen.add(candidate.content_hash)
+            unique.append(candidate)
+    return unique
+
+
+def mmr_order(
+    query_vector: np.ndarray, vectors: np.ndarray, lambda_mult: float = 0.7
+) -> list[int]:
+    """Orders vectors by maximal marginal relevance to query_vector.
+
+    Each step picks the vector maximizing
+    lambda_mult * sim(query, v) - (1 - lambda_mult) * max sim(v, already picked),
+    with all similarities computed as cosine in a single matrix product.
+
+    Args:
+        query_vector: Query embedding, shape (d,).
+        vectors: Candidate embeddings, shape (n, d).
+        lambda_mult: Trade-off between relevance (1) and diversity (0).
+
+    Returns:
+        Indices of all n vectors in MMR order.
+    """
+    n = len(vectors)
+    if n == 0:
+        return []
+    vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    query_vector = query_vector / max(np.linalg.norm(query_vector), 1e-12)
+    query_sim = vectors @ query_vector
+    pairwise_sim = vectors @ vectors.T
+
+    order = []
+    max_selected_sim = np.full(n, -np.inf)
+    available = np.ones(n, dtype=bool)
+    for step in range(n):
+        redundancy = max_selected_sim if step else np.zeros(n)
+        mmr_scores = lambda_mult * query_sim - (1 - lambda_mult) * redundancy
+        mmr_scores[~available] = -np.inf
+        best = int(np.argmax(mmr_scores))
+        order.append(best)
+        available[best] = False
+        max_selected_sim = np.maximum(max_selected_sim, pairwise_sim[best])
+    return order
+
+
+def pack_into_budget(
+    candidates: list[Candidate],
+    budget: int,
+    count_tokens: Callable[[str], int],
+    separator_tokens: int = 2,
+) -> list[Candidate]:
+    """Greedily keeps candidates, in order, whose tokens still fit in budget."""
+    packed = []
+    remaining = budget
+    for candidate in candidates:
+        cost = count_tokens(candidate.content) + separator_tokens
+        if cost <= remaining:
+            packed.append(candidate)
+            remaining -= cost
+    return packed
+
+
+def assemble_context(
+    query_vector: list[float] | np.ndarray | None,
+    candidates: list[Candidate],
+    budget: int,
+    count_tokens: Callable[[str], int],
+    lambda_mult: float = 0.7,
+) -> list[Candidate]:
+    """Deduplicates candidates across stores, reranks them with MMR and packs them into budget.
+
+    Args:
+        query_vector: Embedding of the user input. Without it candidates are ranked by
+            score instead of MMR.
+        candidates: Chunks returned by all context stores.
+        budget: Number of prompt tokens available for context.
+        count_tokens: Token counter for chunk text (ideally cached).
+        lambda_mult: MMR trade-off between relevance (1) and diversity (0).
+
+    Returns:
+        The selected chunks, most relevant first.
+    """
+    candidates = deduplicate(candidates)
+    if not candidates or budget <= 0:
+        return []
+    if query_vector is None:
+        order = sorted(range(len(candidates)), key=lambda i: candidates[i].score, reverse=True)
+    else:
+        vectors = np.asarray([candidate.vector for candidate in candidates], dtype=np.float32)
+        order = mmr_order(np.asarray(query_vector, dtype=np.float32), vectors, lambda_mult)
+    return pack_into_budget([candidates[i] for i in order], budget, count_tokens)
@@ -0,0 +1,118 @@
+"""Embedding model backends: PyTorch, ONNX Runtime and int8 quantized ONNX Runtime."""
+
+import platform
+from pathlib import Path
+
+from langchain_core.embeddings import Embeddings
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+# exported/quantized ONNX models, one directory per model
+ONNX_EXPORT_DIR = str(Path("cache/habitllm_embedders/").resolve())
+
+
+class SentenceTransformerEmbeddings(Embeddings):
+    """
+    langchain Embeddings over a sentence-transformers model, with an explicit batch size.
+
+    Texts are preprocessed like langchain's HuggingFaceEmbeddings, so vectors match those
+    of stores built with it.
+
+    Args:
+        client: The sentence-transformers model.
+        batch_size: Texts per forward pass when embedding documents.
+    """
+
+    def __init__(self, client, batch_size: int = 64) -> None:
+        self.client = client
+        self.batch_size = batch_size
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        texts = [text.replace("\n", " ") for text in texts]
+        return self.client.encode(texts, batch_size=self.batch_size).tolist()
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.client.encode(text.replace("\n", " ")).tolist()
+
+
+def load_embeddings(
+    model_name: str, backend: str = "torch", threads: int = 0, batch_size: int = 64
+) -> SentenceTransformerEmbeddings:
+    """Loads model_name with the given backend.
+
+    Args:
+        model_name: sentence-transformers model name or path.
+        backend: One of BACKENDS. The onnx backends need the onnx extras
+            (`pip install habitllm[onnx]`, habitllm/requirements_onnx.txt);
+            onnx-int8 exports and dynamically quantizes the model on first use.
+        threads: Intra-op threads, 0 keeps the library default. For the torch backend this
+            is torch's process-wide setting, so it also applies to a model running in-process.
+        batch_size: Texts per forward pass when embedding documents.
+
+    Returns:
+        The embedding model.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend {backend!r}, expected one of {BACKENDS}")
+    from sentence_transformers import SentenceTransformer
+
+    if backend == "torch":
+        if threads:
+            import torch
+
+            torch.set_num_threads(threads)
+        return SentenceTransformerEmbeddings(SentenceTransformer(model_name), batch_size)
+
+    model_kwargs = {"provider": "CPUExecutionProvider"}
+    if threads:
+        import onnxruntime
+
+        session_options = onnxruntime.SessionOptions()
+        session_options.intra_op_num_threads = threads
+        session_options.inter_op_num_threads = 1
+        model_kwargs["session_options"] = session_options
+
+    if backend == "onnx":
+        client = SentenceTransformer(model_name, backend="onnx", model_kwargs=model_kwargs)
+    else:
+        export_dir, file_name = _export_quantized(model_name, model_kwargs)
+        client = SentenceTransformer(
+            export_dir, backend="onnx", model_kwargs={**model_kwargs, "file_name": file_name}
+        )
+    return SentenceTransformerEmbeddings(client, batch_size)
+
+
+def _export_quantized(model_name: str, model_kwargs: dict) -> tuple[str, str]:
+    """Exports model_name to ONNX and quantizes it to int8 unless already done.
+
+    Returns:
+        The export directory and the quantized model file within it.
+    """
+    from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+
+    config = quantization_config()
+    export_dir = Path(ONNX_EXPORT_DIR) / model_name.replace("/", "__")
+    file_name = f"onnx/model_int8_{config}.onnx"
+    if not (export_dir / file_name).is_file():
+        print(f"Exporting {model_name} to int8 ONNX ({config}) in {export_dir}")
+        model = SentenceTransformer(model_name, backend="onnx", model_kwargs=model_kwargs)
+        model.save_pretrained(str(export_dir))
+        export_dynamic_quantized_onnx_model(
+            model, config, str(export_dir), file_suffix=f"int8_{config}"
+        )
+    return str(export_dir), file_name
+
+
+def quantization_config() -> str:
+    """The ONNX Runtime dynamic quantization preset matching this CPU."""
+    if platform.machine().lower() in ("arm64", "aarch64"):
+        return "arm64"
+    try:
+        with open("/proc/cpuinfo") as f:
+            flags = next((line for line in f if line.startswith("flags")), "").split()
+    except OSError:
+        flags = []
+    if "avx512_vnni" in flags:
+        return "avx512_vnni"
+    if "avx512f" in flags:
+        return "avx512"
+    return "avx2"
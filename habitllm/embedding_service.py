@@ -0,0 +1,141 @@
+"""Process-wide embedding service shared by the context systems."""
+
+from collections import OrderedDict
+import threading
+
+from langchain_core.embeddings import Embeddings
+
+from .embedding_backends import load_embeddings
+
+DEFAULT_EMBEDDER = "sentence-transformers/all-mpnet-base-v2"
+DEFAULT_QUERY_CACHE_SIZE = 256
+
+
+class EmbeddingService(Embeddings):
+    """
+    Single embedding model shared by the inference specific and model persistent context systems.
+
+    Query vectors are kept in a bounded LRU cache so a query is embedded at most once per turn
+    (and not at all when it is repeated). The model itself is loaded on first use, so processes
+    that never embed (e.g. maintenance jobs) do not pay for it.
+
+    Args:
+        model_name: sentence-transformers model to embed with.
+        query_cache_size: Number of query vectors to cache.
+        backend: Inference backend, see embedding_backends.BACKENDS.
+        threads: Intra-op threads of the backend, 0 keeps its default.
+        batch_size: Texts per forward pass when embedding documents.
+    """
+
+    def __init__(
+        self,
+        model_name: str = DEFAULT_EMBEDDER,
+        query_cache_size: int = DEFAULT_QUERY_CACHE_SIZE,
+        backend: str = "torch",
+        threads: int = 0,
+        batch_size: int = 64,
+    ) -> None:
+        self.model_name = model_name
+        self.query_cache_size = query_cache_size
+        self.backend = backend
+        self.threads = threads
+        self.batch_size = batch_size
+        self._embeddings = None
+        self._model_lock = threading.Lock()
+        self._query_cache: OrderedDict[str, list[float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    @property
+    def embeddings(self):
+        """The underlying embedding model, loaded on first access."""
+        if self._embeddings is None:
+            with self._model_lock:
+                if self._embeddings is None:
+                    self._embeddings = load_embeddings(
+                        self.model_name,
+                        backend=self.backend,
+                        threads=self.threads,
+                        batch_size=self.batch_size,
+                    )
+        return self._embeddings
+
+    @property
+    def tokenizer(self):
+        """Tokenizer of the embedding model, used to size chunks to its input window."""
+        return self.embeddings.client.tokenizer
+
+    @property
+    def max_seq_length(self) -> int:
+        """Tokens of input the model sees, longer texts are truncated."""
+        return self.embeddings.client.max_seq_length
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        """Embeds a batch of documents. Document vectors are not cached."""
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        """Embeds a query, serving repeated queries from the LRU cache.
+
+        Args:
+            text: Query to embed.
+
+        Returns:
+            The query embedding.
+        """
+        with self._lock:
+            vector = self._query_cache.get(text)
+            if vector is not None:
+                self._query_cache.move_to_end(text)
+                self.cache_hits += 1
+                return vector
+            self.cache_misses += 1
+
+        vector = self.embeddings.embed_query(text)
+
+        with self._lock:
+            self._query_cache[text] = vector
+            self._query_cache.move_to_end(text)
+            while len(self._query_cache) > self.query_cache_size:
+                self._query_cache.popitem(last=False)
+        return vector
+
+    def clear_cache(self) -> None:
+        with self._lock:
+            self._query_cache.clear()
+
+
+_service: Embeddings | None = None
+_service_lock = threading.Lock()
+
+
+def get_embedding_service() -> Embeddings:
+    """Returns the process-wide embedding service. The model is loaded on first use."""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = EmbeddingService(**_service_options())
+    return _service
+
+
+def set_embedding_service(service: Embeddings) -> None:
+    """Replaces the process-wide embedding service (e.g. with a stand-in embedder)."""
+    global _service
+    with _service_lock:
+        _service = service
+
+
+def _service_options() -> dict:
+    try:
+        from . import parameters
+
+        return {
+            "query_cache_size": parameters.get_query_embedding_cache_size(),
+            "backend": parameters.get_embedding_backend(),
+            "threads": parameters.get_embedding_threads(),
+            "batch_size": parameters.get_embedding_batch_size(),
+        }
+    except (OSError, KeyError):
+        return {}
@@ -6,4 +6,18 @@ HabitLLM.
 
 from .data_handler import *
 
-__all__ = ["add_files_to_vector_store", "perform_similarity_search"]
+__all__ = [
+    "add_files_to_vector_store",
+    "perform_similarity_search",
+    "perform_similarity_search_with_vectors",
+    "perform_hybrid_search_with_vectors",
+    "restore_vector_store",
+    "get_store_version",
+    "index_stats",
+    "index_stats_markdown",
+    "get_session",
+    "get_store",
+    "get_uploaded_files",
+    "InferenceContextStore",
+    "SessionStores",
+]
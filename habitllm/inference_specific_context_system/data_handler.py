@@ -1,67 +1,123 @@
-import os
 from pathlib import Path
-import shutil
+from typing import TYPE_CHECKING, Callable
 
-from langchain.embeddings import HuggingFaceEmbeddings
-from langchain.document_loaders.text import TextLoader
-from langchain.docstore.document import Document
-from langchain.text_splitter import CharacterTextSplitter
-from langchain.vectorstores import VectorStore
-from langchain.vectorstores.faiss import FAISS
+import numpy as np
 
+from .. import parameters
+from ..ingestion import IngestionReport
+from .sessions import DEFAULT_SESSION, SessionStores, session_key
+from .store import InferenceContextStore
+
+if TYPE_CHECKING:
+    from langchain.docstore.document import Document
+
+# upload and index directories of the default (global) store
 INF_SPECIFIC_DST = str(Path("cache/inference_context_upload_dir/").resolve())
+INF_SPECIFIC_INDEX_DIR = str(Path("cache/inference_context_index/").resolve())
+# per-session stores, see sessions
+INF_SPECIFIC_SESSIONS_DIR = str(Path("cache/inference_context_sessions/").resolve())
+
+stores = SessionStores(
+    INF_SPECIFIC_SESSIONS_DIR,
+    default_dirs=(INF_SPECIFIC_DST, INF_SPECIFIC_INDEX_DIR),
+    budget_bytes=int(parameters.get_isc_memory_budget_mb() * 2**20),
+)
+
+
+def get_session(state: dict | None) -> str:
+    """Session key of the store a chat turn or upload with this webui state uses."""
+    return session_key(state, parameters.get_isc_session_scope())
+
+
+def get_store(session: str = DEFAULT_SESSION) -> InferenceContextStore:
+    return stores.get(session)
+
+
+def add_files_to_vector_store(
+    files: list[str],
+    session: str = DEFAULT_SESSION,
+    progress: Callable[[int, int, int], None] | None = None,
+) -> IngestionReport:
+    """Copies, loads, splits and embeds files into the inference specific context store of session.
+
+    Args:
+        files: Filepaths to add.
+        session: Session key, see get_session.
+        progress: See InferenceContextStore.add_files.
+
+    Returns:
+        Throughput report of the ingestion.
+    """
+    store = stores.get(session)
+    report = store.add_files(files, progress)
+    stores.evict(keep=store)
+    return report
+
+
+def restore_vector_store(session: str = DEFAULT_SESSION) -> None:
+    """Loads the persisted index of session and reconciles it with its upload directory.
+
+    Other sessions are loaded on first use.
+    """
+    stores.get(session)
 
-embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-mpnet-base-v2")
 
-db: VectorStore = None
+def get_uploaded_files(session: str = DEFAULT_SESSION) -> list[str]:
+    return stores.get(session).uploaded_files()
 
 
-def copy_files_to_dst(files: list[str]) -> list[str]:
-    if not os.path.exists(INF_SPECIFIC_DST):
-        print(f"Making {INF_SPECIFIC_DST}")
-        os.makedirs(INF_SPECIFIC_DST)
+def get_store_version(session: str = DEFAULT_SESSION) -> int:
+    return stores.get(session).version
 
-    updated_files = []
-    for file in files:
-        if os.path.isfile(file):
-            print(f"Copy {file} to destination {INF_SPECIFIC_DST}")
-            updated_file = shutil.copy(file, INF_SPECIFIC_DST)
-            updated_files.append(updated_file)
-        else:
-            print(f"Warning: {file} does not exist or is not a file.")
 
-    return updated_files
+def perform_similarity_search(
+    query, k: int, embedding: list[float] | None = None, session: str = DEFAULT_SESSION
+) -> list[tuple["Document", float]]:
+    return stores.get(session).similarity_search(query, k, embedding=embedding)
 
 
-def add_files_to_vector_store(files: list[str]):
-    global db
+def perform_similarity_search_with_vectors(
+    query, k: int, embedding: list[float] | None = None, session: str = DEFAULT_SESSION
+) -> list[tuple["Document", float, np.ndarray]]:
+    """Like perform_similarity_search, but also returns the stored vector of each chunk."""
+    return stores.get(session).similarity_search_with_vectors(query, k, embedding=embedding)
 
-    files = copy_files_to_dst(files)
-    print(f"Adding files to vector store: {files}")
 
-    for file in files:
-        print(f"Loading file: {file}")
-        loader: TextLoader = TextLoader(file_path=file)
-        documents: list[Document] = loader.load()
+def perform_hybrid_search_with_vectors(
+    query,
+    k: int,
+    embedding: list[float] | None = None,
+    dense: bool = True,
+    session: str = DEFAULT_SESSION,
+) -> list[tuple["Document", float, np.ndarray]]:
+    """Fuses keyword (BM25) and vector search results of the store of session by reciprocal rank.
 
-        text_splitter: CharacterTextSplitter = CharacterTextSplitter(
-            chunk_size=1000, chunk_overlap=0
-        )
+    See InferenceContextStore.hybrid_search_with_vectors.
+    """
+    return stores.get(session).hybrid_search_with_vectors(
+        query, k, embedding=embedding, dense=dense
+    )
 
-        docs = text_splitter.split_documents(documents)
-        if db is not None:
-            db.add_documents(docs)
-        else:
-            db = FAISS.from_documents(docs, embeddings)
 
+def index_stats(session: str = DEFAULT_SESSION) -> dict:
+    """Index type, size, resident bytes per vector and recent search latency of a store."""
+    store = stores.peek(session)
+    return store.index_stats() if store is not None else {}
 
-def perform_similarity_search(query, k: int) -> list[tuple[Document, float]]:
-    global db
-    if db is not None:
-        results: list[tuple[Document, float]] = (
-            db.similarity_search_with_relevance_scores(query, k=4)
-        )
-    else:
-        results = []
 
-    return results
+def index_stats_markdown(session: str = DEFAULT_SESSION) -> str:
+    sessions = (
+        f"**Inference specific context sessions:** {stores.loaded_count()} loaded, "
+        f"{stores.resident_bytes() / 2**20:.1f} of {stores.budget_bytes / 2**20:.0f} MiB, "
+        f"{stores.evictions} evicted to disk\n\n"
+    )
+    stats = index_stats(session)
+    if not stats:
+        return f"{sessions}**Inference specific context index:** empty"
+    migrating = ", migrating" if stats["migrating"] else ""
+    return (
+        f"{sessions}**Inference specific context index:** {stats['factory']}{migrating}, "
+        f"{stats['vectors']} vectors ({stats['deleted']} deleted), "
+        f"{stats['bytes_per_vector']:.0f} bytes/vector, "
+        f"search p50 {stats['search_p50_ms']:.2f}ms / p95 {stats['search_p95_ms']:.2f}ms"
+    )
@@ -0,0 +1,93 @@
+"""FAISS index types of the inference specific context store, chosen by corpus size."""
+
+from dataclasses import dataclass
+import math
+
+import numpy as np
+
+# IVF training wants about this many vectors per centroid
+TRAIN_POINTS_PER_CENTROID = 39
+MAX_TRAIN_POINTS = 100_000
+ADD_BATCH_SIZE = 16_384
+# an index is only moved down a tier once the corpus shrank well below the tier threshold
+DOWNGRADE_FRACTION = 0.5
+
+
+@dataclass
+class IndexTier:
+    """
+    An index type used from min_vectors vectors on.
+
+    Args:
+        min_vectors: Smallest corpus the tier is used for.
+        factory: faiss.index_factory string. {nlist} and {pq_m} are filled in from the
+            corpus size and dimension.
+        search: faiss ParameterSpace search parameters, e.g. "nprobe=16".
+    """
+
+    min_vectors: int
+    factory: str
+    search: str = ""
+
+    def factory_for(self, n_vectors: int, dim: int) -> str:
+        nlist = max(1, min(int(4 * math.sqrt(n_vectors)), n_vectors // TRAIN_POINTS_PER_CENTROID))
+        # PQ sub-quantizers must divide the dimension, one byte per 8 dimensions
+        pq_m = max(1, dim // 8)
+        while dim % pq_m:
+            pq_m -= 1
+        return self.factory.format(nlist=nlist, pq_m=pq_m)
+
+
+def parse_tiers(config: list[dict]) -> list[IndexTier]:
+    tiers = sorted((IndexTier(**tier) for tier in config), key=lambda tier: tier.min_vectors)
+    if not tiers or tiers[0].min_vectors != 0:
+        raise ValueError("The first index tier must start at 0 vectors")
+    return tiers
+
+
+def select_tier(tiers: list[IndexTier], n_vectors: int, current: int | None = None) -> int:
+    """Index of the tier for a corpus of n_vectors.
+
+    With current given, a smaller tier is only chosen once the corpus is well below the
+    current tier's threshold, so deletions around a threshold do not cause migrations
+    back and forth.
+    """
+    wanted = max(i for i, tier in enumerate(tiers) if tier.min_vectors <= n_vectors)
+    if current is not None and wanted < current < len(tiers):
+        if n_vectors >= tiers[current].min_vectors * DOWNGRADE_FRACTION:
+            return current
+    return wanted
+
+
+def is_mmappable(factory: str) -> bool:
+    """Whether an index of this type can be memory-mapped and still accept additions."""
+    return "IVF" not in factory
+
+
+def prepare_index(index, search: str) -> None:
+    """Enables reconstruction of IVF indexes and applies search parameters."""
+    import faiss
+
+    try:
+        faiss.extract_index_ivf(index).make_direct_map()
+    except RuntimeError:
+        pass  # not an IVF index
+    if search:
+        faiss.ParameterSpace().set_index_parameters(index, search)
+
+
+def build_index(factory: str, vectors: np.ndarray, search: str = "", seed: int = 0):
+    """Builds, trains and fills an index of type factory (L2 metric) with vectors."""
+    import faiss
+
+    index = faiss.index_factory(vectors.shape[1], factory)
+    if not index.is_trained:
+        sample = vectors
+        if len(vectors) > MAX_TRAIN_POINTS:
+            rng = np.random.default_rng(seed)
+            sample = vectors[rng.choice(len(vectors), MAX_TRAIN_POINTS, replace=False)]
+        index.train(sample)
+    prepare_index(index, search)
+    for start in range(0, len(vectors), ADD_BATCH_SIZE):
+        index.add(vectors[start : start + ADD_BATCH_SIZE])
+    return index
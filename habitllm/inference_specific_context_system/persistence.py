@@ -0,0 +1,185 @@
+"""On-disk persistence for the inference specific context FAISS index."""
+
+from dataclasses import dataclass, field
+import json
+import os
+from pathlib import Path
+import pickle
+from typing import TYPE_CHECKING
+
+from ..utils import atomic_write_path
+from .index_tiers import is_mmappable, prepare_index
+
+if TYPE_CHECKING:
+    from langchain_core.embeddings import Embeddings
+    import numpy as np
+
+INDEX_FILENAME = "index.faiss"
+DOCSTORE_FILENAME = "docstore.pkl"
+MANIFEST_FILENAME = "manifest.json"
+
+
+@dataclass
+class ConsistencyReport:
+    """Differences between the files recorded with an index and an upload directory."""
+
+    unindexed: list[str] = field(default_factory=list)
+    modified: list[str] = field(default_factory=list)
+    missing: list[str] = field(default_factory=list)
+
+    @property
+    def is_consistent(self) -> bool:
+        return not (self.unindexed or self.modified or self.missing)
+
+
+def build_manifest(upload_dir: str) -> dict[str, dict[str, int]]:
+    """Describes the files in upload_dir by size and modification time.
+
+    Args:
+        upload_dir: Directory to describe.
+
+    Returns:
+        Mapping of absolute filepath to its size and mtime.
+    """
+    manifest = {}
+    if os.path.isdir(upload_dir):
+        for entry in os.scandir(upload_dir):
+            if entry.is_file():
+                stat = entry.stat()
+                manifest[os.path.abspath(entry.path)] = {
+                    "size": stat.st_size,
+                    "mtime_ns": stat.st_mtime_ns,
+                }
+    return manifest
+
+
+def check_consistency(
+    indexed: dict[str, dict[str, int]], current: dict[str, dict[str, int]]
+) -> ConsistencyReport:
+    """Compares the manifest stored with an index to the current upload directory manifest.
+
+    Args:
+        indexed: Manifest saved alongside the index.
+        current: Manifest of the upload directory now.
+
+    Returns:
+        Files that are not indexed, changed since indexing, or indexed but gone from disk.
+    """
+    report = ConsistencyReport()
+    for file, stat in current.items():
+        if file not in indexed:
+            report.unindexed.append(file)
+        elif indexed[file] != stat:
+            report.modified.append(file)
+    report.missing = [file for file in indexed if file not in current]
+    return report
+
+
+@dataclass
+class VectorStoreSnapshot:
+    """Copy of a FAISS vector store taken under the store's lock, see snapshot_vector_store."""
+
+    index: "np.ndarray"
+    ntotal: int
+    docstore: object
+    index_to_docstore_id: dict[int, str]
+
+
+def snapshot_vector_store(db) -> VectorStoreSnapshot:
+    """Copies db in memory, so it can be written to disk while db keeps serving searches.
+
+    Args:
+        db: langchain FAISS vector store to copy.
+
+    Returns:
+        The serialized index and copies of the docstore and its id mapping.
+    """
+    import faiss
+    from langchain.docstore.in_memory import InMemoryDocstore
+
+    return VectorStoreSnapshot(
+        index=faiss.serialize_index(db.index),
+        ntotal=db.index.ntotal,
+        # documents are never changed in place, so copying the mapping is enough
+        docstore=InMemoryDocstore(dict(db.docstore._dict)),
+        index_to_docstore_id=dict(db.index_to_docstore_id),
+    )
+
+
+def save_vector_store(
+    snapshot: VectorStoreSnapshot,
+    persist_dir: str,
+    manifest: dict[str, dict[str, int]],
+    index_info: dict | None = None,
+) -> None:
+    """Atomically writes the FAISS index, its docstore and the upload manifest to persist_dir.
+
+    The manifest is written last and records the index size, so a crash between writes
+    is detected as an inconsistent index on the next load.
+
+    Args:
+        snapshot: Vector store to save, see snapshot_vector_store.
+        persist_dir: Directory to save into.
+        manifest: Manifest of the files contained in the index.
+        index_info: Index tier, factory and search parameters of the index.
+    """
+    persist_path = Path(persist_dir)
+    with atomic_write_path(persist_path / INDEX_FILENAME) as tmp:
+        # serialize_index writes the same format as faiss.write_index
+        with open(tmp, "wb") as f:
+            f.write(snapshot.index.tobytes())
+    with atomic_write_path(persist_path / DOCSTORE_FILENAME) as tmp:
+        with open(tmp, "wb") as f:
+            pickle.dump((snapshot.docstore, snapshot.index_to_docstore_id), f)
+    with atomic_write_path(persist_path / MANIFEST_FILENAME) as tmp:
+        with open(tmp, "w") as f:
+            json.dump({"ntotal": snapshot.ntotal, "files": manifest, "index": index_info or {}}, f)
+
+
+def load_vector_store(
+    persist_dir: str, embedder: "Embeddings", mmap: bool = True
+) -> tuple[object, dict[str, dict[str, int]], dict] | None:
+    """Loads a FAISS vector store saved with save_vector_store.
+
+    With mmap the index is memory-mapped instead of read into RAM, so even large
+    indexes are available almost immediately. IVF indexes are always read into RAM, as
+    memory-mapped ones cannot grow.
+
+    Args:
+        persist_dir: Directory the store was saved into.
+        embedder: Embedding model used for the store.
+        mmap: Whether to memory-map the index.
+
+    Returns:
+        The vector store, the manifest of its files and the index info, or None if nothing
+        valid is saved.
+    """
+    import faiss
+    from langchain.vectorstores.faiss import FAISS
+
+    persist_path = Path(persist_dir)
+    paths = [
+        persist_path / name
+        for name in (INDEX_FILENAME, DOCSTORE_FILENAME, MANIFEST_FILENAME)
+    ]
+    if not all(path.is_file() for path in paths):
+        return None
+
+    index_path, docstore_path, manifest_path = paths
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    index_info = manifest.get("index", {})
+    flags = faiss.IO_FLAG_MMAP if mmap and is_mmappable(index_info.get("factory", "Flat")) else 0
+    index = faiss.read_index(str(index_path), flags)
+    if index.ntotal != manifest["ntotal"]:
+        print(
+            f"Warning: saved index has {index.ntotal} vectors but manifest records "
+            f"{manifest['ntotal']}. Ignoring saved index."
+        )
+        return None
+    with open(docstore_path, "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+
+    prepare_index(index, index_info.get("search", ""))
+    db = FAISS(embedder, index, docstore, index_to_docstore_id)
+    return db, manifest["files"], index_info
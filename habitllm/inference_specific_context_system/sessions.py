@@ -0,0 +1,122 @@
+"""Per-session inference specific context stores, evicted to disk under a memory budget."""
+
+from collections import OrderedDict
+import hashlib
+from pathlib import Path
+import re
+import threading
+
+from .store import InferenceContextStore
+
+DEFAULT_SESSION = "default"
+SESSION_SCOPES = ("chat", "character", "global")
+
+
+def session_key(state: dict | None, scope: str) -> str:
+    """The store a chat turn or upload belongs to.
+
+    Args:
+        state: webui state (or the subset with "character_menu" and "unique_id").
+        scope: "chat" gives every chat history its own store, "character" shares one
+            store between the chats of a character, "global" shares one store for all.
+
+    Returns:
+        Session key, DEFAULT_SESSION for the global store.
+    """
+    if scope not in SESSION_SCOPES:
+        raise ValueError(f"Unknown session scope {scope!r}, expected one of {SESSION_SCOPES}")
+    if scope == "global" or not state:
+        return DEFAULT_SESSION
+    character = state.get("character_menu") or "none"
+    if scope == "character":
+        return f"character:{character}"
+    return f"chat:{character}/{state.get('unique_id') or 'none'}"
+
+
+class SessionStores:
+    """
+    Lazily loaded InferenceContextStores, one per session key.
+
+    Stores are loaded from disk on first use. Once the loaded stores exceed the memory
+    budget, the least recently used ones are persisted and unloaded on a background
+    thread; their next use loads them again. Stores busy ingesting are not evicted.
+
+    Args:
+        root_dir: Directory holding one upload and one index directory per session.
+        default_dirs: Upload and index directory of DEFAULT_SESSION.
+        budget_bytes: Memory the loaded stores may hold together. The most recently used
+            store is never evicted, even if it alone exceeds the budget.
+    """
+
+    def __init__(self, root_dir: str, default_dirs: tuple[str, str], budget_bytes: int) -> None:
+        self.root_dir = root_dir
+        self.default_dirs = default_dirs
+        self.budget_bytes = budget_bytes
+        # every store seen so far, least recently used first
+        self._stores: OrderedDict[str, InferenceContextStore] = OrderedDict()
+        self._lock = threading.Lock()
+        self._eviction: threading.Thread | None = None
+        self.evictions = 0
+
+    def dirs(self, session: str) -> tuple[str, str]:
+        if session == DEFAULT_SESSION:
+            return self.default_dirs
+        # readable, filesystem safe and collision free
+        slug = re.sub(r"[^\w-]+", "_", session)[:48]
+        digest = hashlib.sha1(session.encode()).hexdigest()[:8]
+        session_dir = Path(self.root_dir) / f"{slug}-{digest}"
+        return str(session_dir / "upload"), str(session_dir / "index")
+
+    def get(self, session: str = DEFAULT_SESSION) -> InferenceContextStore:
+        """The loaded store of session. Others are evicted in the background if the memory
+        budget is exceeded."""
+        with self._lock:
+            store = self._stores.get(session)
+            if store is None:
+                store = InferenceContextStore(*self.dirs(session))
+                self._stores[session] = store
+            self._stores.move_to_end(session)
+        store.ensure_loaded()
+        if self.resident_bytes() > self.budget_bytes:
+            self.evict_in_background(keep=store)
+        return store
+
+    def peek(self, session: str = DEFAULT_SESSION) -> InferenceContextStore | None:
+        """The store of session if it is loaded, without loading it or updating recency."""
+        store = self._stores.get(session)
+        return store if store is not None and store.loaded else None
+
+    def evict_in_background(self, keep: InferenceContextStore | None = None) -> None:
+        """Runs evict on a daemon thread, unless an eviction is already running."""
+        with self._lock:
+            if self._eviction is not None and self._eviction.is_alive():
+                return
+            self._eviction = threading.Thread(
+                target=self.evict, args=(keep,), name="habitllm-isc-eviction", daemon=True
+            )
+            self._eviction.start()
+
+    def evict(self, keep: InferenceContextStore | None = None) -> None:
+        """Unloads least recently used stores until the loaded ones fit the budget.
+
+        Stores that are ingesting, restoring or migrating are skipped instead of waited for.
+        """
+        with self._lock:
+            loaded = [store for store in self._stores.values() if store.loaded]
+        sizes = {id(store): store.resident_bytes() for store in loaded}
+        total = sum(sizes.values())
+        for store in loaded:
+            if total <= self.budget_bytes:
+                break
+            if store is keep or store.is_migrating:
+                continue
+            if store.try_unload():
+                print(f"Evicted inference specific context store {store.index_dir} to disk")
+                total -= sizes[id(store)]
+                self.evictions += 1
+
+    def resident_bytes(self) -> int:
+        return sum(store.resident_bytes() for store in list(self._stores.values()) if store.loaded)
+
+    def loaded_count(self) -> int:
+        return sum(store.loaded for store in list(self._stores.values()))
@@ -0,0 +1,587 @@
+"""A single inference specific context store: uploaded files, their FAISS index and keyword index."""
+
+import itertools
+import os
+from pathlib import Path
+import shutil
+import tempfile
+import threading
+import time
+from typing import TYPE_CHECKING, Callable
+import uuid
+
+import numpy as np
+
+from .. import parameters
+from ..embedding_service import get_embedding_service
+from ..instrumentation import Histogram, span
+from ..ingestion import IngestionReport, embed_in_batches, load_files_parallel
+from ..retrieval import relevance_from_squared_l2
+from ..sparse_index import BM25Index, reciprocal_rank_fusion
+from .index_tiers import build_index, parse_tiers, select_tier
+from .persistence import (
+    INDEX_FILENAME,
+    build_manifest,
+    check_consistency,
+    load_vector_store,
+    save_vector_store,
+    snapshot_vector_store,
+)
+
+if TYPE_CHECKING:
+    from langchain.docstore.document import Document
+    from langchain.vectorstores import VectorStore
+
+SPARSE_INDEX_FILENAME = "bm25.pkl"
+# rebuild once this fraction of the index is deleted chunks
+TOMBSTONE_REBUILD_FRACTION = 0.25
+
+# store versions are unique across stores and reloads, so retrieval results cached for
+# a store can never be mistaken for those of a later state of it
+_versions = itertools.count(1)
+
+
+class InferenceContextStore:
+    """
+    The uploaded files of one session and the FAISS and BM25 indexes over their chunks.
+
+    Deleted chunks are dropped from the docstore and index_to_docstore_id but stay in the
+    index (not every index type supports removal) until the next rebuild; positions of
+    live chunks therefore never shift. The index type follows the corpus size, see
+    index_tiers; moving to another tier happens on a background thread.
+
+    Args:
+        upload_dir: Directory uploaded files are copied to.
+        index_dir: Directory the indexes are persisted in.
+    """
+
+    def __init__(self, upload_dir: str, index_dir: str) -> None:
+        self.upload_dir = upload_dir
+        self.index_dir = index_dir
+        self.db: "VectorStore" = None
+        # keyword index over the chunks in db, keyed by docstore id
+        self.sparse_index = BM25Index()
+        # manifest of the uploaded files currently held in db
+        self.indexed_files: dict[str, dict[str, int]] = {}
+        # bumped whenever the contents of db change, invalidates cached retrieval results
+        self.version = next(_versions)
+        # version last written to (or loaded from) index_dir
+        self._saved_version: int | None = None
+        # tier, factory and search parameters of db.index, see index_tiers
+        self.index_info: dict = {"tier": 0, "factory": "Flat", "search": ""}
+        self.search_latency = Histogram()
+        # whether the persisted indexes were loaded (or there were none), see restore/unload
+        self.loaded = False
+        # held by ingestion, so a store is not unloaded halfway through adding files
+        self._ingest_lock = threading.RLock()
+        # guards db against concurrent search, ingest and the swap at the end of a migration
+        self._lock = threading.RLock()
+        # serializes writes of the persisted indexes, which happen without _lock
+        self._persist_lock = threading.Lock()
+        self._migration: threading.Thread | None = None
+        # store version for which _docstore_positions was built
+        self._positions_version = -1
+        self._docstore_positions: dict[str, int] = {}
+
+    def _bump_version(self) -> None:
+        self.version = next(_versions)
+
+    # ---------------- Ingestion ----------------
+
+    def copy_file_to_dst(self, file: str, dst: str | None = None) -> str | None:
+        """Copies file to dst (the upload directory by default), unless it is already uploaded."""
+        if os.path.dirname(os.path.abspath(file)) == self.upload_dir:
+            # already uploaded (e.g. re-ingesting after a restart)
+            return file if os.path.isfile(file) else None
+        if os.path.isfile(file):
+            dst = dst or self.upload_dir
+            print(f"Copy {file} to destination {dst}")
+            return shutil.copy(file, dst)
+        print(f"Warning: {file} does not exist or is not a file.")
+        return None
+
+    def uploaded_files(self) -> list[str]:
+        return [str(file) for file in Path(self.upload_dir).glob("**/*") if file.is_file()]
+
+    def add_files(
+        self, files: list[str], progress: Callable[[int, int, int], None] | None = None
+    ) -> IngestionReport:
+        """Copies, loads, splits and embeds files into the store.
+
+        Files are copied/loaded/split on a thread pool, chunks from all files are embedded in
+        fixed size batches and the FAISS index receives a single bulk add. If the store grew
+        into another index tier, it is migrated in the background.
+
+        Args:
+            files: Filepaths to add.
+            progress: Called with (files loaded, chunks embedded, chunks in total) after
+                every file and embedding batch. If it raises, the ingestion stops before
+                the index or the upload directory are changed.
+
+        Returns:
+            Throughput report of the ingestion.
+        """
+        with self._ingest_lock:
+            self.ensure_loaded()
+            return self._add_files(files, progress)
+
+    def _add_files(
+        self, files: list[str], progress: Callable[[int, int, int], None] | None = None
+    ) -> IngestionReport:
+        os.makedirs(self.upload_dir, exist_ok=True)
+        # new uploads are copied next to upload_dir and only moved into it once embedding
+        # finished, so an aborted ingestion leaves neither chunks nor files behind that
+        # restore() or the persistent context ingestion would pick up
+        staging_dir = tempfile.mkdtemp(prefix=".staging-", dir=os.path.dirname(self.upload_dir))
+        try:
+            return self._add_staged_files(files, staging_dir, progress or _no_progress)
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+    def _add_staged_files(
+        self, files: list[str], staging_dir: str, progress: Callable[[int, int, int], None]
+    ) -> IngestionReport:
+        start = time.perf_counter()
+        files, docs = load_files_parallel(
+            files,
+            prepare=lambda file: self.copy_file_to_dst(file, staging_dir),
+            workers=parameters.get_ingestion_workers(),
+            on_file=lambda done: progress(done, 0, 0),
+        )
+        print(f"Adding files to vector store: {files}")
+
+        if docs:
+            embedder = get_embedding_service()
+            texts = [doc.page_content for doc in docs]
+            metadatas = [doc.metadata for doc in docs]
+            progress(len(files), 0, len(docs))
+            vectors = embed_in_batches(
+                texts,
+                embedder,
+                batch_size=parameters.get_embedding_batch_size(),
+                on_batch=lambda done: progress(len(files), done, len(docs)),
+            )
+
+        # commit: move staged files into upload_dir and record them as their source there
+        uploaded = {}
+        for file in files:
+            if os.path.dirname(file) == staging_dir:
+                uploaded[file] = os.path.join(self.upload_dir, os.path.basename(file))
+                os.replace(file, uploaded[file])
+        files = [uploaded.get(file, file) for file in files]
+        for doc in docs:
+            doc.metadata["source"] = uploaded.get(doc.metadata["source"], doc.metadata["source"])
+
+        # re-uploaded files replace their previous chunks
+        self._delete_sources([file for file in files if os.path.abspath(file) in self.indexed_files])
+
+        if docs:
+            with span("isc_index_add"):
+                ids = self._add_embeddings(texts, np.asarray(vectors, dtype=np.float32), metadatas)
+            with span("isc_sparse_add"):
+                self.sparse_index.add_many(list(zip(ids, texts)))
+            self._bump_version()
+
+        manifest = build_manifest(self.upload_dir)
+        for file in files:
+            file = os.path.abspath(file)
+            if file in manifest:
+                self.indexed_files[file] = manifest[file]
+        self.persist()
+        self._maybe_migrate()
+
+        report = IngestionReport(
+            files=len(files), chunks=len(docs), seconds=time.perf_counter() - start
+        )
+        print(report)
+        return report
+
+    def _add_embeddings(
+        self, texts: list[str], vectors: np.ndarray, metadatas: list[dict]
+    ) -> list[str]:
+        """Appends chunks to db, creating it (flat) if needed. Returns their docstore ids."""
+        from langchain.docstore.document import Document
+
+        ids = [str(uuid.uuid4()) for _ in texts]
+        with self._lock:
+            if self.db is None:
+                from langchain.docstore.in_memory import InMemoryDocstore
+                from langchain.vectorstores.faiss import FAISS
+
+                index = build_index(
+                    self.index_info["factory"], vectors[:0], self.index_info["search"]
+                )
+                self.db = FAISS(get_embedding_service(), index, InMemoryDocstore(), {})
+            db = self.db
+            start = db.index.ntotal
+            db.index.add(vectors)
+            db.docstore.add(
+                {
+                    doc_id: Document(page_content=text, metadata=metadata)
+                    for doc_id, text, metadata in zip(ids, texts, metadatas)
+                }
+            )
+            db.index_to_docstore_id.update({start + i: doc_id for i, doc_id in enumerate(ids)})
+        return ids
+
+    def restore(self) -> None:
+        """Loads the persisted index (memory-mapped) and reconciles it with the upload directory.
+
+        Uploaded files that are not indexed or changed since indexing are (re-)ingested, and
+        chunks of files that no longer exist are removed.
+        """
+        with self._ingest_lock:
+            self._restore()
+            # only now, so concurrent callers wait in ensure_loaded instead of searching
+            # a store that is still empty
+            self.loaded = True
+
+    def ensure_loaded(self) -> None:
+        if not self.loaded:
+            with self._ingest_lock:
+                if not self.loaded:
+                    self.restore()
+
+    def _restore(self) -> None:
+        loaded = load_vector_store(self.index_dir, get_embedding_service())
+        if loaded is not None:
+            with self._lock:
+                self.db, self.indexed_files, saved_index_info = loaded
+                self.index_info = {**self.index_info, **saved_index_info}
+            self.sparse_index = self._load_sparse_index()
+            self._bump_version()
+            self._saved_version = self.version
+            print(
+                f"Loaded inference specific context index ({self.index_info['factory']}) "
+                f"with {len(self.db.index_to_docstore_id)} vectors from {self.index_dir}"
+            )
+
+        report = check_consistency(self.indexed_files, build_manifest(self.upload_dir))
+        if report.is_consistent:
+            self._maybe_migrate()
+            return
+
+        print(
+            f"Inference specific context index out of sync with {self.upload_dir}: "
+            f"{len(report.unindexed)} unindexed, {len(report.modified)} modified, "
+            f"{len(report.missing)} missing files"
+        )
+        if report.missing:
+            self._delete_sources(report.missing)
+            self.persist()
+        if report.unindexed or report.modified:
+            self._add_files(report.unindexed + report.modified)
+        else:
+            self._maybe_migrate()
+
+    def _delete_sources(self, sources: list[str]) -> None:
+        """Removes the chunks of sources from db and the manifest."""
+        if not sources:
+            return
+        sources = {os.path.abspath(source) for source in sources}
+        for source in sources:
+            self.indexed_files.pop(source, None)
+        if self.db is None:
+            return
+
+        with self._lock:
+            db = self.db
+            positions = [
+                position
+                for position, doc_id in db.index_to_docstore_id.items()
+                if db.docstore.search(doc_id).metadata.get("source") in sources
+            ]
+            ids = [db.index_to_docstore_id.pop(position) for position in positions]
+            if ids:
+                db.docstore.delete(ids)
+        if ids:
+            self.sparse_index.remove(ids)
+            self._bump_version()
+
+    def persist(self) -> None:
+        """Writes the indexes to disk. Searches only wait while they are copied in memory."""
+        with span("isc_persist"), self._persist_lock:
+            with self._lock:
+                if self.db is None:
+                    return
+                version = self.version
+                snapshot = snapshot_vector_store(self.db)
+                indexed_files = dict(self.indexed_files)
+                index_info = dict(self.index_info)
+                sparse_index = self.sparse_index
+            sparse_index.save(Path(self.index_dir) / SPARSE_INDEX_FILENAME)
+            save_vector_store(snapshot, self.index_dir, indexed_files, index_info)
+            self._saved_version = version
+
+    def unload(self) -> None:
+        """Persists the store if it changed and drops its indexes from memory; restore loads them again."""
+        with self._ingest_lock:
+            self.wait_for_migration()
+            if self.version != self._saved_version:
+                self.persist()
+            with self._lock:
+                self.loaded = False
+                self.db = None
+                self.sparse_index = BM25Index()
+                self.indexed_files = {}
+                self.index_info = {"tier": 0, "factory": "Flat", "search": ""}
+                self._docstore_positions = {}
+                self._bump_version()
+                self._saved_version = None
+
+    def try_unload(self) -> bool:
+        """Like unload, but gives up at once if the store is being ingested into or restored.
+
+        Returns:
+            Whether the store was unloaded.
+        """
+        if not self._ingest_lock.acquire(blocking=False):
+            return False
+        try:
+            self.unload()
+        finally:
+            self._ingest_lock.release()
+        return True
+
+    def _load_sparse_index(self) -> BM25Index:
+        """Loads the saved keyword index, rebuilding it from the docstore if it does not match db."""
+        index = BM25Index.load(Path(self.index_dir) / SPARSE_INDEX_FILENAME)
+        if index is not None and len(index) == len(self.db.index_to_docstore_id):
+            return index
+        print("Rebuilding inference specific context keyword index")
+        index = BM25Index()
+        index.add_many(
+            [
+                (doc_id, self.db.docstore.search(doc_id).page_content)
+                for doc_id in self.db.index_to_docstore_id.values()
+            ]
+        )
+        return index
+
+    # ---------------- Index tiers ----------------
+
+    @property
+    def is_migrating(self) -> bool:
+        return self._migration is not None and self._migration.is_alive()
+
+    def wait_for_migration(self) -> None:
+        if self._migration is not None:
+            self._migration.join()
+
+    def _maybe_migrate(self) -> None:
+        """Starts a background rebuild if the store outgrew its index tier or is mostly deletions."""
+        if self.db is None or self.is_migrating:
+            return
+        tiers = parse_tiers(parameters.get_isc_index_tiers())
+        index = self.db.index
+        live = len(self.db.index_to_docstore_id)
+        tier = select_tier(tiers, live, current=self.index_info["tier"])
+        tombstones = index.ntotal - live
+        if (
+            tier == self.index_info["tier"]
+            and tombstones <= TOMBSTONE_REBUILD_FRACTION * index.ntotal
+        ):
+            return
+        self._migration = threading.Thread(
+            target=self._migrate, args=(tiers, tier), name="habitllm-isc-migration", daemon=True
+        )
+        self._migration.start()
+
+    def _migrate(self, tiers, tier: int) -> None:
+        """Rebuilds db.index as the given tier without blocking searches or ingestion.
+
+        The new index is built from a snapshot of the live vectors; chunks added while it
+        builds are copied over and chunks deleted meanwhile are dropped before the swap.
+        """
+        try:
+            start = time.perf_counter()
+            # ingestion may grow (and reallocate) the index, so it is only read under _lock
+            with self._lock:
+                db = self.db
+                index = db.index
+                snapshot = sorted(db.index_to_docstore_id.items())
+                snapshot_total = index.ntotal
+                vectors = _reconstruct(index, [position for position, _ in snapshot], index.d)
+            factory = tiers[tier].factory_for(len(snapshot), index.d)
+            print(
+                f"Migrating inference specific context index to {factory} ({len(snapshot)} vectors)"
+            )
+            new_index = build_index(factory, vectors, tiers[tier].search)
+
+            with self._lock:
+                if self.db is not db or db.index is not index:
+                    return  # store was replaced (e.g. restored) while building
+                new_mapping = {}
+                for new_position, (position, doc_id) in enumerate(snapshot):
+                    if db.index_to_docstore_id.get(position) == doc_id:
+                        new_mapping[new_position] = doc_id
+                added = [
+                    (position, doc_id)
+                    for position, doc_id in sorted(db.index_to_docstore_id.items())
+                    if position >= snapshot_total
+                ]
+                if added:
+                    new_index.add(_reconstruct(index, [position for position, _ in added], index.d))
+                    for i, (_, doc_id) in enumerate(added):
+                        new_mapping[len(snapshot) + i] = doc_id
+                db.index = new_index
+                db.index_to_docstore_id = new_mapping
+                self.index_info = {"tier": tier, "factory": factory, "search": tiers[tier].search}
+                self._bump_version()
+            self.persist()
+            print(
+                f"Migrated inference specific context index to {factory} "
+                f"in {time.perf_counter() - start:.1f}s"
+            )
+        except Exception as e:
+            print(f"Warning: inference specific context index migration failed: {e}")
+
+    # ---------------- Stats ----------------
+
+    def resident_bytes(self) -> int:
+        """Approximate memory held by the loaded indexes and chunk texts."""
+        if self.db is None:
+            return 0
+        index_path = Path(self.index_dir) / INDEX_FILENAME
+        if index_path.is_file():
+            index_bytes = index_path.stat().st_size
+        else:
+            index_bytes = self.db.index.ntotal * self.db.index.d * 4
+        # chunk texts are about as large as their source files
+        text_bytes = sum(stat["size"] for stat in self.indexed_files.values())
+        return index_bytes + 2 * text_bytes
+
+    def index_stats(self) -> dict:
+        """Index type, size, resident bytes per vector and recent search latency of the store."""
+        if self.db is None:
+            return {}
+        index = self.db.index
+        live = len(self.db.index_to_docstore_id)
+        index_path = Path(self.index_dir) / INDEX_FILENAME
+        index_bytes = index_path.stat().st_size if index_path.is_file() else 0
+        p50, p95, _ = self.search_latency.percentiles()
+        return {
+            "factory": self.index_info["factory"],
+            "vectors": live,
+            "deleted": index.ntotal - live,
+            "bytes_per_vector": index_bytes / index.ntotal if index.ntotal else 0.0,
+            "search_p50_ms": p50 * 1000,
+            "search_p95_ms": p95 * 1000,
+            "migrating": self.is_migrating,
+        }
+
+    # ---------------- Search ----------------
+
+    def _dense_search(self, embedding: list[float], k: int) -> list[tuple[int, float]]:
+        """Positions and distances of the k nearest live chunks. Callers hold _lock."""
+        db = self.db
+        start = time.perf_counter()
+        tombstones = db.index.ntotal - len(db.index_to_docstore_id)
+        # over-fetch so deleted chunks still in the index do not crowd out live ones
+        fetch = k + min(tombstones, 3 * k)
+        distances, indices = db.index.search(np.asarray([embedding], dtype=np.float32), fetch)
+        self.search_latency.observe(time.perf_counter() - start)
+        return [
+            (int(i), float(distance))
+            for distance, i in zip(distances[0], indices[0])
+            if i != -1 and int(i) in db.index_to_docstore_id
+        ][:k]
+
+    def _position_of(self, doc_id: str) -> int | None:
+        """Index position of the chunk with docstore id doc_id. Callers hold _lock."""
+        if self._positions_version != self.version:
+            self._docstore_positions = {v: k for k, v in self.db.index_to_docstore_id.items()}
+            self._positions_version = self.version
+        return self._docstore_positions.get(doc_id)
+
+    def similarity_search(
+        self, query, k: int, embedding: list[float] | None = None
+    ) -> list[tuple["Document", float]]:
+        if self.db is None:
+            return []
+        if embedding is None:
+            embedding = get_embedding_service().embed_query(query)
+        with self._lock:
+            db = self.db
+            if db is None:
+                return []  # unloaded meanwhile
+            return [
+                (
+                    db.docstore.search(db.index_to_docstore_id[position]),
+                    relevance_from_squared_l2(distance),
+                )
+                for position, distance in self._dense_search(embedding, k)
+            ]
+
+    def similarity_search_with_vectors(
+        self, query, k: int, embedding: list[float] | None = None
+    ) -> list[tuple["Document", float, np.ndarray]]:
+        """Like similarity_search, but also returns the stored vector of each chunk."""
+        if self.db is None:
+            return []
+        if embedding is None:
+            embedding = get_embedding_service().embed_query(query)
+
+        with self._lock:
+            db = self.db
+            if db is None:
+                return []  # unloaded meanwhile
+            return [
+                (
+                    db.docstore.search(db.index_to_docstore_id[position]),
+                    relevance_from_squared_l2(distance),
+                    db.index.reconstruct(position),
+                )
+                for position, distance in self._dense_search(embedding, k)
+            ]
+
+    def hybrid_search_with_vectors(
+        self, query, k: int, embedding: list[float] | None = None, dense: bool = True
+    ) -> list[tuple["Document", float, np.ndarray]]:
+        """Fuses keyword (BM25) and vector search results by reciprocal rank.
+
+        Args:
+            query: User query.
+            k: Number of results.
+            embedding: Query embedding, computed if needed and not given.
+            dense: Whether to run the vector search. Without it, only keyword matches are
+                returned (and no query embedding is computed), unless there are none.
+
+        Returns:
+            (chunk, fused score, stored vector) triples, best first.
+        """
+        if self.db is None:
+            return []
+        with span("isc_sparse_search"):
+            sparse_ids = [doc_id for doc_id, _ in self.sparse_index.search(query, k)]
+        if (dense or not sparse_ids) and embedding is None:
+            embedding = get_embedding_service().embed_query(query)
+
+        results = []
+        with self._lock:
+            db = self.db
+            if db is None:
+                return []  # unloaded meanwhile
+            dense_ids = []
+            if dense or not sparse_ids:
+                dense_ids = [
+                    db.index_to_docstore_id[position]
+                    for position, _ in self._dense_search(embedding, k)
+                ]
+            for doc_id, score in reciprocal_rank_fusion(dense_ids, sparse_ids)[:k]:
+                position = self._position_of(doc_id)
+                if position is None:
+                    continue  # deleted since the keyword search
+                results.append((db.docstore.search(doc_id), score, db.index.reconstruct(position)))
+        return results
+
+
+def _no_progress(files_done: int, chunks_done: int, chunks_total: int) -> None:
+    pass
+
+
+def _reconstruct(index, positions: list[int], dim: int) -> np.ndarray:
+    """Copies the vectors at positions out of index. Callers hold the store's _lock."""
+    if not positions:
+        return np.empty((0, dim), dtype=np.float32)
+    return np.asarray(index.reconstruct_batch(np.asarray(positions, dtype=np.int64)), dtype=np.float32)
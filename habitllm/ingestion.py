@@ -0,0 +1,126 @@
+"""Batched, parallel ingestion pipeline shared by the context systems."""
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Callable, Iterator
+
+from .chunker import get_chunker
+from .instrumentation import span
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+    from langchain_core.embeddings import Embeddings
+
+
+@dataclass
+class IngestionReport:
+    """Throughput summary of an ingestion run."""
+
+    files: int = 0
+    chunks: int = 0
+    seconds: float = 0.0
+
+    @property
+    def files_per_sec(self) -> float:
+        return self.files / self.seconds if self.seconds > 0 else 0.0
+
+    @property
+    def chunks_per_sec(self) -> float:
+        return self.chunks / self.seconds if self.seconds > 0 else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"Ingested {self.files} files ({self.chunks} chunks) in {self.seconds:.2f}s: "
+            f"{self.files_per_sec:.2f} files/sec, {self.chunks_per_sec:.2f} chunks/sec"
+        )
+
+
+def iter_file_chunks(file: str) -> Iterator["Document"]:
+    """Streams the token-sized chunks of a text file with bounded memory.
+
+    Args:
+        file: Filepath to chunk.
+
+    Yields:
+        The chunks of the file, with their character offsets as metadata.
+    """
+    return get_chunker().split_file(file)
+
+
+def load_and_split_file(file: str) -> list["Document"]:
+    """Loads a text file and splits it into chunks.
+
+    Args:
+        file: Filepath to load.
+
+    Returns:
+        The chunks of the file.
+    """
+    return list(iter_file_chunks(file))
+
+
+def load_files_parallel(
+    files: list[str],
+    prepare: Callable[[str], str | None] | None = None,
+    workers: int = 4,
+    on_file: Callable[[int], None] | None = None,
+) -> tuple[list[str], list["Document"]]:
+    """Runs the copy/load/split stage of the pipeline on a thread pool.
+
+    Args:
+        files: Filepaths to ingest.
+        prepare: Optional per file step run before loading (e.g. copying the file to an upload dir).
+            Returns the path to load, or None to skip the file.
+        workers: Number of worker threads.
+        on_file: Called with the number of files processed so far after each file.
+
+    Returns:
+        The loaded filepaths and their chunks, in input order.
+    """
+
+    def _process(file: str) -> tuple[str | None, list["Document"]]:
+        if prepare is not None:
+            file = prepare(file)
+            if file is None:
+                return None, []
+        return file, load_and_split_file(file)
+
+    loaded_files: list[str] = []
+    docs: list["Document"] = []
+    with span("ingest_load_split"), ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for done, (file, file_docs) in enumerate(pool.map(_process, files), 1):
+            if file is not None:
+                loaded_files.append(file)
+                docs.extend(file_docs)
+            if on_file is not None:
+                on_file(done)
+    return loaded_files, docs
+
+
+def embed_in_batches(
+    texts: list[str],
+    embedder: "Embeddings",
+    batch_size: int = 64,
+    on_batch: Callable[[int], None] | None = None,
+) -> list[list[float]]:
+    """Embeds texts in fixed size batches, independent of which file they came from.
+
+    Args:
+        texts: Texts to embed.
+        embedder: Embedding model.
+        batch_size: Number of texts per call to the embedder.
+        on_batch: Called with the number of texts embedded so far after each batch. It may
+            raise to abort the remaining batches.
+
+    Returns:
+        One embedding per text.
+    """
+    batch_size = max(1, batch_size)
+    vectors: list[list[float]] = []
+    for start in range(0, len(texts), batch_size):
+        with span("ingest_embed_batch"):
+            vectors.extend(embedder.embed_documents(texts[start : start + batch_size]))
+        if on_batch is not None:
+            on_batch(len(vectors))
+    return vectors
+
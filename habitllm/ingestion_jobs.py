@@ -0,0 +1,228 @@
+"""Background ingestion jobs: a bounded queue, progress with ETA, cancellation and generation priority."""
+
+from collections import deque
+from dataclasses import dataclass, field
+import logging
+import queue
+import threading
+import time
+from typing import Callable
+import uuid
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+# how often a job paused for a running generation checks whether it may continue
+BACKOFF_POLL_SECONDS = 0.05
+# share of an ingestion's time spent copying, loading and splitting files, see IngestionJob.progress
+LOAD_SHARE = 0.1
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue already holds its maximum."""
+
+
+class IngestionCancelled(Exception):
+    """Raised inside a running job at its next checkpoint after it was cancelled."""
+
+
+def format_eta(seconds: float | None) -> str:
+    if seconds is None:
+        return "estimating"
+    if seconds < 60:
+        return f"{seconds:.0f}s"
+    return f"{seconds // 60:.0f}m {seconds % 60:02.0f}s"
+
+
+@dataclass
+class IngestionJob:
+    """An ingestion of files into the store of a session, and its progress."""
+
+    files: list[str]
+    session: str
+    id: str = field(default_factory=lambda: uuid.uuid4().hex[:12])
+    status: str = QUEUED
+    files_done: int = 0
+    chunks_done: int = 0
+    chunks_total: int = 0
+    queued: float = field(default_factory=time.time)
+    started: float | None = None
+    finished: float | None = None
+    # time spent waiting for generations, not counted towards the ETA
+    backoff_seconds: float = 0.0
+    message: str = ""
+    cancel_event: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    @property
+    def progress(self) -> float:
+        """Fraction done, with loading weighted by its small share of the time next to embedding."""
+        if self.status == DONE:
+            return 1.0
+        loaded = self.files_done / len(self.files) if self.files else 1.0
+        embedded = self.chunks_done / self.chunks_total if self.chunks_total else 0.0
+        return LOAD_SHARE * loaded + (1 - LOAD_SHARE) * embedded
+
+    def eta_seconds(self) -> float | None:
+        """Remaining seconds at the rate so far, None until there is a rate to go by."""
+        if self.started is None or self.status in FINISHED:
+            return None
+        working = time.time() - self.started - self.backoff_seconds
+        progress = self.progress
+        if progress <= 0 or working <= 0:
+            return None
+        return working * (1 - progress) / progress
+
+    def describe(self) -> str:
+        line = f"- ingest `{self.id}`: {self.status}"
+        if self.status == RUNNING:
+            chunks = f"{self.chunks_done}/{self.chunks_total}" if self.chunks_total else "0"
+            line += (
+                f" {self.progress:.0%}, {self.files_done}/{len(self.files)} files, "
+                f"{chunks} chunks embedded, ETA {format_eta(self.eta_seconds())}"
+            )
+        elif self.status == QUEUED:
+            line += f", {len(self.files)} files"
+        if self.message:
+            line += f" - {self.message}"
+        return line
+
+
+class IngestionQueue:
+    """
+    Runs ingestion jobs one at a time on a background thread.
+
+    Submitting returns at once, so uploads no longer block a Gradio worker while they
+    are embedded. At most max_pending jobs wait at a time; beyond that submit raises
+    QueueFullError instead of queueing unbounded work.
+
+    Running jobs call checkpoint() between units of work (files, embedding batches).
+    It raises IngestionCancelled once the job was cancelled and waits while is_busy()
+    is true, so embedding backs off while a generation is running.
+
+    Args:
+        run: Performs a job, updating its progress and calling checkpoint(job) along the
+            way. Returns a message to show with the finished job.
+        max_pending: Jobs that may wait behind the running one.
+        is_busy: Whether higher priority work (generation) is running right now.
+        history: Finished jobs kept for the status display.
+    """
+
+    def __init__(
+        self,
+        run: Callable[[IngestionJob], str],
+        max_pending: int,
+        is_busy: Callable[[], bool] = lambda: False,
+        history: int = 20,
+    ) -> None:
+        self.run = run
+        self.is_busy = is_busy
+        self._queue: queue.Queue[IngestionJob] = queue.Queue(maxsize=max(1, max_pending))
+        self._jobs: dict[str, IngestionJob] = {}
+        self._finished: deque[str] = deque()
+        self._history = history
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    def submit(self, files: list[str], session: str) -> IngestionJob:
+        """Queues the ingestion of files into the store of session.
+
+        Raises:
+            QueueFullError: max_pending jobs are already waiting.
+        """
+        job = IngestionJob(files=list(files), session=session)
+        with self._lock:
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                raise QueueFullError(
+                    f"{self._queue.maxsize} ingestion jobs are already waiting, try again later"
+                ) from None
+            self._jobs[job.id] = job
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._work, name="habitllm-ingestion", daemon=True
+                )
+                self._thread.start()
+        return job
+
+    def get(self, job_id: str) -> IngestionJob | None:
+        return self._jobs.get(job_id)
+
+    def jobs(self, session: str | None = None) -> list[IngestionJob]:
+        """Jobs still known, oldest first, only those of session if given."""
+        jobs = sorted(list(self._jobs.values()), key=lambda job: job.queued)
+        return [job for job in jobs if session is None or job.session == session]
+
+    def cancel(self, job_id: str | None = None, session: str | None = None) -> int:
+        """Cancels job_id, or every unfinished job (of session, if given).
+
+        Queued jobs are dropped when their turn comes, the running job stops at its next
+        checkpoint without changing the store.
+
+        Returns:
+            Number of jobs cancelled.
+        """
+        cancelled = 0
+        for job in self.jobs(session):
+            if job.status in FINISHED or job_id not in (None, job.id):
+                continue
+            job.cancel_event.set()
+            cancelled += 1
+        return cancelled
+
+    def checkpoint(self, job: IngestionJob) -> None:
+        """Called by a running job between units of work, see the class docstring."""
+        if job.cancel_event.is_set():
+            raise IngestionCancelled(job.id)
+        if self.is_busy():
+            start = time.time()
+            while self.is_busy() and not job.cancel_event.is_set():
+                time.sleep(BACKOFF_POLL_SECONDS)
+            job.backoff_seconds += time.time() - start
+            if job.cancel_event.is_set():
+                raise IngestionCancelled(job.id)
+
+    def _work(self) -> None:
+        while True:
+            try:
+                job = self._queue.get(timeout=1.0)
+            except queue.Empty:
+                with self._lock:
+                    # submit() starts a new thread once this one is gone
+                    if self._queue.empty():
+                        self._thread = None
+                        return
+                continue
+            self._run_job(job)
+
+    def _run_job(self, job: IngestionJob) -> None:
+        job.started = time.time()
+        try:
+            job.status = RUNNING
+            self.checkpoint(job)
+            job.message = self.run(job) or ""
+            job.status = DONE
+        except IngestionCancelled:
+            job.status = CANCELLED
+            job.message = "cancelled, the store was not changed"
+        except Exception as e:
+            logger.exception(f"Ingestion job {job.id} failed.")
+            job.status = FAILED
+            job.message = str(e) or type(e).__name__
+        job.finished = time.time()
+        with self._lock:
+            self._finished.append(job.id)
+            while len(self._finished) > self._history:
+                self._jobs.pop(self._finished.popleft(), None)
+
+    def status_markdown(self, session: str | None = None, limit: int = 10) -> str:
+        jobs = self.jobs(session)[-limit:]
+        if not jobs:
+            return "**Ingestion jobs:** none"
+        return "\n".join(["**Ingestion jobs:**"] + [job.describe() for job in jobs])
@@ -0,0 +1,131 @@
+"""Lightweight latency instrumentation for the chat and ingestion paths."""
+
+from bisect import bisect_left
+from collections import deque
+from contextlib import nullcontext
+import threading
+import time
+
+import numpy as np
+
+# upper bounds of the histogram buckets, in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+WINDOW_SIZE = 1024
+
+_NOOP = nullcontext()
+_enabled = False
+
+
+class Histogram:
+    """
+    Latency histogram of a stage.
+
+    Keeps cumulative bucket counts for Prometheus export and a rolling window of
+    the most recent samples for percentiles.
+    """
+
+    def __init__(self) -> None:
+        self.bucket_counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.window: deque[float] = deque(maxlen=WINDOW_SIZE)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self.bucket_counts[bisect_left(BUCKETS, seconds)] += 1
+            self.count += 1
+            self.sum += seconds
+            self.window.append(seconds)
+
+    def percentiles(self, qs=(50, 95, 99)) -> list[float]:
+        """Percentiles, in seconds, of the samples in the rolling window."""
+        with self._lock:
+            samples = list(self.window)
+        if not samples:
+            return [0.0] * len(qs)
+        return [float(p) for p in np.percentile(samples, qs)]
+
+
+histograms: dict[str, Histogram] = {}
+_histograms_lock = threading.Lock()
+
+
+class _Span:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+    def __enter__(self) -> "_Span":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        observe(self.name, time.perf_counter() - self.start)
+
+
+def span(name: str):
+    """Context manager timing the enclosed block as stage name.
+
+    When instrumentation is disabled this returns a shared no-op context, so the
+    cost is a function call and a flag check.
+    """
+    if not _enabled:
+        return _NOOP
+    return _Span(name)
+
+
+def observe(name: str, seconds: float) -> None:
+    """Records a latency sample for stage name."""
+    histogram = histograms.get(name)
+    if histogram is None:
+        with _histograms_lock:
+            histogram = histograms.setdefault(name, Histogram())
+    histogram.observe(seconds)
+
+
+def set_enabled(enabled: bool) -> None:
+    global _enabled
+    _enabled = enabled
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def reset() -> None:
+    with _histograms_lock:
+        histograms.clear()
+
+
+def export_prometheus() -> str:
+    """Renders all stage histograms in the Prometheus text exposition format."""
+    metric = "habitllm_stage_duration_seconds"
+    lines = [
+        f"# HELP {metric} Latency of habitllm chat and ingestion stages.",
+        f"# TYPE {metric} histogram",
+    ]
+    for name, histogram in sorted(histograms.items()):
+        with histogram._lock:
+            counts = list(histogram.bucket_counts)
+            total, count = histogram.sum, histogram.count
+        cumulative = 0
+        for bound, bucket_count in zip(BUCKETS, counts):
+            cumulative += bucket_count
+            lines.append(f'{metric}_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+        lines.append(f'{metric}_bucket{{stage="{name}",le="+Inf"}} {count}')
+        lines.append(f'{metric}_sum{{stage="{name}"}} {total}')
+        lines.append(f'{metric}_count{{stage="{name}"}} {count}')
+    return "\n".join(lines) + "\n"
+
+
+def summary_markdown() -> str:
+    """Markdown table of recent p50/p95/p99 latency per stage."""
+    if not histograms:
+        return "No stage timings recorded." if _enabled else "Instrumentation is disabled."
+    lines = ["| stage | count | p50 ms | p95 ms | p99 ms |", "|---|---|---|---|---|"]
+    for name, histogram in sorted(histograms.items()):
+        p50, p95, p99 = (p * 1000 for p in histogram.percentiles())
+        lines.append(f"| {name} | {histogram.count} | {p50:.1f} | {p95:.1f} | {p99:.1f} |")
+    return "\n".join(lines)
@@ -0,0 +1,16 @@
+"""
+Interaction Memory Module.
+HabitLLM.
+
+"""
+
+from .interaction_memory import *
+
+__all__ = [
+    "INTERACTION_LOG_DIR",
+    "Interaction",
+    "InteractionLog",
+    "mark_ingested",
+    "read_segment",
+    "write_transcript",
+]
@@ -0,0 +1,171 @@
+from dataclasses import asdict, dataclass, field
+import json
+import logging
+import os
+from pathlib import Path
+import queue
+import threading
+import time
+from typing import Iterator
+
+INTERACTION_LOG_DIR = str(Path("cache/interaction_memory/").resolve())
+ACTIVE_SEGMENT = "interactions.jsonl"
+SEGMENT_PATTERN = "interactions-*.jsonl"
+# sealed segments are moved here once stored in the model persistent context
+INGESTED_DIR = "ingested"
+
+_ROTATE = object()
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Interaction:
+    """A chat turn: what the user asked, the context it was given and what the model answered."""
+
+    user_input: str
+    output: str = ""
+    # {"store": ..., "id": ...} of each chunk placed in the prompt
+    retrieved: list[dict[str, str]] = field(default_factory=list)
+    # seconds spent per stage of the turn
+    timings: dict[str, float] = field(default_factory=dict)
+    timestamp: float = field(default_factory=time.time)
+
+    def to_transcript(self) -> str:
+        return f"User: {self.user_input}\nAssistant: {self.output}"
+
+
+class InteractionLog:
+    """
+    Append-only JSON lines log of chat turns.
+
+    record() only enqueues; a background thread appends turns to the active segment
+    through a buffered file, flushing once it caught up with the queue (or every
+    flush_interval seconds while it has not). Once the active segment exceeds max_bytes
+    it is sealed (renamed with a timestamp) and a new one is started. Sealed segments
+    are immutable and are consumed by the routine worker.
+
+    Args:
+        log_dir: Directory holding the segments.
+        max_bytes: Size at which the active segment is sealed.
+        flush_interval: Longest time between flushes of the write buffer under load.
+        max_pending: Turns that may wait for the writer before new ones are dropped.
+    """
+
+    def __init__(
+        self,
+        log_dir: str = INTERACTION_LOG_DIR,
+        max_bytes: int = 8 * 1024 * 1024,
+        flush_interval: float = 2.0,
+        max_pending: int = 1024,
+    ) -> None:
+        self.log_dir = Path(log_dir)
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=max_pending)
+        self._thread: threading.Thread | None = None
+        self._start_lock = threading.Lock()
+
+    def record(self, interaction: Interaction) -> None:
+        """Queues interaction for writing. Never blocks; drops the turn if the writer is behind."""
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait(interaction)
+        except queue.Full:
+            self.dropped += 1
+
+    def rotate(self) -> None:
+        """Seals the active segment once everything recorded so far is written."""
+        self._ensure_writer()
+        self._queue.put(_ROTATE)
+        self._queue.join()
+
+    def flush(self) -> None:
+        """Blocks until everything recorded so far is written to disk."""
+        if self._thread is not None:
+            self._queue.join()
+
+    def sealed_segments(self) -> list[Path]:
+        """Sealed segments, oldest first."""
+        return sorted(self.log_dir.glob(SEGMENT_PATTERN))
+
+    def _ensure_writer(self) -> None:
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self.log_dir.mkdir(parents=True, exist_ok=True)
+                self._thread = threading.Thread(
+                    target=self._write_loop, name="habitllm-interaction-log", daemon=True
+                )
+                self._thread.start()
+
+    def _write_loop(self) -> None:
+        path = self.log_dir / ACTIVE_SEGMENT
+        f = self._open(path)
+        last_flush = time.monotonic()
+        while True:
+            item = self._queue.get()
+            try:
+                if item is _ROTATE:
+                    f.close()
+                    self._seal(path)
+                    f = self._open(path)
+                else:
+                    f.write(json.dumps(asdict(item)) + "\n")
+                # writes are batched while turns queue up, and flushed once caught up
+                if self._queue.empty() or time.monotonic() - last_flush >= self.flush_interval:
+                    f.flush()
+                    last_flush = time.monotonic()
+                    if f.tell() >= self.max_bytes:
+                        f.close()
+                        self._seal(path)
+                        f = self._open(path)
+            except OSError:
+                logger.exception("Could not write interaction log.")
+            finally:
+                self._queue.task_done()
+
+    @staticmethod
+    def _open(path: Path):
+        return open(path, "a", encoding="utf-8", buffering=1 << 16)
+
+    def _seal(self, path: Path) -> None:
+        if path.is_file() and path.stat().st_size > 0:
+            os.replace(path, self.log_dir / f"interactions-{time.time_ns()}.jsonl")
+
+
+def read_segment(path: str | Path) -> Iterator[Interaction]:
+    """Streams the interactions of a segment, skipping lines that are not valid records."""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield Interaction(**json.loads(line))
+            except (ValueError, TypeError):
+                continue
+
+
+def write_transcript(segment: str | Path, dest_dir: str | Path) -> Path:
+    """Streams a sealed segment into a plain text transcript, one turn per paragraph.
+
+    Args:
+        segment: Sealed segment to convert.
+        dest_dir: Directory to write the transcript to.
+
+    Returns:
+        Path of the transcript, named after the segment.
+    """
+    dest = Path(dest_dir) / f"{Path(segment).stem}.txt"
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    with open(dest, "w", encoding="utf-8") as f:
+        for interaction in read_segment(segment):
+            f.write(interaction.to_transcript() + "\n\n")
+    return dest
+
+
+def mark_ingested(segment: str | Path) -> None:
+    segment = Path(segment)
+    ingested_dir = segment.parent / INGESTED_DIR
+    ingested_dir.mkdir(exist_ok=True)
+    os.replace(segment, ingested_dir / segment.name)
@@ -0,0 +1,119 @@
+"""Retrieval-grounded logit bias: nudges generation towards tokens of the retrieved context."""
+
+from collections import OrderedDict
+import hashlib
+import threading
+from typing import Callable, Iterable
+
+import torch
+from transformers import LogitsProcessor
+
+
+def build_bias(
+    token_ids: Iterable[int],
+    strength: float,
+    max_tokens: int,
+    exclude: Iterable[int] = (),
+) -> tuple[torch.Tensor, torch.Tensor]:
+    """Sparse bias over the distinct tokens of the retrieved context.
+
+    Args:
+        token_ids: Token ids of the retrieved chunks.
+        strength: Logit added to each of them.
+        max_tokens: Distinct tokens kept, in order of first occurrence.
+        exclude: Token ids never biased, e.g. the special tokens.
+
+    Returns:
+        Token indices (int64) and bias values (float32) of the same length.
+    """
+    excluded = set(exclude)
+    distinct = [token for token in dict.fromkeys(token_ids) if token not in excluded]
+    indices = torch.tensor(distinct[:max_tokens], dtype=torch.int64)
+    return indices, torch.full(indices.shape, float(strength), dtype=torch.float32)
+
+
+class LogitBiasCache:
+    """
+    Bias tensors of recent contexts, so each context is tokenized once and not per turn.
+
+    Args:
+        max_entries: Contexts kept, least recently used are dropped.
+    """
+
+    def __init__(self, max_entries: int = 32) -> None:
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple, tuple[torch.Tensor, torch.Tensor]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(
+        self,
+        texts: list[str],
+        tokenize: Callable[[str], list[int]],
+        strength: float,
+        max_tokens: int,
+        exclude: Iterable[int] = (),
+        tokenizer_key: str = "",
+    ) -> tuple[torch.Tensor, torch.Tensor]:
+        """The bias of the context made of texts, built with tokenize on a miss.
+
+        Args:
+            texts: Retrieved chunks of the turn.
+            tokenize: Returns the token ids of a text, without special tokens.
+            strength: See build_bias.
+            max_tokens: See build_bias.
+            exclude: See build_bias.
+            tokenizer_key: Identifies the tokenizer (e.g. the loaded model).
+        """
+        digest = hashlib.sha1("\0".join(texts).encode("utf-8")).hexdigest()
+        key = (tokenizer_key, digest, strength, max_tokens)
+        with self._lock:
+            bias = self._entries.get(key)
+            if bias is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return bias
+        token_ids = [token for text in texts for token in tokenize(text)]
+        bias = build_bias(token_ids, strength, max_tokens, exclude)
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = bias
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return bias
+
+    def __str__(self) -> str:
+        lookups = self.hits + self.misses
+        hit_ratio = self.hits / lookups if lookups else 0.0
+        return f"{len(self._entries)} contexts, {hit_ratio:.1%} hit ratio"
+
+
+class RetrievalLogitBias(LogitsProcessor):
+    """
+    Adds a sparse bias to the scores of every step with a single index_add_.
+
+    The bias is moved to the device and dtype of the scores, and clipped to their
+    vocabulary, on the first step only.
+
+    Args:
+        indices: Token indices to bias, see build_bias.
+        values: Bias of each index.
+    """
+
+    def __init__(self, indices: torch.Tensor, values: torch.Tensor) -> None:
+        self.indices = indices
+        self.values = values
+        self._prepared: tuple[torch.device, torch.dtype, int] | None = None
+
+    def _prepare(self, scores: torch.Tensor) -> None:
+        keep = self.indices < scores.shape[-1]
+        self.indices = self.indices[keep].to(scores.device)
+        self.values = self.values[keep].to(device=scores.device, dtype=scores.dtype)
+        self._prepared = (scores.device, scores.dtype, scores.shape[-1])
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor) -> torch.FloatTensor:
+        if self._prepared != (scores.device, scores.dtype, scores.shape[-1]):
+            self._prepare(scores)
+        # the same bias for every sequence of the batch
+        return scores.index_add_(-1, self.indices, self.values.expand(scores.shape[0], -1))
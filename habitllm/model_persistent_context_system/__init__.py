@@ -4,6 +4,6 @@ HabitLLM.
 
 """
 
-from .model_persistent_context import ModelPersistentContext
+from .model_persistent_context import BACKENDS, ModelPersistentContext, copy_collection, get_client
 
-__all__ = ["ModelPersistentContext"]
+__all__ = ["BACKENDS", "ModelPersistentContext", "copy_collection", "get_client"]
@@ -0,0 +1,512 @@
+"""Embedded FAISS + SQLite storage backend of the model persistent context.
+
+FaissSqliteClient implements the part of the QdrantClient API that
+ModelPersistentContext uses, so the persistent context can run in-process without a
+Qdrant server. Each collection is:
+
+- `<collection>.sqlite`: the points (id, payload, vector) with their position in the
+  index. SQLite in WAL mode is the source of truth and lets the webui read while the
+  routine worker process writes.
+- `<collection>.<epoch>.faiss`: a checkpoint of the inner product index over the
+  normalized vectors, memory-mapped on load. Vectors written after the checkpoint are
+  read back from SQLite.
+
+Deleted points keep their index position (a tombstone) until the collection is
+compacted through update_collection. Compaction renumbers positions and starts a new
+epoch.
+"""
+
+from dataclasses import dataclass
+import json
+from pathlib import Path
+import sqlite3
+import threading
+
+import numpy as np
+from qdrant_client.http import models
+
+from ..utils import atomic_write_path
+
+# checkpoint the index once this many vectors were added since the last checkpoint ...
+CHECKPOINT_MIN_TAIL = 10_000
+# ... and they make up this fraction of the index
+CHECKPOINT_TAIL_FRACTION = 0.1
+# only payload field that can be filtered on, stored in its own indexed column
+SOURCE_KEY = "metadata.source"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS points (
+    id PRIMARY KEY,
+    position INTEGER NOT NULL UNIQUE,
+    source TEXT,
+    payload TEXT NOT NULL,
+    vector BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS points_source ON points (source);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+"""
+
+
+@dataclass
+class CollectionInfo:
+    """The fields of qdrant's CollectionInfo that ModelPersistentContext reads."""
+
+    status: models.CollectionStatus
+    vectors_count: int
+    points_count: int
+    segments_count: int
+    indexed_vectors_count: int
+
+
+def _sources(query_filter: models.Filter | None) -> list[str] | None:
+    """Sources matched by a filter on SOURCE_KEY, None for no filter."""
+    if query_filter is None:
+        return None
+    conditions = query_filter.must or []
+    if (
+        query_filter.should
+        or query_filter.must_not
+        or len(conditions) != 1
+        or getattr(conditions[0], "key", None) != SOURCE_KEY
+    ):
+        raise ValueError(f"FaissSqliteClient only supports filters matching {SOURCE_KEY}")
+    match = conditions[0].match
+    return [match.value] if isinstance(match, models.MatchValue) else list(match.any)
+
+
+def _project(payload: dict, with_payload) -> dict | None:
+    """Payload fields selected by with_payload (True, False or a list of dotted keys)."""
+    if with_payload is True:
+        return payload
+    if not with_payload:
+        return None
+    projected: dict = {}
+    for key in with_payload:
+        value, target, parts = payload, projected, key.split(".")
+        for part in parts:
+            if not isinstance(value, dict) or part not in value:
+                break
+            value = value[part]
+        else:
+            for part in parts[:-1]:
+                target = target.setdefault(part, {})
+            target[parts[-1]] = value
+    return projected
+
+
+class _Collection:
+    """One collection: its SQLite database and this process' view of the index."""
+
+    def __init__(self, directory: Path, name: str) -> None:
+        import faiss
+
+        self.faiss = faiss
+        self.directory = directory
+        self.name = name
+        self.db_path = directory / f"{name}.sqlite"
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(_SCHEMA)
+        self.lock = threading.RLock()
+        self.index = None
+        # generation and epoch of the database the index reflects
+        self.generation = -1
+        self.epoch = -1
+        # positions covered by the last checkpoint
+        self.checkpoint_total = 0
+
+    # ---------------- meta ----------------
+
+    def _meta(self, key: str, default: int = 0) -> int:
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row is not None else default
+
+    def _set_meta(self, key: str, value: int) -> None:
+        self.conn.execute(
+            "INSERT INTO meta (key, value) VALUES (?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+            (key, value),
+        )
+
+    @property
+    def dim(self) -> int:
+        return self._meta("dim")
+
+    def _checkpoint_path(self, epoch: int) -> Path:
+        return self.directory / f"{self.name}.{epoch}.faiss"
+
+    # ---------------- index sync ----------------
+
+    def sync(self) -> None:
+        """Brings the index up to date with writes of this or other processes."""
+        generation = self._meta("generation")
+        if generation == self.generation and self.index is not None:
+            return
+        epoch = self._meta("epoch")
+        if epoch != self.epoch or self.index is None:
+            self._load(epoch)
+        self._append_tail()
+        self.generation = generation
+
+    def _load(self, epoch: int) -> None:
+        """Memory-maps the checkpoint of epoch, or starts an empty index without one."""
+        path = self._checkpoint_path(epoch)
+        if path.is_file():
+            self.index = self.faiss.read_index(str(path), self.faiss.IO_FLAG_MMAP)
+        else:
+            self.index = self.faiss.IndexFlatIP(self.dim)
+        self.checkpoint_total = self.index.ntotal
+        self.epoch = epoch
+
+    def _append_tail(self) -> None:
+        """Adds the vectors written after the index was last updated, in position order."""
+        start, end = self.index.ntotal, self._meta("next_position")
+        if end <= start:
+            return
+        vectors = np.zeros((end - start, self.index.d), dtype=np.float32)
+        # positions of deleted points stay zero vectors, they are never returned
+        for position, vector in self.conn.execute(
+            "SELECT position, vector FROM points WHERE position >= ?", (start,)
+        ):
+            vectors[position - start] = np.frombuffer(vector, dtype=np.float32)
+        self.index.add(vectors)
+
+    def checkpoint(self, force: bool = False) -> None:
+        """Saves the index if enough was added since the last checkpoint (or force)."""
+        self.sync()
+        tail = self.index.ntotal - self.checkpoint_total
+        if not force and (
+            tail < CHECKPOINT_MIN_TAIL or tail < CHECKPOINT_TAIL_FRACTION * self.index.ntotal
+        ):
+            return
+        if tail == 0 and self._checkpoint_path(self.epoch).is_file():
+            return
+        with atomic_write_path(self._checkpoint_path(self.epoch)) as tmp:
+            self.faiss.write_index(self.index, str(tmp))
+        self.checkpoint_total = self.index.ntotal
+
+    # ---------------- writes ----------------
+
+    def upsert(self, points: list[models.PointStruct]) -> None:
+        ids = [point.id for point in points]
+        vectors = np.asarray([point.vector for point in points], dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.sync()
+            self.conn.executemany(
+                "DELETE FROM points WHERE id = ?", [(point_id,) for point_id in ids]
+            )
+            start = self._meta("next_position")
+            self.conn.executemany(
+                "INSERT INTO points (id, position, source, payload, vector) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (
+                        point.id,
+                        start + i,
+                        ((point.payload or {}).get("metadata") or {}).get("source"),
+                        json.dumps(point.payload or {}),
+                        vectors[i].tobytes(),
+                    )
+                    for i, point in enumerate(points)
+                ],
+            )
+            self._set_meta("next_position", start + len(points))
+            generation = self._meta("generation") + 1
+            self._set_meta("generation", generation)
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.index.add(vectors)
+        self.generation = generation
+        self.checkpoint()
+
+    def delete(self, ids: list | None = None, sources: list[str] | None = None) -> None:
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            if ids is not None:
+                self.conn.executemany(
+                    "DELETE FROM points WHERE id = ?", [(point_id,) for point_id in ids]
+                )
+            if sources is not None:
+                self.conn.executemany(
+                    "DELETE FROM points WHERE source = ?", [(source,) for source in sources]
+                )
+            self._set_meta("generation", self._meta("generation") + 1)
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def compact(self) -> None:
+        """Drops tombstones: renumbers positions, rebuilds and checkpoints the index."""
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = self.conn.execute("SELECT id, vector FROM points ORDER BY position").fetchall()
+            vectors = np.zeros((len(rows), self.dim), dtype=np.float32)
+            for i, (_, vector) in enumerate(rows):
+                vectors[i] = np.frombuffer(vector, dtype=np.float32)
+            # shift out of the way first, positions are unique
+            self.conn.execute("UPDATE points SET position = -1 - position")
+            self.conn.executemany(
+                "UPDATE points SET position = ? WHERE id = ?",
+                [(i, point_id) for i, (point_id, _) in enumerate(rows)],
+            )
+            epoch = self._meta("epoch") + 1
+            index = self.faiss.IndexFlatIP(self.dim)
+            index.add(vectors)
+            with atomic_write_path(self._checkpoint_path(epoch)) as tmp:
+                self.faiss.write_index(index, str(tmp))
+            self._set_meta("next_position", len(rows))
+            self._set_meta("epoch", epoch)
+            self._set_meta("generation", self._meta("generation") + 1)
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        for path in self.directory.glob(f"{self.name}.*.faiss"):
+            if path != self._checkpoint_path(epoch):
+                path.unlink(missing_ok=True)
+
+    # ---------------- reads ----------------
+
+    def rows(self, positions: list[int], with_vectors: bool) -> dict[int, tuple]:
+        """(id, payload, vector) of the live points at positions, keyed by position."""
+        placeholders = ",".join("?" * len(positions))
+        vector_column = "vector" if with_vectors else "NULL"
+        return {
+            position: (point_id, payload, vector)
+            for point_id, position, payload, vector in self.conn.execute(
+                f"SELECT id, position, payload, {vector_column} FROM points "
+                f"WHERE position IN ({placeholders})",
+                positions,
+            )
+        }
+
+    def search(
+        self, query_vector, limit: int, offset: int, score_threshold, with_payload, with_vectors
+    ) -> list[models.ScoredPoint]:
+        self.sync()
+        if self.index.ntotal == 0:
+            return []
+        query = np.asarray([query_vector], dtype=np.float32)
+        query /= max(float(np.linalg.norm(query)), 1e-12)
+        wanted = offset + limit
+        fetch = wanted
+        while True:
+            # over-fetch until enough live points are found, deleted ones are skipped
+            fetch = min(fetch, self.index.ntotal)
+            scores, positions = self.index.search(query, fetch)
+            hits = [
+                (int(position), float(score))
+                for score, position in zip(scores[0], positions[0])
+                if position != -1 and (score_threshold is None or score >= score_threshold)
+            ]
+            rows = self.rows([position for position, _ in hits], with_vectors)
+            live = [(position, score) for position, score in hits if position in rows]
+            # results are sorted, so once one falls below the threshold all further do
+            exhausted = fetch == self.index.ntotal or len(hits) < fetch
+            if len(live) >= wanted or exhausted:
+                break
+            fetch *= 2
+        results = []
+        for position, score in live[offset:wanted]:
+            point_id, payload, vector = rows[position]
+            results.append(
+                models.ScoredPoint(
+                    id=point_id,
+                    version=0,
+                    score=score,
+                    payload=_project(json.loads(payload), with_payload),
+                    vector=np.frombuffer(vector, dtype=np.float32).tolist() if with_vectors else None,
+                )
+            )
+        return results
+
+    def records(self, query: str, args: list, with_payload, with_vectors) -> list[models.Record]:
+        vector_column = "vector" if with_vectors else "NULL"
+        return [
+            models.Record(
+                id=point_id,
+                payload=_project(json.loads(payload), with_payload),
+                vector=np.frombuffer(vector, dtype=np.float32).tolist() if with_vectors else None,
+            )
+            for point_id, payload, vector in self.conn.execute(
+                f"SELECT id, payload, {vector_column} FROM points {query}", args
+            )
+        ]
+
+
+class FaissSqliteClient:
+    """
+    In-process vector store with the subset of the QdrantClient API used by
+    ModelPersistentContext. Distances are cosine, like the collections it creates in Qdrant.
+
+    Args:
+        path: Directory holding the collections.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._collections: dict[str, _Collection] = {}
+        self._lock = threading.Lock()
+
+    def _collection(self, collection_name: str) -> _Collection:
+        with self._lock:
+            collection = self._collections.get(collection_name)
+            if collection is None:
+                if not self.collection_exists(collection_name):
+                    raise ValueError(f"Collection {collection_name} not found")
+                collection = _Collection(self.path, collection_name)
+                self._collections[collection_name] = collection
+            return collection
+
+    def collection_exists(self, collection_name: str) -> bool:
+        return (self.path / f"{collection_name}.sqlite").is_file()
+
+    def create_collection(
+        self, collection_name: str, vectors_config: models.VectorParams, **kwargs
+    ) -> bool:
+        if vectors_config.distance != models.Distance.COSINE:
+            raise ValueError("FaissSqliteClient only supports cosine distance")
+        with self._lock:
+            collection = _Collection(self.path, collection_name)
+            collection.conn.execute("BEGIN IMMEDIATE")
+            collection._set_meta("dim", vectors_config.size)
+            collection.conn.execute("COMMIT")
+            self._collections[collection_name] = collection
+        return True
+
+    def delete_collection(self, collection_name: str, **kwargs) -> bool:
+        with self._lock:
+            collection = self._collections.pop(collection_name, None)
+            if collection is not None:
+                collection.conn.close()
+        paths = [self.path / f"{collection_name}.sqlite{suffix}" for suffix in ("", "-wal", "-shm")]
+        for path in paths + list(self.path.glob(f"{collection_name}.*.faiss")):
+            path.unlink(missing_ok=True)
+        return True
+
+    def get_collection(self, collection_name: str) -> CollectionInfo:
+        collection = self._collection(collection_name)
+        with collection.lock:
+            collection.sync()
+            points = collection.conn.execute("SELECT COUNT(*) FROM points").fetchone()[0]
+        return CollectionInfo(
+            status=models.CollectionStatus.GREEN,
+            vectors_count=points,
+            points_count=points,
+            segments_count=1,
+            indexed_vectors_count=points,
+        )
+
+    def create_payload_index(self, collection_name: str, field_name: str, **kwargs) -> None:
+        # only the source is filtered on, and its column is always indexed
+        return None
+
+    def update_collection(
+        self, collection_name: str, optimizers_config: models.OptimizersConfigDiff | None = None, **kwargs
+    ) -> bool:
+        """Compacts the collection when the optimizer is reconfigured; HNSW and
+        quantization settings do not apply to the flat index and are ignored."""
+        if optimizers_config is not None:
+            collection = self._collection(collection_name)
+            with collection.lock:
+                collection.compact()
+        return True
+
+    def upsert(
+        self, collection_name: str, points: list[models.PointStruct], wait: bool = True, **kwargs
+    ) -> None:
+        if not points:
+            return
+        collection = self._collection(collection_name)
+        with collection.lock:
+            collection.upsert(list(points))
+
+    def delete(self, collection_name: str, points_selector, wait: bool = True, **kwargs) -> None:
+        collection = self._collection(collection_name)
+        with collection.lock:
+            if isinstance(points_selector, models.PointIdsList):
+                collection.delete(ids=list(points_selector.points))
+            else:
+                collection.delete(sources=_sources(points_selector.filter))
+
+    def count(
+        self, collection_name: str, count_filter: models.Filter | None = None, exact: bool = True
+    ) -> models.CountResult:
+        collection = self._collection(collection_name)
+        sources = _sources(count_filter)
+        with collection.lock:
+            if sources is None:
+                query, args = "SELECT COUNT(*) FROM points", []
+            else:
+                placeholders = ",".join("?" * len(sources))
+                query, args = f"SELECT COUNT(*) FROM points WHERE source IN ({placeholders})", sources
+            return models.CountResult(count=collection.conn.execute(query, args).fetchone()[0])
+
+    def scroll(
+        self,
+        collection_name: str,
+        scroll_filter: models.Filter | None = None,
+        limit: int = 10,
+        offset: int | None = None,
+        with_payload=True,
+        with_vectors: bool = False,
+        **kwargs,
+    ) -> tuple[list[models.Record], int | None]:
+        """Pages through the points in index order. Offsets are index positions."""
+        collection = self._collection(collection_name)
+        sources = _sources(scroll_filter)
+        where, args = "WHERE position >= ?", [offset or 0]
+        if sources is not None:
+            where += f" AND source IN ({','.join('?' * len(sources))})"
+            args += sources
+        with collection.lock:
+            rows = collection.conn.execute(
+                f"SELECT position FROM points {where} ORDER BY position LIMIT ?", args + [limit + 1]
+            ).fetchall()
+            next_offset = rows[limit][0] if len(rows) > limit else None
+            records = collection.records(
+                f"{where} ORDER BY position LIMIT ?", args + [limit], with_payload, with_vectors
+            )
+        return records, next_offset
+
+    def search(
+        self,
+        collection_name: str,
+        query_vector,
+        limit: int = 10,
+        offset: int = 0,
+        score_threshold: float | None = None,
+        with_payload=True,
+        with_vectors: bool = False,
+        **kwargs,
+    ) -> list[models.ScoredPoint]:
+        collection = self._collection(collection_name)
+        with collection.lock:
+            return collection.search(
+                query_vector, limit, offset or 0, score_threshold, with_payload, with_vectors
+            )
+
+    def retrieve(
+        self, collection_name: str, ids: list, with_payload=True, with_vectors: bool = False, **kwargs
+    ) -> list[models.Record]:
+        if not ids:
+            return []
+        collection = self._collection(collection_name)
+        with collection.lock:
+            return collection.records(
+                f"WHERE id IN ({','.join('?' * len(ids))})", list(ids), with_payload, with_vectors
+            )
+
+    def close(self, **kwargs) -> None:
+        with self._lock:
+            for collection in self._collections.values():
+                with collection.lock:
+                    if collection.index is not None:
+                        collection.checkpoint(force=True)
+                    collection.conn.close()
+            self._collections.clear()
@@ -1,155 +1,1173 @@
 from pathlib import Path
 
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+import hashlib
+import json
+import shutil
 import logging
+import statistics
+import threading
+import time
+from typing import Callable, Iterable, Iterator, TypeVar
+import uuid
+import grpc
+import numpy as np
 from qdrant_client import QdrantClient
 from qdrant_client.http import models
-
-from typing import cast
+from qdrant_client.http.exceptions import ResponseHandlingException, UnexpectedResponse
 
 # from langchain_community.embeddings import HuggingFaceEmbeddings
 # from langchain_community.vectorstores import Qdrant
 # from langchain_community.document_loaders import TextLoader
-from langchain_community.document_loaders.text import TextLoader
-from langchain_community.embeddings.huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores.qdrant import Qdrant
-from langchain.vectorstores import VectorStore
-from langchain_text_splitters import CharacterTextSplitter
 from langchain.docstore.document import Document
 
-from ..utils import copy_files_to_dest, delete_files_from_dest
+from ..embedding_service import get_embedding_service
+from ..ingestion import embed_in_batches, iter_file_chunks
+from ..instrumentation import span
+from ..retrieval import relevance_from_cosine
+from ..sparse_index import BM25Index, reciprocal_rank_fusion
+from ..utils import atomic_write_path, copy_files_to_dest, delete_files_from_dest
+
+T = TypeVar("T")
+
+SOURCE_KEY = "metadata.source"
+CHUNK_ID_NAMESPACE = uuid.UUID("5b7f3c1e-8a1d-4c3b-9f0e-2d6a4e8b1c7a")
+# payload fields we filter on, and the index type to create for them
+INDEXED_PAYLOAD_FIELDS = {
+    SOURCE_KEY: models.PayloadSchemaType.KEYWORD,
+    "metadata.file_hash": models.PayloadSchemaType.KEYWORD,
+}
+
+
+@dataclass
+class CollectionStats:
+    """Snapshot of the collection size and search performance."""
+
+    vectors: int
+    segments: int
+    search_latency_ms: float
+
+    def __str__(self) -> str:
+        return (
+            f"{self.vectors} vectors in {self.segments} segments, "
+            f"median search latency {self.search_latency_ms:.2f}ms"
+        )
+
+
+@dataclass
+class ReindexReport:
+    before: CollectionStats
+    after: CollectionStats
+
+    def __str__(self) -> str:
+        return f"Before reindex: {self.before}\nAfter reindex: {self.after}"
+
+
+def _source_filter(*sources: str) -> models.Filter:
+    """Filter matching points whose chunk comes from one of sources."""
+    match = (
+        models.MatchValue(value=sources[0])
+        if len(sources) == 1
+        else models.MatchAny(any=list(sources))
+    )
+    return models.Filter(must=[models.FieldCondition(key=SOURCE_KEY, match=match)])
+
+
+# qdrant server, embedded qdrant (path mode) or the in-process FAISS + SQLite store
+BACKENDS = ("qdrant", "qdrant-local", "faiss-sqlite")
+# backends storing the collection in-process, under path
+LOCAL_BACKENDS = ("qdrant-local", "faiss-sqlite")
+# ingestion manifest shared by all collections next to file_dir, before it was per collection
+LEGACY_MANIFEST_NAME = "ingest_manifest.json"
+
+# clients shared by every ModelPersistentContext of the process, keyed by connection options
+_clients: dict[tuple, QdrantClient] = {}
+_clients_lock = threading.Lock()
+# first retry waits this long, each further one twice as long
+RETRY_BASE_DELAY = 0.5
+_RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+_RETRYABLE_GRPC = {
+    grpc.StatusCode.UNAVAILABLE,
+    grpc.StatusCode.DEADLINE_EXCEEDED,
+    grpc.StatusCode.RESOURCE_EXHAUSTED,
+}
+
+
+def get_client(
+    address: str,
+    port: int = 6333,
+    grpc_port: int = 6334,
+    prefer_grpc: bool = False,
+    timeout: int | None = None,
+    path: str | None = None,
+    backend: str = "qdrant",
+) -> QdrantClient:
+    """Returns the process-wide client for these connection options, creating it on first use.
+
+    Ingestion, search and maintenance share its connection pool (or gRPC channel) instead
+    of each opening their own. In-memory clients are not shared, each is its own database.
+    The local backends ignore the connection options and store their data under path.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown persistent context backend {backend!r}, expected one of {BACKENDS}")
+    if backend in LOCAL_BACKENDS and path is None:
+        raise ValueError(f"The {backend} backend needs a storage path")
+    if backend == "qdrant" and address == ":memory:":
+        return QdrantClient(address)
+    key = (backend, path) if backend in LOCAL_BACKENDS else (address, port, grpc_port, prefer_grpc, timeout)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            if backend == "faiss-sqlite":
+                from .faiss_sqlite_store import FaissSqliteClient
+
+                client = FaissSqliteClient(path)
+            elif backend == "qdrant-local":
+                # embedded qdrant storing the collection under path
+                client = QdrantClient(path=path)
+            else:
+                client = QdrantClient(
+                    address,
+                    port=port,
+                    grpc_port=grpc_port,
+                    prefer_grpc=prefer_grpc,
+                    timeout=timeout,
+                )
+            _clients[key] = client
+        return client
+
+
+def copy_collection(
+    source: QdrantClient, target: QdrantClient, collection: str, batch_size: int = 256
+) -> int:
+    """Copies every point (id, vector, payload) of collection from source to target.
+
+    Point ids are kept, so the ingestion manifest and keyword index stay valid for the
+    copy. The target collection is created if needed.
+
+    Returns:
+        Number of points copied.
+    """
+    copied = 0
+    offset = None
+    while True:
+        points, offset = source.scroll(
+            collection, limit=batch_size, offset=offset, with_payload=True, with_vectors=True
+        )
+        if points:
+            if not target.collection_exists(collection):
+                target.create_collection(
+                    collection,
+                    vectors_config=models.VectorParams(
+                        size=len(points[0].vector), distance=models.Distance.COSINE
+                    ),
+                )
+            target.upsert(
+                collection,
+                points=[
+                    models.PointStruct(id=point.id, vector=point.vector, payload=point.payload)
+                    for point in points
+                ],
+                wait=True,
+            )
+            copied += len(points)
+        if offset is None:
+            return copied
+
+
+def _is_transient(error: Exception) -> bool:
+    """Whether error is a timeout, dropped connection or overloaded server worth retrying."""
+    if isinstance(error, ResponseHandlingException):
+        return True
+    if isinstance(error, UnexpectedResponse):
+        return error.status_code in _RETRYABLE_STATUS
+    if isinstance(error, grpc.RpcError):
+        return error.code() in _RETRYABLE_GRPC
+    return isinstance(error, (ConnectionError, TimeoutError))
+
+
+def _hash_file(file: str) -> str:
+    digest = hashlib.sha256()
+    with open(file, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _hash_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
 
 
 class ModelPersistentContext:
     """
     Object to manage the non-parametric parameters of the model (i.e, the embeddings of stored context).
+
+    Args:
+        collection: Qdrant collection holding the context.
+        address: Qdrant server url, or ":memory:".
+        port: Qdrant REST port.
+        file_dir: Directory ingested files are copied to.
+        manifest_path: Where to keep the ingestion manifest, next to file_dir (named after
+            the collection) by default.
+        batch_size: Chunks per call to the embedding model.
+        path: Storage directory of the local backends.
+        backend: One of BACKENDS. Given a path, "qdrant" means "qdrant-local".
+        prefer_grpc: Whether to talk to the server over gRPC instead of REST.
+        grpc_port: Qdrant gRPC port.
+        timeout: Request timeout in seconds.
+        upload_batch_size: Points per upsert request when ingesting.
+        upload_workers: Upsert requests in flight at the same time when ingesting. Always 1
+            with the local backends.
+        max_retries: Retries of a failed write on timeouts and overloaded or unreachable
+            servers, with exponential backoff.
+        logger: Logger to report to.
     """
-    db: VectorStore | None = None
+    # whether the collection exists and this object is connected to it
+    connected: bool = False
+    # bumped whenever the stored embeddings change, invalidates cached retrieval results
+    version: int = 0
     
     def __init__(
         self,
         collection="model_persistent_context",
-        embedder="sentence-transformers/all-mpnet-base-v2",
         address="http://habitllm-persistent-context-store-1:6333",
         port=6333,
         file_dir="/persistent/model_context/files",
+        manifest_path=None,
+        batch_size=64,
+        path=None,
+        backend="qdrant",
+        prefer_grpc=False,
+        grpc_port=6334,
+        timeout=None,
+        upload_batch_size=64,
+        upload_workers=1,
+        max_retries=3,
         logger=logging.getLogger(__name__),
     ) -> None:
         self.logger = logger
         self.collection = collection
         self.address = address
         self.port = port
+        self.path = path
+        self.backend = "qdrant-local" if backend == "qdrant" and path is not None else backend
         self.file_dir = file_dir
-        self.embeddings = HuggingFaceEmbeddings(model_name=embedder)
+        self.batch_size = batch_size
+        self.upload_batch_size = max(1, upload_batch_size)
+        # embedded stores are written by one thread at a time
+        self.is_local = self.backend in LOCAL_BACKENDS or address == ":memory:"
+        self.upload_workers = 1 if self.is_local else max(1, upload_workers)
+        self.max_retries = max_retries
+        self.embeddings = get_embedding_service()
         Path(self.file_dir).mkdir(exist_ok=True)
-        logger.info(f"Initializing connection to qdrant server @ {address}:{port} ...")
-        self.client = QdrantClient(self.address, port=self.port)
+        # local index of ingested files: source -> file hash and {chunk id: chunk hash},
+        # checked against the collection once connected
+        self.manifest_path = Path(
+            manifest_path or Path(self.file_dir).parent / f"{collection}_ingest_manifest.json"
+        )
+        legacy_manifest_path = self.manifest_path.with_name(LEGACY_MANIFEST_NAME)
+        self.manifest: dict[str, dict] = self._load_manifest(
+            # manifests used to be shared by all collections next to file_dir
+            legacy_manifest_path
+            if manifest_path is None and not self.manifest_path.is_file()
+            else self.manifest_path
+        )
+        # sources deleted by hand (or by concept) -> their file hash then, see skip_deleted
+        self.deleted_path = self.manifest_path.with_name(f"{collection}_deleted.json")
+        self.deleted: dict[str, str] = self._load_deleted()
+        # keyword index over the stored chunks, keyed by point id, saved with the manifest
+        # unless saves are deferred, see deferred_sparse_index_saves
+        self.sparse_index_path = self.manifest_path.with_name(f"{collection}_bm25.pkl")
+        self._sparse_index_mtime: int | None = None
+        self._sparse_index_dirty = False
+        self._deferred_sparse_saves = 0
+        self.sparse_index = self._load_sparse_index()
+        if self.backend in LOCAL_BACKENDS:
+            logger.info(f"Opening local {self.backend} storage @ {path} ...")
+        else:
+            transport = f"gRPC port {grpc_port}" if prefer_grpc else f"port {port}"
+            logger.info(f"Initializing connection to qdrant server @ {address} ({transport}) ...")
+        self.client = get_client(address, port, grpc_port, prefer_grpc, timeout, path, self.backend)
         logger.info("Connection established.")
         logger.info(f"Checking if collection {self.collection} exists...")
         if self.client.collection_exists(collection_name=collection):
-            self.db = Qdrant(
-                self.client, self.collection, embeddings=self.embeddings
-            )
+            self._connect_collection()
             vectors_count = self.client.get_collection(self.collection).vectors_count
             logger.info(f"Collection exists with {vectors_count} vectors")
+            points = self.client.count(self.collection, exact=True).count
+            if points < sum(len(entry["chunks"]) for entry in self.manifest.values()):
+                self._forget_manifest("lists chunks the collection does not hold")
+            else:
+                self._forget_unstored_files()
+            # a job that deferred its keyword index save may have been interrupted
+            if not self.sparse_index_path.is_file() or len(self.sparse_index) != points:
+                self._rebuild_sparse_index()
         else:
             logger.info("No collection found. Will be created during initial document ingestion in downtime.")
+            if self.manifest:
+                self._forget_manifest("belongs to a collection that does not exist")
+            self.sparse_index = BM25Index()
         # self.db: VectorStore = Qdrant.from_documents(
         #     [], self.embeddings, url=self.address, port=self.port
         # )
         logger.info("Connection established.")
 
-    def add_files_to_vector_store(self, files: list[str]) -> None:
+    def refresh(self) -> None:
+        """Reloads the manifest and collection after another process changed them.
+
+        The keyword index is only reloaded once it was saved again.
+        """
+        self.manifest = self._load_manifest()
+        self.deleted = self._load_deleted()
+        if self._file_mtime(self.sparse_index_path) != self._sparse_index_mtime:
+            self.sparse_index = self._load_sparse_index()
+        if not self.connected and self.client.collection_exists(self.collection):
+            self._connect_collection()
+        self.version += 1
+
+    def add_files_to_vector_store(
+        self,
+        files: list[str],
+        progress: Callable[[int], None] | None = None,
+        skip_deleted: bool = False,
+    ) -> int:
         """Adds files to the model's persistent context.
 
         Stores files in persistent context folder and ingests their embeddings into the db.
+        Ingestion is incremental: files whose content hash is unchanged are skipped and for
+        modified files only the chunks that changed are replaced.
 
         Args:
             files: list of filepaths to add to persisted model context.
+            progress: Called with the number of chunks upserted so far after every batch.
+                If it raises, the ingestion stops; chunks already upserted stay and a
+                later ingestion of the same files completes them.
+            skip_deleted: Skip files deleted from the persistent context (by file or by
+                concept) that have not changed since, e.g. when ingesting a whole upload
+                directory. Adding them explicitly undoes the deletion.
+
+        Returns:
+            Number of chunks added.
         """
+        if skip_deleted and self.deleted:
+            kept = [file for file in files if not self._was_deleted(file)]
+            if len(kept) < len(files):
+                self.logger.info(f"Skipping {len(files) - len(kept)} deleted files.")
+            files = kept
         self.logger.info("Copying new documents to persistent context dir.")
         updated_files = copy_files_to_dest(self.file_dir, files)
 
         self.logger.info("Ingesting new documents into model persistent context.")
+        # chunks are streamed and upserted a batch at a time, so memory does not grow with file size
+        pending_ids: list[str] = []
+        pending_docs: list[Document] = []
+        added = 0
+        stale_ids: list[str] = []
+        updated_manifest: dict[str, dict] = {}
         for file in updated_files:
+            file_hash = _hash_file(file)
+            previous = self.manifest.get(file)
+            if previous is not None and previous["file_hash"] == file_hash:
+                self.logger.debug(f"{file} is unchanged, skipping.")
+                continue
+
             self.logger.info(f"Storing embeddings for {file}")
-            loader: TextLoader = TextLoader(file_path=file)
-            documents: list[Document] = loader.load()
-            text_splitter: CharacterTextSplitter = CharacterTextSplitter(
-                chunk_size=1000, chunk_overlap=0
-            )
-            docs = text_splitter.split_documents(documents)
-            db_just_created = False
-            if self.db is None:
-                if self.client.collection_exists(self.collection):
-                    self.logger.info("Collection exists, but langchain did not create VectorStore object. Retrying...")
-                    try:
-                        self.db: VectorStore = Qdrant(
-                            self.client, self.collection, embeddings=self.embeddings
-                        )
-                        self.logger.info(f"VectorStore, now connected to {self.collection}.")
-                    except Exception as e:
-                        raise Exception("Error [habitllm.model_persistant_context_system]: something went wrong externally.") from e
-                else:
-                    self.logger.info(f"Creating collection {self.collection}")
-                    self.db: VectorStore = Qdrant.from_documents(docs, self.embeddings, url=self.address, port=self.port, collection_name=self.collection)
-                    db_just_created = True
-            if not db_just_created:
-                ids = cast(VectorStore, self.db).add_documents(docs)
-                self.logger.debug(f"{file} was ingested with ids: {ids}.")
-        self.logger.info("Document ingestion complete!")
+            old_chunks = previous["chunks"] if previous is not None else {}
+            chunk_hashes: dict[str, str] = {}
+            for chunk_id, doc in self._identify_chunks(file, file_hash, iter_file_chunks(file)):
+                chunk_hashes[chunk_id] = doc.metadata["chunk_hash"]
+                if chunk_id in old_chunks:
+                    continue
+                pending_ids.append(chunk_id)
+                pending_docs.append(doc)
+                if len(pending_ids) >= self._flush_size:
+                    self._upsert_documents(pending_ids, pending_docs)
+                    added += len(pending_ids)
+                    pending_ids, pending_docs = [], []
+                    if progress is not None:
+                        progress(added)
+            stale_ids.extend(chunk_id for chunk_id in old_chunks if chunk_id not in chunk_hashes)
+            updated_manifest[file] = {"file_hash": file_hash, "chunks": chunk_hashes}
+
+        if not updated_manifest:
+            self.logger.info("No new or modified documents to ingest.")
+            return added
+
+        if pending_ids:
+            self._upsert_documents(pending_ids, pending_docs)
+            added += len(pending_ids)
+        if stale_ids:
+            self._with_retry(
+                self.client.delete,
+                self.collection,
+                points_selector=models.PointIdsList(points=stale_ids),
+            )
+            self.sparse_index.remove(stale_ids)
+        self.manifest.update(updated_manifest)
+        for source in updated_manifest:
+            self.deleted.pop(source, None)
+        self._save_manifest()
+        self.version += 1
+        self.logger.info(
+            f"Document ingestion complete! {len(updated_manifest)} files changed, "
+            f"{added} chunks added, {len(stale_ids)} chunks removed."
+        )
+        return added
+
+    def _identify_chunks(
+        self, file: str, file_hash: str, docs: Iterable[Document]
+    ) -> Iterator[tuple[str, Document]]:
+        """Assigns deterministic ids to chunks based on their source and content hash."""
+        occurrences: dict[str, int] = {}
+        for doc in docs:
+            chunk_hash = _hash_text(doc.page_content)
+            occurrence = occurrences.get(chunk_hash, 0)
+            occurrences[chunk_hash] = occurrence + 1
+            chunk_id = str(uuid.uuid5(CHUNK_ID_NAMESPACE, f"{file}:{chunk_hash}:{occurrence}"))
+            doc.metadata.update(
+                {"source": file, "file_hash": file_hash, "chunk_hash": chunk_hash}
+            )
+            yield chunk_id, doc
+
+    @property
+    def _flush_size(self) -> int:
+        """Chunks to collect before embedding and uploading them, enough to keep every upload worker busy."""
+        return max(self.batch_size, self.upload_batch_size * self.upload_workers)
+
+    def _upsert_documents(self, ids: list[str], docs: list[Document]) -> None:
+        """Embeds docs in batches and upserts them as points with the given ids."""
+        texts = [doc.page_content for doc in docs]
+        vectors = embed_in_batches(texts, self.embeddings, batch_size=self.batch_size)
+        self._ensure_collection(len(vectors[0]))
+        self.upload_points(
+            [
+                models.PointStruct(
+                    id=chunk_id,
+                    vector=vector,
+                    payload={"page_content": doc.page_content, "metadata": doc.metadata},
+                )
+                for chunk_id, vector, doc in zip(ids, vectors, docs)
+            ]
+        )
+        self.sparse_index.add_many(list(zip(ids, texts)))
+
+    def upload_points(self, points: list[models.PointStruct]) -> None:
+        """Upserts points in batches of upload_batch_size, upload_workers batches at a time.
+
+        Batches go over the shared client and are retried on transient errors. Each upsert
+        waits for the server to apply it, so the points are searchable on return.
+        """
+
+        def _upload(start: int) -> None:
+            batch = points[start : start + self.upload_batch_size]
+            with span("mpc_upsert_batch"):
+                self._with_retry(self.client.upsert, self.collection, points=batch, wait=True)
+            self.logger.debug(f"Upserted points {start}-{start + len(batch)} of {len(points)}.")
+
+        starts = range(0, len(points), self.upload_batch_size)
+        if self.upload_workers == 1 or len(starts) == 1:
+            for start in starts:
+                _upload(start)
+            return
+        with ThreadPoolExecutor(max_workers=self.upload_workers) as pool:
+            # list() re-raises the first failed batch
+            list(pool.map(_upload, starts))
+
+    def _with_retry(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        """Calls fn, retrying transient errors max_retries times with exponential backoff."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                if attempt == self.max_retries or not _is_transient(e):
+                    raise
+                delay = RETRY_BASE_DELAY * 2**attempt
+                self.logger.warning(f"Qdrant request failed ({e}), retrying in {delay:.1f}s.")
+                time.sleep(delay)
+
+    def _ensure_collection(self, vector_size: int) -> None:
+        """Creates the collection if needed and connects to it."""
+        if self.connected:
+            return
+        if not self.client.collection_exists(self.collection):
+            self.logger.info(f"Creating collection {self.collection}")
+            self.client.create_collection(
+                self.collection,
+                vectors_config=models.VectorParams(
+                    size=vector_size, distance=models.Distance.COSINE
+                ),
+            )
+        self._connect_collection()
+
+    def _connect_collection(self) -> None:
+        try:
+            # lookups and deletes filter on the source of each chunk
+            for field_name, field_schema in INDEXED_PAYLOAD_FIELDS.items():
+                self.client.create_payload_index(
+                    self.collection, field_name=field_name, field_schema=field_schema
+                )
+        except Exception as e:
+            raise Exception("Error [habitllm.model_persistant_context_system]: something went wrong externally.") from e
+        self.connected = True
+        self.logger.info(f"VectorStore, now connected to {self.collection}.")
+
+    def _load_manifest(self, path: Path | None = None) -> dict[str, dict]:
+        path = path or self.manifest_path
+        if path.is_file():
+            with open(path) as f:
+                return json.load(f)
+        return {}
+
+    def _forget_manifest(self, reason: str) -> None:
+        """Drops the ingestion manifest when it does not describe the collection, e.g. a
+        store that was wiped or another backend sharing file_dir, so all files are
+        ingested again (into the same point ids) instead of being skipped."""
+        self.logger.warning(f"The ingestion manifest {reason}, files will be ingested again.")
+        self.manifest = {}
+        self._write_manifest()
+
+    def _forget_unstored_files(self, page_size: int = 256) -> None:
+        """Drops the manifest entries of files whose first chunk is not in the collection,
+        e.g. after switching to a store (backend or path) that holds other files."""
+        first_chunks = {
+            next(iter(entry["chunks"])): source
+            for source, entry in self.manifest.items()
+            if entry["chunks"]
+        }
+        chunk_ids = list(first_chunks)
+        stored = set()
+        for start in range(0, len(chunk_ids), page_size):
+            records = self.client.retrieve(
+                self.collection,
+                chunk_ids[start : start + page_size],
+                with_payload=False,
+                with_vectors=False,
+            )
+            stored.update(str(record.id) for record in records)
+        unstored = [source for chunk_id, source in first_chunks.items() if chunk_id not in stored]
+        if unstored:
+            self.logger.warning(
+                f"{len(unstored)} files of the ingestion manifest are not in the collection, "
+                "they will be ingested again."
+            )
+            for source in unstored:
+                self.manifest.pop(source)
+            self._write_manifest()
+
+    def _write_manifest(self) -> None:
+        with atomic_write_path(self.manifest_path) as tmp:
+            with open(tmp, "w") as f:
+                json.dump(self.manifest, f)
+
+    def _save_manifest(self) -> None:
+        self._sparse_index_dirty = True
+        if not self._deferred_sparse_saves:
+            self._save_sparse_index()
+        with atomic_write_path(self.deleted_path) as tmp:
+            with open(tmp, "w") as f:
+                json.dump(self.deleted, f)
+        self._write_manifest()
+
+    def _load_deleted(self) -> dict[str, str]:
+        if self.deleted_path.is_file():
+            with open(self.deleted_path) as f:
+                return json.load(f)
+        return {}
+
+    def _was_deleted(self, file: str) -> bool:
+        """Whether file is unchanged since its persisted copy was deleted."""
+        deleted_hash = self.deleted.get(self._source_for(file))
+        return deleted_hash is not None and Path(file).is_file() and _hash_file(file) == deleted_hash
+
+    def _mark_deleted(self, source: str, entry: dict | None) -> None:
+        """Records source as deleted, with the hash of the content that was deleted."""
+        if entry is not None:
+            self.deleted[source] = entry["file_hash"]
+        elif Path(source).is_file():
+            self.deleted[source] = _hash_file(source)
+
+    @contextmanager
+    def deferred_sparse_index_saves(self) -> Iterator[None]:
+        """Saves the keyword index once on exit instead of with every manifest save inside.
+
+        For jobs that ingest or delete in many steps: saving the whole index each time
+        would make them quadratic in the corpus size. A job interrupted before the save
+        leaves an index that is rebuilt on the next start.
+        """
+        self._deferred_sparse_saves += 1
+        try:
+            yield
+        finally:
+            self._deferred_sparse_saves -= 1
+            if not self._deferred_sparse_saves and self._sparse_index_dirty:
+                self._save_sparse_index()
+
+    def _save_sparse_index(self) -> None:
+        self.sparse_index.save(self.sparse_index_path)
+        self._sparse_index_dirty = False
+        self._sparse_index_mtime = self._file_mtime(self.sparse_index_path)
+
+    def _load_sparse_index(self) -> BM25Index:
+        self._sparse_index_mtime = self._file_mtime(self.sparse_index_path)
+        index = BM25Index.load(self.sparse_index_path)
+        return index if index is not None else BM25Index()
+
+    @staticmethod
+    def _file_mtime(path: Path) -> int | None:
+        try:
+            return path.stat().st_mtime_ns
+        except OSError:
+            return None
+
+    def _rebuild_sparse_index(self, page_size: int = 1024) -> None:
+        """Builds the keyword index from the chunks stored in the collection."""
+        self.logger.info("Building keyword index of the persistent context.")
+        self.sparse_index = BM25Index()
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                self.collection,
+                limit=page_size,
+                offset=offset,
+                with_payload=["page_content"],
+                with_vectors=False,
+            )
+            self.sparse_index.add_many(
+                [(str(point.id), point.payload.get("page_content", "")) for point in points]
+            )
+            if offset is None:
+                break
+        self._save_sparse_index()
 
     def delete_files_from_vector_store(self, files: list[str]) -> None:
-        """Deltes files and their embeddings from the persistent context.
+        """Deletes files and their embeddings from the persistent context.
+
+        Embeddings are removed server-side with a single filtered delete on the indexed source field.
 
         Args:
-            file: List of filepaths to delete.
+            files: List of filepaths to delete.
         """
-        # deleted_files = delete_files_from_dest(self.file_dir, files)
-        # Qdrant.delete
-        pass
+        sources = list({self._source_for(file) for file in files})
+        if not sources:
+            return
+        if self.connected:
+            self._with_retry(
+                self.client.delete,
+                self.collection,
+                points_selector=models.FilterSelector(filter=_source_filter(*sources)),
+            )
+        for source in sources:
+            entry = self.manifest.pop(source, None)
+            if entry is not None:
+                self.sparse_index.remove(entry["chunks"])
+            self._mark_deleted(source, entry)
+        self._save_manifest()
+        self.version += 1
+        deleted_files = delete_files_from_dest(self.file_dir, sources)
+        self.logger.info(f"Deleted {len(sources)} files from persistent context: {deleted_files}")
 
-    def delete_concept_from_vector_store(self, concept_query: list[str]) -> None:
+    def delete_concept_from_vector_store(
+        self, concept_query: str | list[str], threshold: float = 0.8
+    ) -> None:
         """Deletes related embeddings from db.
 
         Uses similarity with concept_query to retrieve related vector embedding ids,
-        then deletes them from the db.
-        TODO: If no references to a file remains deletes that as well.
+        then deletes them from the db in batches.
+        If no references to a file remains deletes that as well.
+
+        Args:
+            concept_query: A text query (or list of queries) relating to a concept wished to be deleted.
+            threshold: Minimum similarity for an embedding to be considered part of the concept.
+        """
+        queries = [concept_query] if isinstance(concept_query, str) else concept_query
+        related: dict[str, str] = {}
+        for query in queries:
+            related.update(self._search_concept(query, threshold))
+        if not related:
+            self.logger.info("No embeddings related to concept found.")
+            return
+
+        orphaned_files = self.delete_points(related)
+        self.logger.info(
+            f"Deleted {len(related)} embeddings related to concept and {len(orphaned_files)} orphaned files."
+        )
+
+    def delete_points(self, points: dict[str, str | None]) -> list[str]:
+        """Deletes points in batches and removes files left without any points.
+
+        Args:
+            points: Mapping of point id to the source file of its chunk.
+
+        Returns:
+            The orphaned files that were deleted.
+        """
+        ids = list(points)
+        for start in range(0, len(ids), self.batch_size):
+            self._with_retry(
+                self.client.delete,
+                self.collection,
+                points_selector=models.PointIdsList(points=ids[start : start + self.batch_size]),
+            )
+        self.sparse_index.remove(ids)
+        self.version += 1
+
+        deleted_ids = set(ids)
+        orphaned_files = []
+        for source in set(points.values()) - {None}:
+            entry = self.manifest.get(source)
+            if entry is not None:
+                entry["chunks"] = {
+                    chunk_id: chunk_hash
+                    for chunk_id, chunk_hash in entry["chunks"].items()
+                    if chunk_id not in deleted_ids
+                }
+            if self._count_source_points(source) == 0:
+                orphaned_files.append(source)
+                self._mark_deleted(source, self.manifest.pop(source, None))
+        self._save_manifest()
+        if orphaned_files:
+            delete_files_from_dest(self.file_dir, orphaned_files)
+        return orphaned_files
+
+    def scan_duplicates(
+        self, offset=None, seen: set[str] | None = None, page_size: int = 1024
+    ) -> Iterator[tuple[object, dict[str, str | None], set[str]]]:
+        """Pages through the collection finding chunks whose content was already seen.
+
+        The scan can be resumed from any yielded (offset, seen) pair.
+
+        Args:
+            offset: Scroll offset to start from.
+            seen: Chunk hash prefixes already seen before offset.
+            page_size: Points per page.
+
+        Yields:
+            The offset after the page, duplicate point ids of the page mapped to their source,
+            and the chunk hash prefixes seen so far.
+        """
+        if not self.connected:
+            return
+        seen = set() if seen is None else seen
+        while True:
+            points, next_offset = self.client.scroll(
+                self.collection,
+                limit=page_size,
+                offset=offset,
+                with_payload=["metadata.chunk_hash", SOURCE_KEY],
+                with_vectors=False,
+            )
+            duplicates = {}
+            for point in points:
+                metadata = (point.payload or {}).get("metadata", {})
+                chunk_hash = metadata.get("chunk_hash")
+                if chunk_hash is None:
+                    continue
+                # 64 bits of the sha256 keep the seen set small
+                key = chunk_hash[:16]
+                if key in seen:
+                    duplicates[str(point.id)] = metadata.get("source")
+                else:
+                    seen.add(key)
+            yield next_offset, duplicates, seen
+            if next_offset is None:
+                return
+            offset = next_offset
+
+    def compact_vector_store(self, wait_timeout: float = 300.0) -> None:
+        """Drops embeddings of files that no longer exist, removes files without embeddings
+        and lets the optimizer vacuum deleted points.
+
+        Args:
+            wait_timeout: Seconds to wait for the optimizer to finish.
+        """
+        missing = [source for source in self.manifest if not Path(source).is_file()]
+        if missing:
+            self.logger.info(f"Removing embeddings of {len(missing)} missing files.")
+            self.delete_files_from_vector_store(missing)
+
+        if not self.connected:
+            return
+        stray_files = [
+            str(file)
+            for file in Path(self.file_dir).iterdir()
+            if file.is_file() and self._count_source_points(str(file)) == 0
+        ]
+        if stray_files:
+            self.logger.info(f"Removing {len(stray_files)} files without embeddings.")
+            for file in stray_files:
+                self.manifest.pop(file, None)
+            self._save_manifest()
+            delete_files_from_dest(self.file_dir, stray_files)
+
+        self.client.update_collection(
+            self.collection,
+            optimizers_config=models.OptimizersConfigDiff(deleted_threshold=0.0),
+        )
+        self._wait_for_optimizer(wait_timeout)
+
+    def export_snapshot(self, out_dir: str, vector_dtype: str = "float16", page_size: int = 1024) -> dict:
+        """Writes the collection, ingestion manifest and ingested files as a snapshot bundle.
+
+        Args:
+            out_dir: Bundle directory, see snapshot.
+            vector_dtype: "float16" (half the size, no loss that affects search), "int8"
+                (a quarter, with a per vector scale) or "float32".
+            page_size: Points read from the collection per request.
+
+        Returns:
+            The bundle's manifest.
+        """
+        from .snapshot import write_snapshot
+
+        if not self.connected:
+            raise ValueError(f"Collection {self.collection} does not exist, nothing to export")
+
+        def pages():
+            offset = None
+            while True:
+                points, offset = self.client.scroll(
+                    self.collection, limit=page_size, offset=offset, with_payload=True, with_vectors=True
+                )
+                yield (
+                    [str(point.id) for point in points],
+                    np.asarray([point.vector for point in points], dtype=np.float32),
+                    [point.payload for point in points],
+                )
+                if offset is None:
+                    return
+
+        with span("mpc_snapshot_export"):
+            manifest = write_snapshot(
+                out_dir,
+                pages(),
+                self.client.count(self.collection, exact=True).count,
+                vector_dtype,
+                files=[file for file in self.manifest if Path(file).is_file()],
+                collection=self.collection,
+                embedding_model=getattr(self.embeddings, "model_name", None),
+                file_dir=str(Path(self.file_dir).resolve()),
+                ingest_manifest=self.manifest,
+            )
+        self.logger.info(f"Exported {manifest['count']} points to snapshot {out_dir}.")
+        return manifest
+
+    def import_snapshot(self, snapshot_dir: str, overwrite: bool = False, force: bool = False) -> int:
+        """Bulk-loads a snapshot bundle into the collection, without embedding anything.
+
+        Sources recorded under the exporting node's file_dir are moved to this one's, and
+        the bundled files are copied into it.
+
+        Args:
+            snapshot_dir: Bundle written by export_snapshot.
+            overwrite: Replace the collection if it already exists.
+            force: Import vectors of another embedding model than the configured one.
+
+        Returns:
+            Number of points imported.
+        """
+        from .snapshot import read_snapshot
+
+        snapshot = read_snapshot(snapshot_dir)
+        manifest = snapshot.manifest
+        model = getattr(self.embeddings, "model_name", None)
+        if not force and None not in (model, manifest["embedding_model"]) and model != manifest["embedding_model"]:
+            raise ValueError(
+                f"Snapshot was embedded with {manifest['embedding_model']}, this node uses {model}"
+            )
+        if self.client.collection_exists(self.collection):
+            if not overwrite:
+                raise ValueError(f"Collection {self.collection} already exists, see overwrite")
+            self.client.delete_collection(self.collection)
+            self.connected = False
+            self.sparse_index = BM25Index()
+
+        old_dir, new_dir = manifest["file_dir"], str(Path(self.file_dir).resolve())
+
+        def relocate(source: str) -> str:
+            if source is not None and Path(source).parent == Path(old_dir):
+                return str(Path(new_dir) / Path(source).name)
+            return source
+
+        Path(self.file_dir).mkdir(parents=True, exist_ok=True)
+        for file in snapshot.files:
+            shutil.copyfile(file, Path(self.file_dir) / file.name)
+
+        self._ensure_collection(manifest["dim"])
+        imported = 0
+        with span("mpc_snapshot_import"):
+            for ids, vectors, payloads in snapshot.pages(self._flush_size):
+                for payload in payloads:
+                    if "source" in payload["metadata"]:
+                        payload["metadata"]["source"] = relocate(payload["metadata"]["source"])
+                self.upload_points(
+                    [
+                        models.PointStruct(id=point_id, vector=vector.tolist(), payload=payload)
+                        for point_id, vector, payload in zip(ids, vectors, payloads)
+                    ]
+                )
+                self.sparse_index.add_many(
+                    [(point_id, payload["page_content"]) for point_id, payload in zip(ids, payloads)]
+                )
+                imported += len(ids)
+        self.manifest = {relocate(file): entry for file, entry in snapshot.ingest_manifest.items()}
+        self.deleted = {}
+        self._save_manifest()
+        self.version += 1
+        self.logger.info(f"Imported {imported} points from snapshot {snapshot_dir}.")
+        return imported
+
+    def reindex_vector_store(
+        self,
+        hnsw_m: int = 16,
+        ef_construct: int = 100,
+        quantize: bool = False,
+        indexing_threshold: int = 20000,
+        wait_timeout: float = 300.0,
+        latency_samples: int = 20,
+    ) -> ReindexReport | None:
+        """Reindex the db to keep access performant.
+
+        Applies the HNSW parameters, creates the payload indexes used by filters and optionally
+        enables int8 scalar quantization (quantized vectors in RAM, originals on disk), then lets
+        the optimizer rebuild the segments.
 
         Args:
-            concept_query: A text query relating to a concept wished to be deleted.
+            hnsw_m: Number of edges per node in the HNSW graph.
+            ef_construct: Size of the candidate list while building the HNSW graph.
+            quantize: Whether to enable int8 scalar quantization.
+            indexing_threshold: Segment size (in KB) above which the optimizer builds an HNSW index.
+            wait_timeout: Seconds to wait for the optimizer to finish.
+            latency_samples: Number of stored vectors used as queries to measure search latency.
+
+        Returns:
+            Collection stats before and after reindexing, or None if there is no collection yet.
         """
-        pass
+        if not self.connected:
+            self.logger.info("No collection to reindex.")
+            return None
+
+        before = self._collection_stats(latency_samples)
+        self.logger.info(f"Reindexing {self.collection}. {before}")
+
+        for field_name, field_schema in INDEXED_PAYLOAD_FIELDS.items():
+            self.client.create_payload_index(
+                self.collection, field_name=field_name, field_schema=field_schema
+            )
+        self.client.update_collection(
+            self.collection,
+            hnsw_config=models.HnswConfigDiff(m=hnsw_m, ef_construct=ef_construct),
+            vectors_config={"": models.VectorParamsDiff(on_disk=True)} if quantize else None,
+            quantization_config=(
+                models.ScalarQuantization(
+                    scalar=models.ScalarQuantizationConfig(
+                        type=models.ScalarType.INT8, quantile=0.99, always_ram=True
+                    )
+                )
+                if quantize
+                else None
+            ),
+            # config changes make the server rebuild segments with the optimizer
+            optimizers_config=models.OptimizersConfigDiff(indexing_threshold=indexing_threshold),
+        )
+        self._wait_for_optimizer(wait_timeout)
+
+        report = ReindexReport(before=before, after=self._collection_stats(latency_samples))
+        self.logger.info(f"Reindex complete. {report.after}")
+        return report
 
-    def reindex_vector_store(self) -> None:
-        """Reindex the db to keep access performant."""
-        pass
+    def _wait_for_optimizer(self, timeout: float) -> None:
+        deadline = time.monotonic() + timeout
+        while self.client.get_collection(self.collection).status != models.CollectionStatus.GREEN:
+            if time.monotonic() > deadline:
+                self.logger.warning(f"Optimizer did not finish within {timeout}s.")
+                return
+            time.sleep(0.5)
+
+    def _collection_stats(self, latency_samples: int) -> CollectionStats:
+        info = self.client.get_collection(self.collection)
+        vectors = self.client.count(self.collection, exact=True).count
+        samples, _ = self.client.scroll(
+            self.collection, limit=latency_samples, with_payload=False, with_vectors=True
+        )
+        latencies = []
+        for point in samples:
+            start = time.perf_counter()
+            self.client.search(self.collection, query_vector=point.vector, limit=4)
+            latencies.append((time.perf_counter() - start) * 1000)
+        return CollectionStats(
+            vectors=vectors,
+            segments=info.segments_count,
+            search_latency_ms=statistics.median(latencies) if latencies else 0.0,
+        )
 
     def perform_similarity_search(
-        self, query: str, retrieve_num: int = 4
+        self, query: str, retrieve_num: int = 4, embedding: list[float] | None = None
     ) -> list[tuple[Document, float]]:
-        if self.db is not None:
-            return self.db.similarity_search_with_relevance_scores(query, k=retrieve_num)
-        else:
+        """Retrieves the chunks most similar to query.
+
+        Args:
+            query: Text query.
+            retrieve_num: Number of chunks to retrieve.
+            embedding: Precomputed embedding of query. Computed with the shared embedding service if not given.
+
+        Returns:
+            Retrieved documents with their relevance scores.
+        """
+        return [
+            (doc, score)
+            for doc, score, _ in self._search(query, retrieve_num, embedding, with_vectors=False)
+        ]
+
+    def perform_similarity_search_with_vectors(
+        self, query: str, retrieve_num: int = 4, embedding: list[float] | None = None
+    ) -> list[tuple[Document, float, list[float]]]:
+        """Like perform_similarity_search, but also returns the stored vector of each chunk."""
+        return self._search(query, retrieve_num, embedding, with_vectors=True)
+
+    def _search(
+        self, query: str, retrieve_num: int, embedding: list[float] | None, with_vectors: bool
+    ) -> list[tuple[Document, float, list[float] | None]]:
+        if not self.connected:
+            return []
+        if embedding is None:
+            embedding = self.embeddings.embed_query(query)
+        points = self.client.search(
+            self.collection,
+            query_vector=embedding,
+            limit=retrieve_num,
+            with_payload=True,
+            with_vectors=with_vectors,
+        )
+        return [
+            (
+                Document(
+                    page_content=point.payload.get("page_content", ""),
+                    metadata={**point.payload.get("metadata", {}), "_id": point.id},
+                ),
+                # cosine similarity, rescaled like the inference specific context's scores
+                relevance_from_cosine(point.score),
+                point.vector,
+            )
+            for point in points
+        ]
+
+    def perform_hybrid_search_with_vectors(
+        self,
+        query: str,
+        retrieve_num: int = 4,
+        embedding: list[float] | None = None,
+        dense: bool = True,
+    ) -> list[tuple[Document, float, list[float]]]:
+        """Fuses keyword (BM25) and vector search results by reciprocal rank.
+
+        Args:
+            query: User query.
+            retrieve_num: Number of results.
+            embedding: Query embedding, computed if needed and not given.
+            dense: Whether to run the vector search. Without it, only keyword matches are
+                returned (and no query embedding is computed), unless there are none.
+
+        Returns:
+            (chunk, fused score, stored vector) triples, best first.
+        """
+        if not self.connected:
             return []
+        with span("mpc_sparse_search"):
+            sparse_ids = [doc_id for doc_id, _ in self.sparse_index.search(query, retrieve_num)]
+        results = {}
+        if dense or not sparse_ids:
+            for doc, score, vector in self.perform_similarity_search_with_vectors(
+                query, retrieve_num=retrieve_num, embedding=embedding
+            ):
+                results[str(doc.metadata["_id"])] = (doc, vector)
+        fused = reciprocal_rank_fusion(list(results), sparse_ids)[:retrieve_num]
 
-    def lookup_file_ids(self, file: str) -> list[int]:
+        missing = [doc_id for doc_id, _ in fused if doc_id not in results]
+        if missing:
+            for point in self.client.retrieve(
+                self.collection, ids=missing, with_payload=True, with_vectors=True
+            ):
+                doc = Document(
+                    page_content=point.payload.get("page_content", ""),
+                    metadata={**point.payload.get("metadata", {}), "_id": point.id},
+                )
+                results[str(point.id)] = (doc, point.vector)
+        return [
+            (results[doc_id][0], score, results[doc_id][1])
+            for doc_id, score in fused
+            if doc_id in results
+        ]
+
+    def lookup_file_ids(self, file: str) -> list[str]:
         """Get list of embedding ids in db sourced from file.
 
         Args:
-            file: Filepath to lookup ids for.
+            file: Filepath to lookup ids for. Either the original or the persisted copy.
 
         Returns:
             The ids of embeddings that come from file.
         """
-        return []
+        if not self.connected:
+            return []
+        source_filter = _source_filter(self._source_for(file))
+        ids: list[str] = []
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                self.collection,
+                scroll_filter=source_filter,
+                limit=1024,
+                offset=offset,
+                with_payload=False,
+                with_vectors=False,
+            )
+            ids.extend(str(point.id) for point in points)
+            if offset is None:
+                return ids
+
+    def _source_for(self, file: str) -> str:
+        """Maps a filepath to the source recorded for its persisted copy."""
+        return str(Path(self.file_dir) / Path(file).name)
 
-    def get_ids_from_concept(self, concept_query: str) -> list[int]:
+    def get_ids_from_concept(self, concept_query: str, threshold: float = 0.8) -> list[str]:
         """Get ids related to concept
 
         Args:
-            concept_query: _description_
+            concept_query: A text query relating to a concept.
+            threshold: Minimum similarity for an embedding to be considered part of the concept.
 
         Returns:
-            _description_
+            The ids of embeddings related to concept_query.
         """
-        return []
+        return list(self._search_concept(concept_query, threshold))
+
+    def _search_concept(self, concept_query: str, threshold: float) -> dict[str, str]:
+        """Pages through all embeddings above threshold, mapping their ids to their source."""
+        if not self.connected:
+            return {}
+        query_vector = self.embeddings.embed_query(concept_query)
+        related: dict[str, str] = {}
+        offset = 0
+        while True:
+            points = self.client.search(
+                self.collection,
+                query_vector=query_vector,
+                limit=self.batch_size,
+                offset=offset,
+                score_threshold=threshold,
+                with_payload=[SOURCE_KEY],
+            )
+            for point in points:
+                related[str(point.id)] = (point.payload or {}).get("metadata", {}).get("source")
+            if len(points) < self.batch_size:
+                return related
+            offset += len(points)
+
+    def _count_source_points(self, source: str) -> int:
+        return self.client.count(
+            self.collection,
+            count_filter=_source_filter(source),
+            exact=True,
+        ).count
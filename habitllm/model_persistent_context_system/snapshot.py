@@ -0,0 +1,267 @@
+"""
+Snapshot bundles of the persistent context, loaded into another node without re-embedding.
+
+A bundle is a directory holding:
+
+    manifest.json          format version, collection, point count, vector dim and dtype,
+                           embedding model, source file_dir, payload chunks and checksums
+    vectors.npy            (count, dim) vectors as float16, int8 or float32
+    scales.npy             (count,) float32 scale of each int8 vector
+    payloads/NNNNNN.json.gz
+                           ids and payloads of consecutive points, in vector order, in
+                           columns: page_content and one column per metadata key
+    ingest_manifest.json   the ingestion manifest, so incremental ingestion carries on
+    files/                 the ingested files, which compaction checks the chunks against
+
+Bundles are written and read a page at a time, so memory does not grow with the
+collection.
+"""
+
+from contextlib import ExitStack
+from dataclasses import dataclass
+import gzip
+import hashlib
+import json
+from pathlib import Path
+import shutil
+import time
+from typing import Iterable, Iterator
+
+import numpy as np
+
+from ..utils import atomic_write_path
+
+SNAPSHOT_FORMAT = 2
+VECTOR_DTYPES = ("float16", "int8", "float32")
+
+
+def quantize(vectors: np.ndarray, dtype: str) -> tuple[np.ndarray, np.ndarray | None]:
+    """Stores vectors as dtype. int8 uses a symmetric scale per vector, returned alongside."""
+    if dtype not in VECTOR_DTYPES:
+        raise ValueError(f"Unknown snapshot vector dtype {dtype!r}, expected one of {VECTOR_DTYPES}")
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if dtype != "int8":
+        return vectors.astype(dtype), None
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+
+def dequantize(vectors: np.ndarray, scales: np.ndarray | None = None) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors * scales[:, None] if scales is not None else vectors
+
+
+def _columns(ids: list[str], payloads: list[dict]) -> dict:
+    keys = list(dict.fromkeys(key for payload in payloads for key in payload.get("metadata", {})))
+    return {
+        "ids": ids,
+        "page_content": [payload.get("page_content", "") for payload in payloads],
+        # a key missing from a chunk's metadata is None in its column
+        "metadata": {
+            key: [payload.get("metadata", {}).get(key) for payload in payloads] for key in keys
+        },
+    }
+
+
+def _rows(columns: dict) -> list[dict]:
+    metadata = columns["metadata"]
+    return [
+        {
+            "page_content": page_content,
+            "metadata": {key: values[i] for key, values in metadata.items() if values[i] is not None},
+        }
+        for i, page_content in enumerate(columns["page_content"])
+    ]
+
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _write_json(path: Path, data, compress: bool = False) -> None:
+    with atomic_write_path(path) as tmp:
+        with (gzip.open(tmp, "wt") if compress else open(tmp, "w")) as f:
+            json.dump(data, f)
+
+
+def write_snapshot(
+    out_dir: str,
+    pages: Iterable[tuple[list[str], np.ndarray, list[dict]]],
+    count: int,
+    vector_dtype: str = "float16",
+    files: Iterable[str] = (),
+    **info,
+) -> dict:
+    """Writes a bundle of the points in pages, one page at a time.
+
+    Args:
+        out_dir: Bundle directory, created if needed.
+        pages: (ids, vectors, payloads) of consecutive pages of points.
+        count: Number of points in pages, the size of the preallocated vector file. Pages
+            may hold fewer points (e.g. some were deleted meanwhile), but not more.
+        vector_dtype: One of VECTOR_DTYPES.
+        files: Ingested files to bundle.
+        **info: Recorded in the manifest, e.g. collection, embedding_model, file_dir and
+            ingest_manifest (written to its own file).
+
+    Returns:
+        The manifest.
+
+    Raises:
+        ValueError: There are no points, or more than count.
+    """
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    # an earlier bundle in out_dir is incomplete until the new manifest is written
+    (out / "manifest.json").unlink(missing_ok=True)
+    (out / "scales.npy").unlink(missing_ok=True)
+    shutil.rmtree(out / "payloads", ignore_errors=True)
+    (out / "payloads").mkdir()
+    if vector_dtype not in VECTOR_DTYPES:
+        raise ValueError(f"Unknown snapshot vector dtype {vector_dtype!r}, expected one of {VECTOR_DTYPES}")
+
+    written = ["vectors.npy"]
+    chunks = []
+    with ExitStack() as stack:
+        # both are preallocated for count points and filled page by page
+        vectors_tmp = stack.enter_context(atomic_write_path(out / "vectors.npy"))
+        if vector_dtype == "int8":
+            scales_tmp = stack.enter_context(atomic_write_path(out / "scales.npy"))
+            written.append("scales.npy")
+        vectors = scales = None
+        stored = 0
+        for page_ids, page_vectors, page_payloads in pages:
+            if not page_ids:
+                continue
+            if stored + len(page_ids) > count:
+                raise ValueError("The collection grew while it was exported, export it again")
+            quantized, page_scales = quantize(page_vectors, vector_dtype)
+            if vectors is None:
+                vectors = np.lib.format.open_memmap(
+                    vectors_tmp, mode="w+", dtype=quantized.dtype, shape=(count, quantized.shape[1])
+                )
+                if page_scales is not None:
+                    scales = np.lib.format.open_memmap(
+                        scales_tmp, mode="w+", dtype=np.float32, shape=(count,)
+                    )
+            vectors[stored : stored + len(page_ids)] = quantized
+            if scales is not None:
+                scales[stored : stored + len(page_ids)] = page_scales
+            name = f"payloads/{len(chunks):06d}.json.gz"
+            _write_json(out / name, _columns(page_ids, page_payloads), compress=True)
+            chunks.append({"file": name, "count": len(page_ids)})
+            written.append(name)
+            stored += len(page_ids)
+        if vectors is None:
+            raise ValueError("Nothing to snapshot, the collection is empty")
+        dim = int(vectors.shape[1])
+        # closed before atomic_write_path moves them into place
+        vectors.flush()
+        del vectors
+        if scales is not None:
+            scales.flush()
+            del scales
+
+    for file in files:
+        target = out / "files" / Path(file).name
+        target.parent.mkdir(exist_ok=True)
+        shutil.copyfile(file, target)
+        written.append(f"files/{target.name}")
+
+    _write_json(out / "ingest_manifest.json", info.pop("ingest_manifest", {}))
+    written.append("ingest_manifest.json")
+
+    manifest = {
+        "format": SNAPSHOT_FORMAT,
+        "created": time.time(),
+        # points deleted during the export leave unused rows at the end of vectors.npy
+        "count": stored,
+        "dim": dim,
+        "vector_dtype": vector_dtype,
+        "distance": "cosine",
+        "payload_chunks": chunks,
+        **info,
+        "checksums": {name: _sha256(out / name) for name in written},
+    }
+    # written last: a bundle without a manifest is incomplete
+    _write_json(out / "manifest.json", manifest)
+    return manifest
+
+
+@dataclass
+class Snapshot:
+    """A bundle opened for import. Vectors are memory-mapped, payloads read a chunk at a time."""
+
+    path: Path
+    manifest: dict
+    vectors: np.ndarray
+    scales: np.ndarray | None
+    ingest_manifest: dict
+
+    @property
+    def files(self) -> list[Path]:
+        return sorted((self.path / "files").glob("*"))
+
+    def _chunks(self) -> Iterator[tuple[list[str], list[dict]]]:
+        for chunk in self.manifest["payload_chunks"]:
+            with gzip.open(self.path / chunk["file"], "rt") as f:
+                columns = json.load(f)
+            yield columns["ids"], _rows(columns)
+
+    def pages(self, page_size: int) -> Iterator[tuple[list[str], np.ndarray, list[dict]]]:
+        """(ids, float32 vectors, payloads) of consecutive pages of page_size points."""
+        ids: list[str] = []
+        payloads: list[dict] = []
+        start = 0
+        for chunk_ids, chunk_payloads in self._chunks():
+            ids.extend(chunk_ids)
+            payloads.extend(chunk_payloads)
+            while len(ids) >= page_size:
+                yield self._page(start, ids[:page_size], payloads[:page_size])
+                start += page_size
+                ids, payloads = ids[page_size:], payloads[page_size:]
+        if ids:
+            yield self._page(start, ids, payloads)
+
+    def _page(self, start: int, ids: list[str], payloads: list[dict]):
+        stop = start + len(ids)
+        scales = self.scales[start:stop] if self.scales is not None else None
+        return ids, dequantize(self.vectors[start:stop], scales), payloads
+
+
+def read_snapshot(snapshot_dir: str, verify: bool = True) -> Snapshot:
+    """Opens a bundle written by write_snapshot.
+
+    Args:
+        snapshot_dir: Bundle directory.
+        verify: Check the files against the manifest's checksums first.
+
+    Raises:
+        ValueError: The bundle is incomplete, corrupt or of an unknown format.
+    """
+    path = Path(snapshot_dir)
+    manifest_path = path / "manifest.json"
+    if not manifest_path.is_file():
+        raise ValueError(f"{snapshot_dir} is not a complete snapshot, manifest.json is missing")
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    if manifest.get("format") != SNAPSHOT_FORMAT:
+        raise ValueError(f"Unsupported snapshot format {manifest.get('format')!r}")
+    if verify:
+        for name, checksum in manifest["checksums"].items():
+            if not (path / name).is_file() or _sha256(path / name) != checksum:
+                raise ValueError(f"Snapshot file {name} is missing or corrupt")
+
+    vectors = np.load(path / "vectors.npy", mmap_mode="r")
+    scales = np.load(path / "scales.npy", mmap_mode="r") if manifest["vector_dtype"] == "int8" else None
+    with open(path / "ingest_manifest.json") as f:
+        ingest_manifest = json.load(f)
+    chunked = sum(chunk["count"] for chunk in manifest["payload_chunks"])
+    if not chunked == manifest["count"] <= len(vectors):
+        raise ValueError("Snapshot vectors and payloads disagree on the number of points")
+    return Snapshot(path, manifest, vectors, scales, ingest_manifest)
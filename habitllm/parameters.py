@@ -32,6 +32,12 @@ def get_active_routine() -> str:
 def get_routine_choices() -> str:
     return Parameters.getInstance().hyperparameters['routines']['categories']
 
+def get_uptime_routine_policy() -> str:
+    return Parameters.getInstance().hyperparameters['uptime routine policy']['default']
+
+def get_uptime_throttle_seconds() -> float:
+    return Parameters.getInstance().hyperparameters['uptime throttle seconds']['default']
+
 def get_is_inference_specific_context() -> bool:
     return Parameters.getInstance().hyperparameters['inference specific context']['default']
 
@@ -44,6 +50,105 @@ def get_is_model_persistent_context() -> bool:
 def get_model_persistent_context_chunks() -> int:
     return Parameters.getInstance().hyperparameters['model persistent context chunks']['default']
 
+def get_query_embedding_cache_size() -> int:
+    return Parameters.getInstance().hyperparameters['query embedding cache size']['default']
+
+def get_ingestion_workers() -> int:
+    return Parameters.getInstance().hyperparameters['ingestion workers']['default']
+
+def get_chunk_tokens() -> int | None:
+    return Parameters.getInstance().hyperparameters['chunk tokens']['default']
+
+def get_chunk_overlap_tokens() -> int:
+    return Parameters.getInstance().hyperparameters['chunk overlap tokens']['default']
+
+def get_embedding_backend() -> str:
+    return Parameters.getInstance().hyperparameters['embedding backend']['default']
+
+def get_embedding_threads() -> int:
+    return Parameters.getInstance().hyperparameters['embedding threads']['default']
+
+def get_max_pending_ingestion_jobs() -> int:
+    return Parameters.getInstance().hyperparameters['max pending ingestion jobs']['default']
+
+def get_mpc_backend() -> str:
+    return Parameters.getInstance().hyperparameters['mpc backend']['default']
+
+def get_mpc_storage_path() -> str:
+    return Parameters.getInstance().hyperparameters['mpc storage path']['default']
+
+def get_mpc_prefer_grpc() -> bool:
+    return Parameters.getInstance().hyperparameters['mpc prefer grpc']['default']
+
+def get_mpc_grpc_port() -> int:
+    return Parameters.getInstance().hyperparameters['mpc grpc port']['default']
+
+def get_mpc_timeout_seconds() -> int:
+    return Parameters.getInstance().hyperparameters['mpc timeout seconds']['default']
+
+def get_mpc_upload_batch_size() -> int:
+    return Parameters.getInstance().hyperparameters['mpc upload batch size']['default']
+
+def get_mpc_upload_workers() -> int:
+    return Parameters.getInstance().hyperparameters['mpc upload workers']['default']
+
+def get_mpc_max_retries() -> int:
+    return Parameters.getInstance().hyperparameters['mpc max retries']['default']
+
+def get_isc_session_scope() -> str:
+    return Parameters.getInstance().hyperparameters['isc session scope']['default']
+
+def get_isc_memory_budget_mb() -> float:
+    return Parameters.getInstance().hyperparameters['isc memory budget mb']['default']
+
+def get_isc_index_tiers() -> list[dict]:
+    return Parameters.getInstance().hyperparameters['isc index tiers']['default']
+
+def get_embedding_batch_size() -> int:
+    return Parameters.getInstance().hyperparameters['embedding batch size']['default']
+
+def get_retrieval_deadline_ms() -> int:
+    return Parameters.getInstance().hyperparameters['retrieval deadline ms']['default']
+
+def get_context_token_budget_fraction() -> float:
+    return Parameters.getInstance().hyperparameters['context token budget fraction']['default']
+
+def get_prompt_layout() -> str:
+    return Parameters.getInstance().hyperparameters['prompt layout']['default']
+
+def get_stable_context_overlap() -> float:
+    return Parameters.getInstance().hyperparameters['stable context overlap']['default']
+
+def get_mmr_lambda() -> float:
+    return Parameters.getInstance().hyperparameters['mmr lambda']['default']
+
+def get_retrieval_cache_size() -> int:
+    return Parameters.getInstance().hyperparameters['retrieval cache size']['default']
+
+def get_retrieval_cache_ttl() -> float:
+    return Parameters.getInstance().hyperparameters['retrieval cache ttl seconds']['default']
+
+def get_is_retrieval_logit_bias() -> bool:
+    return Parameters.getInstance().hyperparameters['retrieval logit bias']['default']
+
+def get_logit_bias_strength() -> float:
+    return Parameters.getInstance().hyperparameters['logit bias strength']['default']
+
+def get_logit_bias_max_tokens() -> int:
+    return Parameters.getInstance().hyperparameters['logit bias max tokens']['default']
+
+def get_is_interaction_memory() -> bool:
+    return Parameters.getInstance().hyperparameters['interaction memory']['default']
+
+def get_interaction_log_max_bytes() -> int:
+    return Parameters.getInstance().hyperparameters['interaction log max bytes']['default']
+
+def get_interaction_log_flush_seconds() -> float:
+    return Parameters.getInstance().hyperparameters['interaction log flush seconds']['default']
+
+def get_is_instrumentation_enabled() -> bool:
+    return Parameters.getInstance().hyperparameters['instrumentation']['default']
+
 def set_active_routine(value: str):
     Parameters.getInstance().hyperparameters['routines']['default'] = value
 
@@ -53,6 +158,9 @@ def set_is_inference_specific_context(value: bool):
 def set_is_model_persistent_context(value: bool):
     Parameters.getInstance().hyperparameters['model persistent context']['default'] = value
     
+def set_is_instrumentation_enabled(value: bool):
+    Parameters.getInstance().hyperparameters['instrumentation']['default'] = value
+
 def set_inference_specific_context_chunks(value: int):
     Parameters.getInstance().hyperparameters['inference specific context chunks']['default'] = value
 
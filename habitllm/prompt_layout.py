@@ -0,0 +1,147 @@
+"""Prompt layouts for retrieved context that keep the prompt prefix stable across turns."""
+
+from collections import OrderedDict
+import threading
+
+import numpy as np
+
+from .context_assembler import Candidate
+
+# "inline" puts all retrieved chunks, most relevant first, in front of the user turn.
+# "prefix-cache" puts the persistent context in a stable block at the front of the
+# prompt and only the per-turn chunks in the user turn, so loaders with prompt/KV
+# prefix caching (llama.cpp, exllama) can reuse the prefill of everything before it.
+LAYOUTS = ("inline", "prefix-cache")
+
+
+def stable_order(chunks: list[Candidate]) -> list[Candidate]:
+    """Orders chunks by source and position instead of relevance, so a set always renders the same."""
+    return sorted(
+        chunks,
+        key=lambda chunk: (
+            str(chunk.metadata.get("source", "")),
+            chunk.metadata.get("start_index") or 0,
+            chunk.content_hash,
+        ),
+    )
+
+
+def overlap(block: list[Candidate], retrieved: list[Candidate]) -> float:
+    """Fraction of the retrieved chunks already in block, 1.0 if nothing was retrieved."""
+    if not retrieved:
+        return 1.0
+    in_block = {chunk.content_hash for chunk in block}
+    return sum(chunk.content_hash in in_block for chunk in retrieved) / len(retrieved)
+
+
+def render_context(chunks: list[Candidate]) -> str:
+    return "\n\n".join(chunk.content for chunk in chunks)
+
+
+class StableContextBlocks:
+    """
+    The persistent context block of each chat, replaced only when retrieval moved on.
+
+    Each turn the chunks retrieved from the persistent context are compared with the
+    chat's current block. While at least threshold of them are in the block, the block
+    is kept as it is (and the prompt prefix with it); otherwise the retrieved chunks, in
+    stable_order, become the new block.
+
+    Args:
+        threshold: Minimum overlap, see overlap(), for keeping the current block.
+        max_sessions: Chats whose block is remembered, least recently used are dropped.
+    """
+
+    def __init__(self, threshold: float, max_sessions: int = 256) -> None:
+        self.threshold = threshold
+        self.max_sessions = max_sessions
+        self._blocks: OrderedDict[str, list[Candidate]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.kept = 0
+        self.replaced = 0
+
+    def update(self, session: str, retrieved: list[Candidate]) -> tuple[list[Candidate], bool]:
+        """The block of session for this turn.
+
+        Returns:
+            The block's chunks in stable order, and whether it changed this turn.
+        """
+        with self._lock:
+            block = self._blocks.get(session)
+            if block is not None and overlap(block, retrieved) >= self.threshold:
+                self._blocks.move_to_end(session)
+                self.kept += 1
+                return block, False
+            block = stable_order(retrieved)
+            self._blocks[session] = block
+            self._blocks.move_to_end(session)
+            while len(self._blocks) > self.max_sessions:
+                self._blocks.popitem(last=False)
+            self.replaced += 1
+            return block, True
+
+    def reset(self, session: str) -> None:
+        with self._lock:
+            self._blocks.pop(session, None)
+
+    def __str__(self) -> str:
+        turns = self.kept + self.replaced
+        kept = self.kept / turns if turns else 0.0
+        return f"{len(self._blocks)} chats, block kept on {kept:.1%} of {turns} turns"
+
+
+class PrefixReuse:
+    """
+    Measures how many tokens of each prompt repeat the start of the chat's previous
+    prompt, i.e. how much a prefix cache could skip prefilling.
+
+    Args:
+        max_sessions: Chats whose last prompt is remembered.
+    """
+
+    def __init__(self, max_sessions: int = 256) -> None:
+        self.max_sessions = max_sessions
+        self._previous: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+        self.reused_tokens = 0
+        self.prompt_tokens = 0
+        self.last_ratio: float | None = None
+
+    def observe(self, session: str, token_ids) -> int:
+        """Records the prompt of this turn.
+
+        Args:
+            session: Chat the prompt belongs to.
+            token_ids: Token ids of the whole prompt.
+
+        Returns:
+            Number of leading tokens shared with the previous prompt of session.
+        """
+        ids = np.asarray(token_ids, dtype=np.int64).ravel()
+        with self._lock:
+            previous = self._previous.pop(session, None)
+            self._previous[session] = ids
+            while len(self._previous) > self.max_sessions:
+                self._previous.popitem(last=False)
+            reused = 0
+            if previous is not None:
+                n = min(len(previous), len(ids))
+                mismatch = np.flatnonzero(previous[:n] != ids[:n])
+                reused = int(mismatch[0]) if len(mismatch) else n
+                # the first turn of a chat has nothing to reuse and is not counted
+                self.reused_tokens += reused
+                self.prompt_tokens += len(ids)
+                self.last_ratio = reused / len(ids) if len(ids) else 0.0
+            return reused
+
+    @property
+    def ratio(self) -> float:
+        return self.reused_tokens / self.prompt_tokens if self.prompt_tokens else 0.0
+
+    def __str__(self) -> str:
+        if self.last_ratio is None:
+            return "no follow-up turns yet"
+        return (
+            f"{self.ratio:.1%} of {self.prompt_tokens} prompt tokens reused "
+            f"(last turn {self.last_ratio:.1%})"
+        )
@@ -0,0 +1,193 @@
+"""Retrieval orchestration for the chat generation path."""
+
+from collections import Counter, OrderedDict
+from concurrent.futures import Future, wait
+import logging
+import sys
+import threading
+import time
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+# number of turns each backend missed the retrieval deadline
+deadline_misses: Counter[str] = Counter()
+# searches that missed their deadline and are still running, per backend
+_late: dict[str, set[Future]] = {}
+_late_lock = threading.Lock()
+
+
+def relevance_from_cosine(similarity: float) -> float:
+    """Relevance score in [0, 1] of a cosine similarity in [-1, 1].
+
+    Both context systems report their dense search scores on this scale, so chunks of
+    either store can be compared by score.
+    """
+    return min(1.0, max(0.0, (1.0 + similarity) / 2.0))
+
+
+def relevance_from_squared_l2(distance: float) -> float:
+    """Relevance score of the squared L2 distance between two unit vectors (as returned
+    by FAISS L2 indexes), on the same scale as relevance_from_cosine."""
+    return relevance_from_cosine(1.0 - distance / 2.0)
+
+
+def _start_search(search: Callable[[], list]) -> Future:
+    """Runs search on its own daemon thread, so a hung search holds no shared worker."""
+    future: Future = Future()
+
+    def run() -> None:
+        try:
+            future.set_result(search())
+        except Exception as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name="habitllm-retrieval", daemon=True).start()
+    return future
+
+
+def _forget_late(name: str, future: Future) -> None:
+    with _late_lock:
+        _late.get(name, set()).discard(future)
+
+
+def retrieve_concurrently(
+    searches: dict[str, Callable[[], list]], deadline: float
+) -> dict[str, list]:
+    """Runs the searches of each backend at the same time, waiting at most deadline seconds.
+
+    Backends that miss the deadline (or fail) contribute no results, so a slow backend
+    cannot stall the turn. Their late results are discarded. A backend with a search
+    from an earlier turn still running late is not searched again until it finished,
+    so a hung backend holds at most one thread.
+
+    Args:
+        searches: Mapping of backend name to a function performing its search.
+        deadline: Seconds to wait for all backends.
+
+    Returns:
+        Mapping of backend name to its results.
+    """
+    results: dict[str, list] = {}
+    futures = {}
+    for name, search in searches.items():
+        with _late_lock:
+            stalled = bool(_late.get(name))
+        if stalled:
+            deadline_misses[name] += 1
+            logger.warning(f"{name} retrieval skipped, its previous search is still running.")
+            results[name] = []
+        else:
+            futures[name] = _start_search(search)
+    done, _ = wait(futures.values(), timeout=deadline)
+
+    for name, future in futures.items():
+        if future in done:
+            try:
+                results[name] = future.result()
+            except Exception:
+                logger.exception(f"{name} retrieval failed.")
+                results[name] = []
+        else:
+            with _late_lock:
+                _late.setdefault(name, set()).add(future)
+            future.add_done_callback(lambda future, name=name: _forget_late(name, future))
+            deadline_misses[name] += 1
+            logger.warning(
+                f"{name} retrieval missed the {deadline * 1000:.0f}ms deadline "
+                f"({deadline_misses[name]} misses so far)."
+            )
+            results[name] = []
+    return results
+
+
+def normalize_query(query: str) -> str:
+    """Case and whitespace insensitive form of query used for cache keys."""
+    return " ".join(query.casefold().split())
+
+
+class RetrievalCache:
+    """
+    Bounded LRU cache of retrieval results with a time to live.
+
+    Keys include the version of the store that produced the results, so bumping a store's
+    version on ingest or delete invalidates its stale entries without a scan.
+    """
+
+    def __init__(self, max_entries: int = 128, ttl: float = 600.0) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[tuple, tuple[float, list, int]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bytes = 0
+
+    def get_or_compute(self, key: tuple, compute: Callable[[], list]) -> list:
+        """Returns the cached results for key, or computes and caches them.
+
+        Args:
+            key: Cache key, e.g. (store, normalized query, k, store version).
+            compute: Function retrieving the results on a miss.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] <= self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                self._evict(key)
+            self.misses += 1
+
+        results = compute()
+
+        with self._lock:
+            if key in self._entries:
+                self._evict(key)
+            size = _estimate_size(results)
+            self._entries[key] = (now, results, size)
+            self.bytes += size
+            while len(self._entries) > self.max_entries:
+                self._evict(next(iter(self._entries)))
+        return results
+
+    def _evict(self, key: tuple) -> None:
+        _, _, size = self._entries.pop(key)
+        self.bytes -= size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __str__(self) -> str:
+        return (
+            f"{len(self)} entries, {self.bytes / 1024:.1f} KiB held, "
+            f"hit ratio {self.hit_ratio:.1%} ({self.hits} hits / {self.misses} misses)"
+        )
+
+
+def _estimate_size(results: list) -> int:
+    """Approximate bytes held by (document, score, vector) retrieval results."""
+    size = sys.getsizeof(results)
+    for result in results:
+        doc = result[0]
+        size += sys.getsizeof(doc.page_content) + sys.getsizeof(doc.metadata)
+        for item in result[1:]:
+            if hasattr(item, "nbytes"):
+                size += item.nbytes
+            elif isinstance(item, list):
+                size += sys.getsizeof(item) + sum(sys.getsizeof(x) for x in item)
+            else:
+                size += sys.getsizeof(item)
+    return size
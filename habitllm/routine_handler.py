@@ -1,2 +1,291 @@
-def run_routine(routine: str):
-    return
+"""
+Routine handling: maintenance jobs on the model persistent context run in a separate
+worker process, at full speed in downtime and throttled or paused in uptime.
+
+The engine (in the webui process) is the only writer of the job queue and the control
+state; the worker only writes job checkpoints, so neither side needs locking.
+"""
+
+import json
+import logging
+from pathlib import Path
+import subprocess
+import sys
+import threading
+import time
+from typing import Callable
+import uuid
+
+from . import parameters
+from .ingestion_jobs import QueueFullError, format_eta
+from .utils import atomic_write_path
+
+logger = logging.getLogger(__name__)
+
+ROUTINE_STATE_DIR = str(Path("cache/habitllm_routines/").resolve())
+JOB_KINDS = ("ingest", "interactions", "dedup", "reindex", "compact")
+
+UPTIME = "uptime"
+DOWNTIME = "downtime"
+
+# control states read by the worker between units of work
+RUN = "run"
+THROTTLE = "throttle"
+PAUSE = "pause"
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+
+def read_json(path: Path, default=None):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def write_json(path: Path, data) -> None:
+    with atomic_write_path(path) as tmp:
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+
+
+class RoutineEngine:
+    """
+    Queues maintenance jobs and drives the worker process that runs them.
+
+    Args:
+        state_dir: Directory holding the queue, control state, worker options and
+            job checkpoints.
+    """
+
+    def __init__(self, state_dir: str = ROUTINE_STATE_DIR) -> None:
+        self.state_dir = Path(state_dir)
+        self.jobs_path = self.state_dir / "jobs.json"
+        self.control_path = self.state_dir / "control.json"
+        self.worker_path = self.state_dir / "worker.json"
+        self.checkpoint_dir = self.state_dir / "checkpoints"
+        # touched by the worker whenever it changed the stored embeddings
+        self.changed_path = self.state_dir / "mpc_changed"
+        # exists while the webui generates; the worker waits between units meanwhile
+        self.generating_path = self.state_dir / "generating"
+        self.checkpoint_dir.mkdir(parents=True, exist_ok=True)
+        self.jobs: list[dict] = read_json(self.jobs_path, [])
+        self._process: subprocess.Popen | threading.Thread | None = None
+        # set by attach(): jobs then run on a thread of this process instead
+        self._mpc = None
+        self._watcher: threading.Thread | None = None
+        self._lock = threading.Lock()
+        # resumes jobs left over from a previous session if the routine allows it
+        self.set_routine(parameters.get_active_routine())
+
+    def configure(self, **mpc_options) -> None:
+        """Sets the options the worker builds its ModelPersistentContext with."""
+        write_json(self.worker_path, mpc_options)
+        self._ensure_worker()
+
+    def attach(self, mpc) -> None:
+        """Runs jobs on a thread against mpc instead of in a worker process.
+
+        Needed for storage only one process can open, like an embedded Qdrant. The
+        thread follows the same control states as the worker process.
+        """
+        self._mpc = mpc
+        self._ensure_worker()
+
+    @property
+    def attached(self):
+        """The ModelPersistentContext jobs run against in this process, see attach."""
+        return self._mpc
+
+    def enqueue(self, kind: str, **args) -> str:
+        """Queues a job and starts the worker if the routine allows it.
+
+        Args:
+            kind: One of JOB_KINDS.
+            **args: Job arguments, e.g. files for ingest jobs.
+
+        Returns:
+            Id of the queued job.
+
+        Raises:
+            QueueFullError: An ingest job was queued while "max pending ingestion jobs"
+                ingest jobs are still pending.
+        """
+        if kind not in JOB_KINDS:
+            raise ValueError(f"Unknown routine job {kind!r}, expected one of {JOB_KINDS}")
+        job = {"id": uuid.uuid4().hex[:12], "kind": kind, "args": args, "queued": time.time()}
+        if kind == "ingest":
+            limit = parameters.get_max_pending_ingestion_jobs()
+            if sum(pending["kind"] == "ingest" for pending in self.pending_jobs()) >= limit:
+                raise QueueFullError(
+                    f"{limit} ingestion jobs are already pending in the routine, try again later"
+                )
+        with self._lock:
+            self.jobs.append(job)
+            write_json(self.jobs_path, self.jobs)
+        self._ensure_worker()
+        return job["id"]
+
+    def cancel(self, job_id: str | None = None, kind: str | None = None) -> int:
+        """Cancels job_id, or every pending job (of kind, if given).
+
+        The worker drops cancelled jobs that have not started and stops a running one
+        after its current unit of work.
+
+        Returns:
+            Number of jobs cancelled.
+        """
+        cancelled = 0
+        with self._lock:
+            for job in self.jobs:
+                if job_id not in (None, job["id"]) or kind not in (None, job["kind"]):
+                    continue
+                if job.get("cancelled") or self.checkpoint(job["id"])["status"] in FINISHED:
+                    continue
+                job["cancelled"] = True
+                cancelled += 1
+            if cancelled:
+                write_json(self.jobs_path, self.jobs)
+        return cancelled
+
+    def watch_generation(self, is_generating: Callable[[], bool], interval: float = 0.1) -> None:
+        """Mirrors is_generating() into the flag the worker backs off on, from a daemon thread."""
+        if self._watcher is not None:
+            return
+
+        def watch() -> None:
+            generating = None
+            while True:
+                now = is_generating()
+                if now != generating:
+                    generating = now
+                    if now:
+                        self.generating_path.touch()
+                    else:
+                        self.generating_path.unlink(missing_ok=True)
+                time.sleep(interval)
+
+        self._watcher = threading.Thread(target=watch, name="routine-generation-watch", daemon=True)
+        self._watcher.start()
+
+    def set_routine(self, routine: str) -> None:
+        """Applies routine to the worker: run freely in downtime, apply the uptime policy otherwise."""
+        if routine == DOWNTIME:
+            control = RUN
+        else:
+            control = parameters.get_uptime_routine_policy()
+        write_json(
+            self.control_path,
+            {"state": control, "throttle_seconds": parameters.get_uptime_throttle_seconds()},
+        )
+        self._ensure_worker()
+
+    def checkpoint(self, job_id: str) -> dict:
+        return read_json(self.checkpoint_dir / f"{job_id}.json", {"status": PENDING})
+
+    def pending_jobs(self) -> list[dict]:
+        return [
+            job
+            for job in self.jobs
+            if not job.get("cancelled") and self.checkpoint(job["id"])["status"] not in FINISHED
+        ]
+
+    def is_worker_alive(self) -> bool:
+        if isinstance(self._process, threading.Thread):
+            return self._process.is_alive()
+        return self._process is not None and self._process.poll() is None
+
+    def _ensure_worker(self) -> None:
+        with self._lock:
+            if self.is_worker_alive() or not self.worker_path.exists() or not self.pending_jobs():
+                return
+            if read_json(self.control_path, {}).get("state") == PAUSE:
+                return
+            if self._mpc is not None:
+                from .routine_worker import RoutineWorker
+
+                logger.info("Starting routine worker thread.")
+                worker = RoutineWorker(str(self.state_dir), mpc=self._mpc)
+                self._process = threading.Thread(target=worker.run, name="routine-worker", daemon=True)
+                self._process.start()
+                return
+            if read_json(self.worker_path, {}).get("backend") == "qdrant-local":
+                # runs in-process once the webui attached its ModelPersistentContext
+                return
+            logger.info("Starting routine worker.")
+            self._process = subprocess.Popen(
+                [sys.executable, "-m", f"{__package__}.routine_worker", str(self.state_dir)]
+            )
+
+    def data_version(self) -> int:
+        """Changes whenever the worker modified the stored embeddings."""
+        try:
+            return self.changed_path.stat().st_mtime_ns
+        except OSError:
+            return 0
+
+    def status_markdown(self, limit: int = 10, job_id: str | None = None) -> str:
+        """Markdown summary of the routine, worker and most recent jobs (or only job_id)."""
+        # the worker may have exited after finishing the queue; start it again if
+        # jobs were queued (or unpaused) since
+        self._ensure_worker()
+        control = read_json(self.control_path, {}).get("state", RUN)
+        worker = "running" if self.is_worker_alive() else "idle"
+        if worker == "running" and self.generating_path.exists():
+            worker += ", waiting for generation"
+        lines = [f"**Routine:** {parameters.get_active_routine()} ({control}), worker {worker}"]
+        jobs = [job for job in self.jobs if job_id in (None, job["id"])]
+        for job in jobs[-limit:]:
+            checkpoint = self.checkpoint(job["id"])
+            status = checkpoint["status"]
+            if job.get("cancelled") and status not in FINISHED:
+                status = "cancelling"
+            progress = checkpoint.get("progress")
+            progress = f" {progress:.0%}" if progress is not None else ""
+            if status == RUNNING and checkpoint.get("started") and progress:
+                progress += f", ETA {format_eta(_eta(checkpoint))}"
+            message = f" - {checkpoint['message']}" if checkpoint.get("message") else ""
+            lines.append(f"- {job['kind']} `{job['id']}`: {status}{progress}{message}")
+        return "\n".join(lines)
+
+    def job_status(self, job_id: str) -> str:
+        """Status of job_id as the worker last checkpointed it, "cancelling" until it noticed a cancel."""
+        status = self.checkpoint(job_id)["status"]
+        job = next((job for job in self.jobs if job["id"] == job_id), {})
+        if job.get("cancelled") and status not in FINISHED:
+            # a pending job is only marked cancelled once the worker reaches it
+            return CANCELLED if status == PENDING and not self.is_worker_alive() else "cancelling"
+        return status
+
+
+def _eta(checkpoint: dict) -> float | None:
+    """Remaining seconds of a running job at its rate so far, not counting waits."""
+    progress = checkpoint.get("progress") or 0.0
+    working = time.time() - checkpoint["started"] - checkpoint.get("waited", 0.0)
+    if progress <= 0 or working <= 0:
+        return None
+    return working * (1 - progress) / progress
+
+
+_engine: RoutineEngine | None = None
+
+
+def get_engine() -> RoutineEngine:
+    global _engine
+    if _engine is None:
+        _engine = RoutineEngine()
+    return _engine
+
+
+def run_routine(routine: str) -> str:
+    """Switches the active routine and returns the routine status."""
+    parameters.set_active_routine(routine)
+    engine = get_engine()
+    engine.set_routine(routine)
+    return engine.status_markdown()
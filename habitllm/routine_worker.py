@@ -0,0 +1,265 @@
+"""
+Worker process running the queued routine jobs, started by routine_handler.RoutineEngine.
+
+Each job runs in small units (a batch of files, a page of points) and its checkpoint is
+written after every unit, so a job interrupted by pause or a restart resumes where it
+left off. Between units the worker follows the control state set by the engine.
+
+Usage:
+    python -m extensions.habitllm.routine_worker <state_dir>
+"""
+
+import logging
+import os
+from pathlib import Path
+import sys
+import time
+from typing import Iterator
+
+from .interaction_memory_system import InteractionLog, mark_ingested, write_transcript
+from .model_persistent_context_system import ModelPersistentContext
+from .routine_handler import (
+    CANCELLED,
+    DONE,
+    FAILED,
+    FINISHED,
+    PAUSE,
+    RUNNING,
+    THROTTLE,
+    read_json,
+    write_json,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class JobCancelled(Exception):
+    """Raised at the next unit of work of a job the engine marked cancelled."""
+
+PAUSE_POLL_SECONDS = 1.0
+# a generation is usually short, so its end is polled more often than a pause's
+GENERATION_POLL_SECONDS = 0.05
+# lower CPU priority so generation in the webui process wins contention
+NICENESS = 10
+# files ingested per unit of work; they share embedding and upsert batches
+INGEST_FILES_PER_UNIT = 32
+
+
+class RoutineWorker:
+    """
+    Runs the queued routine jobs.
+
+    Args:
+        state_dir: State directory of the RoutineEngine.
+        mpc: Persistent context to run the jobs on. Built from the options the engine
+            wrote to worker.json if not given.
+    """
+
+    def __init__(self, state_dir: str, mpc: ModelPersistentContext | None = None) -> None:
+        self.state_dir = Path(state_dir)
+        self.checkpoint_dir = self.state_dir / "checkpoints"
+        if mpc is None:
+            mpc = ModelPersistentContext(**read_json(self.state_dir / "worker.json", {}))
+        self.mpc = mpc
+        # job being run and its checkpoint, read between units of work
+        self._job: dict | None = None
+        self._current: dict = {}
+        # seconds worked since the last throttle rest, and when the current unit started
+        self._worked = 0.0
+        self._unit_start = time.time()
+
+    def run(self) -> None:
+        """Runs pending jobs in queue order until none are left."""
+        while True:
+            job = self._next_job()
+            if job is None:
+                logger.info("No pending routine jobs, exiting.")
+                return
+            self._run_job(job)
+
+    def _next_job(self) -> dict | None:
+        # the queue is re-read so jobs queued while running are picked up
+        for job in read_json(self.state_dir / "jobs.json", []):
+            checkpoint = self._checkpoint(job["id"])
+            if checkpoint.get("status") in FINISHED:
+                continue
+            if job.get("cancelled"):
+                checkpoint.update(status=CANCELLED, message="cancelled before it ran")
+                self._save_checkpoint(job["id"], checkpoint)
+                continue
+            return job
+        return None
+
+    def _checkpoint(self, job_id: str) -> dict:
+        return read_json(self.checkpoint_dir / f"{job_id}.json", {})
+
+    def _save_checkpoint(self, job_id: str, checkpoint: dict) -> None:
+        write_json(self.checkpoint_dir / f"{job_id}.json", checkpoint)
+
+    def _run_job(self, job: dict) -> None:
+        checkpoint = self._checkpoint(job["id"])
+        checkpoint.update(status=RUNNING, message="", started=time.time(), waited=0.0)
+        self._job, self._current = job, checkpoint
+        self._save_checkpoint(job["id"], checkpoint)
+        logger.info(f"Running {job['kind']} job {job['id']}.")
+        units = getattr(self, f"_{job['kind']}")(job["args"], checkpoint)
+        try:
+            # the keyword index is saved once per job, not with every unit
+            with self.mpc.deferred_sparse_index_saves():
+                for _ in units:
+                    self._unit_done()
+        except JobCancelled:
+            logger.info(f"Routine job {job['id']} cancelled.")
+            done = checkpoint.get("message") or "nothing done"
+            checkpoint.update(status=CANCELLED, message=f"cancelled after {done}")
+        except Exception as e:
+            logger.exception(f"Routine job {job['id']} failed.")
+            checkpoint.update(status=FAILED, message=str(e) or type(e).__name__)
+        else:
+            checkpoint.update(status=DONE, progress=1.0)
+        self._save_checkpoint(job["id"], checkpoint)
+
+    def _unit_done(self) -> None:
+        """Saves the checkpoint of the current job, then waits as the engine asks."""
+        start = time.time()
+        self._worked += start - self._unit_start
+        self._current["updated"] = start
+        self._save_checkpoint(self._job["id"], self._current)
+        self._wait_for_control()
+        self._unit_start = time.time()
+        self._current["waited"] = self._current.get("waited", 0.0) + self._unit_start - start
+
+    def _wait_for_control(self) -> None:
+        """Sleeps between units as the control state and generations ask.
+
+        Throttled, the worker rests throttle_seconds after every throttle_seconds of
+        work, so it keeps at most half a core busy however small its units are.
+
+        Raises:
+            JobCancelled: The engine cancelled the current job.
+        """
+        while True:
+            self._check_cancelled()
+            control = read_json(self.state_dir / "control.json", {})
+            state = control.get("state")
+            if state == PAUSE:
+                time.sleep(PAUSE_POLL_SECONDS)
+            elif (self.state_dir / "generating").exists():
+                # generation has priority over embedding work
+                time.sleep(GENERATION_POLL_SECONDS)
+            elif state == THROTTLE:
+                throttle_seconds = control.get("throttle_seconds", 1.0)
+                if self._worked >= throttle_seconds:
+                    time.sleep(throttle_seconds)
+                    self._worked = 0.0
+                return
+            else:
+                return
+
+    def _check_cancelled(self) -> None:
+        if self._job is None:
+            return
+        for job in read_json(self.state_dir / "jobs.json", []):
+            if job["id"] == self._job["id"] and job.get("cancelled"):
+                raise JobCancelled(job["id"])
+
+    def _mark_changed(self) -> None:
+        """Tells the webui process to reload the persistent context."""
+        (self.state_dir / "mpc_changed").touch()
+
+    def _ingest(self, args: dict, checkpoint: dict) -> Iterator[None]:
+        files = args["files"]
+        done = checkpoint.setdefault("files_done", 0)
+        chunks = checkpoint.setdefault("chunks_done", 0)
+
+        def batch_done(batch_chunks: int) -> None:
+            # between upsert batches of a unit: report, back off, cancel
+            checkpoint.update(
+                chunks_done=chunks + batch_chunks,
+                message=f"{done}/{len(files)} files, {chunks + batch_chunks} chunks",
+            )
+            self._mark_changed()
+            self._unit_done()
+
+        while done < len(files):
+            batch = files[done : done + INGEST_FILES_PER_UNIT]
+            # ingestion is incremental, so a unit repeated after a crash or cancel is cheap
+            chunks += self.mpc.add_files_to_vector_store(
+                batch, progress=batch_done, skip_deleted=args.get("skip_deleted", False)
+            )
+            done += len(batch)
+            self._mark_changed()
+            checkpoint.update(
+                files_done=done,
+                chunks_done=chunks,
+                progress=done / len(files),
+                message=f"{done}/{len(files)} files, {chunks} chunks",
+            )
+            yield
+
+    def _interactions(self, args: dict, checkpoint: dict) -> Iterator[None]:
+        segments = InteractionLog(args["log_dir"]).sealed_segments()
+        staging_dir = self.state_dir / "transcripts"
+        done = checkpoint.setdefault("segments_done", 0)
+        total = done + len(segments)
+        for segment in segments:
+            transcript = write_transcript(segment, staging_dir)
+            self.mpc.add_files_to_vector_store([str(transcript)])
+            self._mark_changed()
+            # a crash before this point re-ingests the segment, which is a no-op
+            mark_ingested(segment)
+            transcript.unlink()
+            done += 1
+            checkpoint.update(
+                segments_done=done,
+                progress=done / total,
+                message=f"{done}/{total} interaction log segments",
+            )
+            yield
+
+    def _dedup(self, args: dict, checkpoint: dict) -> Iterator[None]:
+        if checkpoint.get("finished"):
+            return
+        # only the offset is checkpointed: on resume the pages before it are scanned
+        # again, without pausing, to collect the chunk hashes seen so far
+        resume = checkpoint.get("offset")
+        removed = checkpoint.setdefault("removed", 0)
+        for offset, duplicates, _ in self.mpc.scan_duplicates():
+            if duplicates:
+                self.mpc.delete_points(duplicates)
+                self._mark_changed()
+                removed += len(duplicates)
+            if resume is not None:
+                if offset is not None and offset != resume:
+                    continue
+                resume = None
+            checkpoint.update(
+                offset=offset,
+                removed=removed,
+                finished=offset is None,
+                message=f"{removed} duplicate chunks removed",
+            )
+            yield
+
+    def _reindex(self, args: dict, checkpoint: dict) -> Iterator[None]:
+        report = self.mpc.reindex_vector_store(**args)
+        self._mark_changed()
+        checkpoint["message"] = str(report).replace("\n", "; ") if report else "nothing to reindex"
+        yield
+
+    def _compact(self, args: dict, checkpoint: dict) -> Iterator[None]:
+        self.mpc.compact_vector_store(**args)
+        self._mark_changed()
+        checkpoint["message"] = "compacted"
+        yield
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO)
+    if hasattr(os, "nice"):
+        os.nice(NICENESS)
+    RoutineWorker(sys.argv[1]).run()
+
+
+if __name__ == "__main__":
+    main()
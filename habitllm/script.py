@@ -5,11 +5,11 @@ HabitLLML: a continuous learning extension for Text Gen Web UI.
 
 """
 
-from pathlib import Path
+import threading
+import time
+from typing import TYPE_CHECKING
 
 import gradio as gr
-import torch
-from transformers import LogitsProcessor
 
 
 from modules import chat, shared
@@ -17,18 +17,41 @@ from modules.text_generation import (
     decode,
     encode,
     generate_reply,
+    get_encoded_length,
 )
 
 from .inference_specific_context_system import (
     add_files_to_vector_store,
-    perform_similarity_search,
-    INF_SPECIFIC_DST,
+    perform_hybrid_search_with_vectors,
+    restore_vector_store,
+    get_session,
+    get_store_version,
+    get_uploaded_files,
+    index_stats_markdown,
 )
 
-from .model_persistent_context_system import ModelPersistentContext
+from .embedding_service import get_embedding_service
+from .retrieval import (
+    RetrievalCache,
+    deadline_misses,
+    normalize_query,
+    retrieve_concurrently,
+)
+from .context_assembler import Candidate, TokenCountCache, assemble_context, pack_into_budget
+from .inference_specific_context_system.sessions import session_key
+from .prompt_layout import PrefixReuse, StableContextBlocks, render_context
+from .logit_bias import LogitBiasCache, RetrievalLogitBias
+from .sparse_index import is_keyword_query
+from .instrumentation import export_prometheus, is_enabled, set_enabled, span, summary_markdown
+from .warmup import warmup
+from .interaction_memory_system import Interaction, InteractionLog
+from .ingestion_jobs import IngestionJob, IngestionQueue, QueueFullError
+
+if TYPE_CHECKING:
+    from .model_persistent_context_system import ModelPersistentContext
 
 import extensions.habitllm.parameters as parameters
-from .routine_handler import run_routine
+from .routine_handler import get_engine, run_routine
 
 params = {
     "display_name": "Habit LLM",
@@ -36,16 +59,65 @@ params = {
     "open": True,
 }
 
-MPC: ModelPersistentContext = None
+# how often the UI polls the progress of ingestion jobs
+PROGRESS_POLL_SECONDS = 1.0
+
+MPC: "ModelPersistentContext" = None
+# last seen routine worker data version, see _sync_persistent_context
+mpc_data_version = 0
+interaction_log = InteractionLog(
+    max_bytes=parameters.get_interaction_log_max_bytes(),
+    flush_interval=parameters.get_interaction_log_flush_seconds(),
+)
+# turn of each chat whose prompt was generated, completed and logged once its output
+# arrives, keyed by session_key(state, "chat") so concurrent chats keep their own
+pending_interactions: dict[str, Interaction] = {}
+retrieval_cache = RetrievalCache(
+    max_entries=parameters.get_retrieval_cache_size(),
+    ttl=parameters.get_retrieval_cache_ttl(),
+)
+# persistent context block at the front of each chat's prompt, see prompt_layout
+stable_blocks = StableContextBlocks(threshold=parameters.get_stable_context_overlap())
+prefix_reuse = PrefixReuse()
+# chunks of a chat prompt travel in its state to tokenizer_modifier, which hands them to
+# logits_processor_modifier on the generating thread (that hook gets no state), see MyLogits
+BIAS_CONTEXT_STATE_KEY = "habitllm_bias_context"
+_generation = threading.local()
+logit_biases = LogitBiasCache()
 # ---------------- Routines ----------------
 
 
 def _run_routine(routine: str):
     current_routine = parameters.get_active_routine()
     if routine == current_routine:
-        yield "### Routine is already running"
+        yield f"### Routine is already running\n{get_engine().status_markdown()}"
+    else:
+        if routine == "downtime":
+            # learn from the sessions logged so far
+            _queue_interaction_ingestion()
+        yield run_routine(routine)
+
+
+def _queue_interaction_ingestion() -> str | None:
+    interaction_log.rotate()
+    if not interaction_log.sealed_segments():
+        return None
+    return get_engine().enqueue("interactions", log_dir=str(interaction_log.log_dir))
+
+
+def _queue_maintenance(kind: str):
+    if kind == "interactions":
+        job_id = _queue_interaction_ingestion()
+        if job_id is None:
+            yield "### No logged interactions to ingest"
+            return
     else:
-        run_routine(routine)
+        job_id = get_engine().enqueue(kind)
+    yield f"### Queued {kind} job {job_id}\n{get_engine().status_markdown()}"
+
+
+def _get_routine_status():
+    yield get_engine().status_markdown()
 
 
 # ---------------- Context stores ----------------
@@ -68,11 +140,62 @@ def _update_context_store_config(
 
 # ---------------- Inference specific context system ----------------
 
+# webui state the inference specific context session is derived from, see get_session
+SESSION_STATE_KEYS = ("character_menu", "unique_id")
+
+
+def _session_inputs() -> list:
+    """webui components holding SESSION_STATE_KEYS, for event handlers that need the session."""
+    return [shared.gradio.get(name) or gr.State(None) for name in SESSION_STATE_KEYS]
+
+
+def _session_of(*values) -> str:
+    return get_session(dict(zip(SESSION_STATE_KEYS, values)))
+
+
+def _generation_in_progress() -> bool:
+    # set up by the webui's server, held for the whole of a generation
+    lock = getattr(shared, "generation_lock", None)
+    return lock is not None and lock.locked()
 
-def _feed_data_into_vector_store(files: list[str] | None):
-    yield "### Reading and processing the input files..."
-    add_files_to_vector_store(files)
-    yield "### Done!"
+
+def _run_ingestion_job(job: IngestionJob) -> str:
+    def progress(files_done: int, chunks_done: int, chunks_total: int) -> None:
+        job.files_done, job.chunks_done, job.chunks_total = files_done, chunks_done, chunks_total
+        # cancels the job, or waits out a running generation
+        ingestion_jobs.checkpoint(job)
+
+    with span("isc_ingest"):
+        report = add_files_to_vector_store(job.files, session=job.session, progress=progress)
+    return str(report)
+
+
+# uploads are embedded one job at a time, off the Gradio workers
+ingestion_jobs = IngestionQueue(
+    _run_ingestion_job,
+    max_pending=parameters.get_max_pending_ingestion_jobs(),
+    is_busy=_generation_in_progress,
+)
+
+
+def _feed_data_into_vector_store(files: list[str] | None, *session_values):
+    if not files:
+        yield "### No files to load"
+        return
+    try:
+        job = ingestion_jobs.submit(files, _session_of(*session_values))
+    except QueueFullError as e:
+        yield f"### Files not loaded: {e}"
+        return
+    # progress is shown by the polled ingestion status, see _ingestion_status
+    yield f"### Loading {len(files)} input files as job `{job.id}`"
+
+
+def _cancel_ingestion(*session_values):
+    # uploads of this session and every persistent context ingestion
+    cancelled = ingestion_jobs.cancel(session=_session_of(*session_values))
+    cancelled += get_engine().cancel(kind="ingest")
+    yield f"### Cancelled {cancelled} ingestion jobs\n{ingestion_jobs.status_markdown()}"
 
 
 def _clear_data(files_input: gr.Files):
@@ -85,34 +208,222 @@ def _clear_data(files_input: gr.Files):
 # ---------------- Model Persistent Context System ----------------
 
 
+def _mpc_options() -> dict:
+    """Options shared by the webui's ModelPersistentContext and the routine worker's."""
+    backend = parameters.get_mpc_backend()
+    return {
+        "backend": backend,
+        "path": parameters.get_mpc_storage_path() if backend != "qdrant" else None,
+        "batch_size": parameters.get_embedding_batch_size(),
+        "prefer_grpc": parameters.get_mpc_prefer_grpc(),
+        "grpc_port": parameters.get_mpc_grpc_port(),
+        "timeout": parameters.get_mpc_timeout_seconds(),
+        "upload_batch_size": parameters.get_mpc_upload_batch_size(),
+        "upload_workers": parameters.get_mpc_upload_workers(),
+        "max_retries": parameters.get_mpc_max_retries(),
+    }
+
+
 def _setup_persistent_context_module():
-    global MPC
+    global MPC, mpc_data_version
     if MPC is None:
-        MPC = ModelPersistentContext()
+        # qdrant_client and langchain are only imported here, off the startup path
+        from .model_persistent_context_system import ModelPersistentContext
+
+        MPC = ModelPersistentContext(**_mpc_options())
+        engine = get_engine()
+        mpc_data_version = engine.data_version()
+        if MPC.backend == "qdrant-local":
+            # the embedded qdrant storage can only be opened by one process
+            engine.attach(MPC)
+        engine.configure(**_mpc_options())
+        engine.watch_generation(_generation_in_progress)
+
+
+def _sync_persistent_context():
+    """Picks up changes the routine worker made to the persistent context."""
+    global mpc_data_version
+    data_version = get_engine().data_version()
+    if data_version != mpc_data_version:
+        mpc_data_version = data_version
+        if get_engine().attached is MPC:
+            # the worker thread changed MPC itself; reloading from disk mid-job would
+            # drop what it has not saved yet
+            MPC.version += 1
+        else:
+            MPC.refresh()
+
+
+def _ingest_data_into_persistent_db(*session_values):
+    # embedding runs in the routine worker, off the generation process
+    files = get_uploaded_files(_session_of(*session_values))
+    if not files:
+        yield "### No uploaded files to ingest"
+        return
+    try:
+        # files deleted from the persistent context stay deleted while unchanged
+        job_id = get_engine().enqueue("ingest", files=files, skip_deleted=True)
+    except QueueFullError as e:
+        yield f"### Ingestion not queued: {e}"
+        return
+    # runs when the routine allows; progress is shown by the polled ingestion status
+    yield f"### Queued ingestion of {len(files)} files as job `{job_id}`"
+
+
+def _ingestion_status() -> str:
+    """Progress of the uploads and persistent context ingestions, polled by the UI."""
+    return f"{ingestion_jobs.status_markdown()}\n\n{get_engine().status_markdown(limit=5)}"
+
+
+# ---------------- Stats ----------------
+
+
+def _get_stats(*session_values):
+    misses = ", ".join(f"{name}: {count}" for name, count in deadline_misses.items())
+    yield (
+        f"{warmup.describe()}\n\n"
+        f"{get_engine().status_markdown()}\n\n"
+        f"{ingestion_jobs.status_markdown()}\n\n"
+        f"{index_stats_markdown(_session_of(*session_values))}\n\n"
+        f"**Retrieval cache:** {retrieval_cache}\n\n"
+        f"**Prompt prefix reuse:** {prefix_reuse}\n\n"
+        f"**Stable context blocks:** {stable_blocks}\n\n"
+        f"**Logit bias cache:** {logit_biases}\n\n"
+        f"**Retrieval deadline misses:** {misses or 'none'}\n\n"
+        f"**Interaction log:** {interaction_log.dropped} turns dropped\n\n"
+        f"**Stage latency:**\n\n{summary_markdown()}"
+    )
+
+
+def _set_instrumentation(enabled: bool):
+    parameters.set_is_instrumentation_enabled(enabled)
+    set_enabled(enabled)
+
+
+def _timed(name: str, fn):
+    """Wraps fn so each call is recorded as stage name."""
 
+    def _wrapper(*args, **kwargs):
+        with span(name):
+            return fn(*args, **kwargs)
 
-def _ingest_data_into_persistent_db(files: list[str] | None):
-    yield "### Reading and processing the input files..."
-    files = Path(INF_SPECIFIC_DST).glob("**/*")
-    MPC.add_files_to_vector_store(files)
-    yield "### Done!"
+    return _wrapper
+
+
+# ---------------- Context assembly ----------------
+
+
+def _count_tokens(text: str) -> int:
+    if shared.tokenizer is None:
+        # no model loaded, rough estimate
+        return len(text) // 4
+    return get_encoded_length(text)
+
+
+token_counts = TokenCountCache(_count_tokens)
+
+
+def _count_chunk_tokens(text: str) -> int:
+    return token_counts.count(text, tokenizer_key=str(shared.model_name))
+
+
+def _context_token_budget(user_input: str, state: dict) -> int:
+    """Prompt tokens available for retrieved context this turn."""
+    available = state["truncation_length"] - state["max_new_tokens"]
+    budget = int(available * parameters.get_context_token_budget_fraction())
+    return budget - _count_tokens(user_input)
+
+
+def _prefix_cache_layout(
+    user_input: str,
+    state: dict,
+    chat: str,
+    chunks: list[Candidate],
+    budget: int,
+    persistent_searched: bool,
+) -> tuple[str, dict]:
+    """Lays out chunks for prefix caching: the chat's stable persistent context block goes
+    into the system context at the front of the prompt, the other chunks into the user turn.
+
+    Returns:
+        The user input and state to generate the prompt with.
+    """
+    if persistent_searched:
+        persistent = [chunk for chunk in chunks if chunk.store == "MPC"]
+        block, changed = stable_blocks.update(chat, persistent)
+        block_tokens = sum(_count_chunk_tokens(chunk.content) + 2 for chunk in block)
+        if block_tokens > budget:
+            # a longer user turn left less room than when the block was chosen
+            stable_blocks.reset(chat)
+            block, changed = stable_blocks.update(chat, persistent)
+            block_tokens = sum(_count_chunk_tokens(chunk.content) + 2 for chunk in block)
+        if changed:
+            print(f"Persistent context block of {chat} changed, the prompt prefix is rebuilt")
+    else:
+        stable_blocks.reset(chat)
+        block, block_tokens = [], 0
+
+    in_block = {chunk.content_hash for chunk in block}
+    per_turn = pack_into_budget(
+        [chunk for chunk in chunks if chunk.content_hash not in in_block],
+        budget - block_tokens,
+        _count_chunk_tokens,
+    )
+    if per_turn:
+        user_input = f"Context:\n{render_context(per_turn)}\n\n{user_input}"
+    if block:
+        state = dict(state)
+        # the instruct template starts with the system message, chat modes with the context
+        if state.get("mode") == "instruct":
+            key = "custom_system_message"
+            base = state.get(key, "").strip() or state.get("system_message", "")
+        else:
+            key = "context"
+            base = state.get(key, "")
+        context = f"Context:\n{render_context(block)}"
+        state[key] = f"{base}\n\n{context}" if base else context
+    return user_input, state
+
+
+def _prompt_token_ids(prompt: str):
+    import torch
+
+    ids = encode(prompt)[0]
+    return ids.cpu().numpy() if isinstance(ids, torch.Tensor) else ids
+
+
+def _to_candidates(store: str, results) -> list[Candidate]:
+    return [
+        Candidate(
+            content=doc.page_content,
+            score=score,
+            store=store,
+            vector=vector,
+            metadata=doc.metadata,
+        )
+        for doc, score, vector in results
+    ]
 
 
 # ---------------- Custom Extension ----------------
-class MyLogits(LogitsProcessor):
+class MyLogits(RetrievalLogitBias):
     """
-    Manipulates the probabilities for the next token before it gets sampled.
-    Used in the logits_processor_modifier function below.
+    Biases the next token towards the tokens of the retrieved context.
+    Used in the logits_processor_modifier function below, only when "retrieval logit bias"
+    is enabled.
     """
 
-    def __init__(self):
-        pass
-
-    def __call__(self, input_ids, scores):
-        # probs = torch.softmax(scores, dim=-1, dtype=torch.float)
-        # probs[0] /= probs[0].sum()
-        # scores = torch.log(probs / (1 - probs))
-        return scores
+    def __init__(self, texts: list[str]):
+        tokenizer = shared.tokenizer
+        indices, values = logit_biases.get(
+            texts,
+            lambda text: tokenizer.encode(text, add_special_tokens=False),
+            strength=parameters.get_logit_bias_strength(),
+            max_tokens=parameters.get_logit_bias_max_tokens(),
+            exclude=getattr(tokenizer, "all_special_ids", ()),
+            tokenizer_key=str(shared.model_name),
+        )
+        super().__init__(indices, values)
 
 
 def history_modifier(history):
@@ -164,6 +475,8 @@ def tokenizer_modifier(state, prompt, input_ids, input_embeds):
     Used by the multimodal extension to put image embeddings in the prompt.
     Only used by loaders that use the transformers library for sampling.
     """
+    # called right before logits_processor_modifier, on the same thread
+    _generation.bias_context = state.pop(BIAS_CONTEXT_STATE_KEY, None)
     return prompt, input_ids, input_embeds
 
 
@@ -173,7 +486,12 @@ def logits_processor_modifier(processor_list, input_ids):
     the next token probabilities.
     Only used by loaders that use the transformers library for sampling.
     """
-    processor_list.append(MyLogits())
+    # the context belongs to one generation; others (e.g. notebook mode) get no bias
+    texts = getattr(_generation, "bias_context", None)
+    _generation.bias_context = None
+    if parameters.get_is_retrieval_logit_bias() and texts:
+        with span("logit_bias_build"):
+            processor_list.append(MyLogits(texts))
     return processor_list
 
 
@@ -184,6 +502,11 @@ def output_modifier(string, state, is_chat=False):
     In chat mode, the modified version goes into history['visible'],
     and the original version goes into history['internal'].
     """
+    interaction = pending_interactions.pop(session_key(state, "chat"), None) if is_chat else None
+    if interaction is not None:
+        interaction.output = string
+        interaction.timings["generation"] = time.time() - interaction.timestamp
+        interaction_log.record(interaction)
     return string
 
 
@@ -194,23 +517,95 @@ def custom_generate_chat_prompt(user_input, state, **kwargs):
     """
     print(user_input)
 
-    inference_specific_results = perform_similarity_search(
-        user_input, k=parameters.get_inference_specific_context_chunks()
-    )
-    print(f"ISC similarity search results: {inference_specific_results}")
-
-    model_rag_ret = MPC.perform_similarity_search(
-        user_input,
-        k=parameters.get_inference_specific_context_chunks()
-    )
-    print(f"MPC similarity search results: {model_rag_ret}")
-
-    rag_rets = inference_specific_results + model_rag_ret
-    relevant_chunks = [result[0].page_content for result in rag_rets]
-
-
-    input = user_input.join(relevant_chunks)
-    result = chat.generate_chat_prompt(input, state, **kwargs)
+    with span("chat_prompt_total"):
+        # embed the query once and share the vector between both context systems.
+        # Lookups of exact identifiers only use the keyword indexes and skip embedding.
+        dense = not is_keyword_query(user_input)
+        query_embedding = None
+        if dense:
+            with span("query_embedding"):
+                query_embedding = get_embedding_service().embed_query(user_input)
+
+        # query both stores at the same time, bounded by the retrieval deadline.
+        # Results are cached per store version, so repeated questions skip the search.
+        query_key = normalize_query(user_input)
+        searches = {}
+        if parameters.get_is_inference_specific_context():
+            # each chat/character searches its own uploads
+            session = get_session(state)
+            isc_k = parameters.get_inference_specific_context_chunks()
+            searches["ISC"] = lambda: retrieval_cache.get_or_compute(
+                ("ISC", session, query_key, isc_k, dense, get_store_version(session)),
+                lambda: _timed("isc_search", perform_hybrid_search_with_vectors)(
+                    user_input, k=isc_k, embedding=query_embedding, dense=dense, session=session
+                ),
+            )
+        if parameters.get_is_model_persistent_context() and MPC is not None:
+            _sync_persistent_context()
+            mpc_k = parameters.get_model_persistent_context_chunks()
+            searches["MPC"] = lambda: retrieval_cache.get_or_compute(
+                ("MPC", query_key, mpc_k, dense, MPC.version),
+                lambda: _timed("mpc_search", MPC.perform_hybrid_search_with_vectors)(
+                    user_input, retrieve_num=mpc_k, embedding=query_embedding, dense=dense
+                ),
+            )
+        retrieval_start = time.perf_counter()
+        with span("retrieval"):
+            retrieved = retrieve_concurrently(
+                searches, deadline=parameters.get_retrieval_deadline_ms() / 1000
+            )
+        assembly_start = time.perf_counter()
+        inference_specific_results = retrieved.get("ISC", [])
+        print(f"ISC similarity search results: {[result[:2] for result in inference_specific_results]}")
+        model_rag_ret = retrieved.get("MPC", [])
+        print(f"MPC similarity search results: {[result[:2] for result in model_rag_ret]}")
+
+        # dedup across stores, rerank for diversity and keep what fits the token budget
+        budget = _context_token_budget(user_input, state)
+        with span("context_assembly"):
+            relevant_chunks = assemble_context(
+                query_embedding,
+                _to_candidates("MPC", model_rag_ret)
+                + _to_candidates("ISC", inference_specific_results),
+                budget=budget,
+                count_tokens=_count_chunk_tokens,
+                lambda_mult=parameters.get_mmr_lambda(),
+            )
+
+        chat_key = session_key(state, "chat")
+        if parameters.get_is_interaction_memory():
+            pending_interactions[chat_key] = Interaction(
+                user_input=user_input,
+                retrieved=[
+                    {"store": chunk.store, "id": chunk.metadata.get("_id") or chunk.content_hash}
+                    for chunk in relevant_chunks
+                ],
+                timings={
+                    "retrieval": assembly_start - retrieval_start,
+                    "context_assembly": time.perf_counter() - assembly_start,
+                },
+            )
+
+        if parameters.get_is_retrieval_logit_bias():
+            state[BIAS_CONTEXT_STATE_KEY] = [chunk.content for chunk in relevant_chunks]
+
+        input = user_input
+        prompt_state = state
+        prefix_cache_layout = parameters.get_prompt_layout() == "prefix-cache"
+        if prefix_cache_layout:
+            with span("prompt_layout"):
+                input, prompt_state = _prefix_cache_layout(
+                    user_input, state, chat_key, relevant_chunks, budget, "MPC" in searches
+                )
+        elif relevant_chunks:
+            input = f"Context:\n{render_context(relevant_chunks)}\n\n{user_input}"
+        with span("generate_chat_prompt"):
+            result = chat.generate_chat_prompt(input, prompt_state, **kwargs)
+        # tokenizing the whole prompt is only worth it when the reuse is read
+        measure_reuse = prefix_cache_layout or is_enabled()
+        if measure_reuse and shared.tokenizer is not None and isinstance(result, str):
+            with span("prefix_reuse"):
+                prefix_reuse.observe(chat_key, _prompt_token_ids(result))
     return result
 
 
@@ -232,8 +627,18 @@ def custom_js():
 def setup():
     """
     Gets executed only once, when the extension is imported.
+
+    Model loads and store connections are warmed up on a background thread so the
+    webui can start serving immediately; their progress is shown in the UI.
     """
-    _setup_persistent_context_module()
+    set_enabled(parameters.get_is_instrumentation_enabled())
+    warmup.start(
+        {
+            "embedding model": lambda: get_embedding_service().embed_query("warm-up"),
+            "inference specific context": restore_vector_store,
+            "model persistent context": _setup_persistent_context_module,
+        }
+    )
 
 
 def ui():
@@ -254,6 +659,7 @@ def ui():
                     files_input = gr.Files(label="Input files", type="filepath")
                     update_files = gr.Button("Load files")
                     memorize_button = gr.Button("Ingest Documents")
+                    cancel_ingestion = gr.Button("Cancel ingestion")
                     # clear_button = gr.Button('❌ Clear Data')
 
                 with gr.Tab("Settings"):
@@ -264,6 +670,14 @@ def ui():
                         info="What routine should be run",
                     )
                     run_routine = gr.Button("Run routine")
+                    maintenance_job = gr.Dropdown(
+                        choices=["interactions", "dedup", "reindex", "compact"],
+                        value="dedup",
+                        label="Maintenance job",
+                        info="Runs in the routine worker: freely in downtime, throttled or paused in uptime.",
+                    )
+                    queue_maintenance = gr.Button("Queue job")
+                    routine_status = gr.Button("Routine status")
 
                     inference_specific_context = gr.Slider(
                         value=parameters.get_inference_specific_context_chunks(),
@@ -283,18 +697,47 @@ def ui():
                     )
                     update_context_store_config = gr.Button("Apply")
 
+                with gr.Tab("Stats"):
+                    instrumentation = gr.Checkbox(
+                        value=parameters.get_is_instrumentation_enabled(),
+                        label="Record stage latency",
+                        info="Times each stage of prompt generation and ingestion.",
+                    )
+                    refresh_stats = gr.Button("Refresh stats")
+                    export_metrics = gr.Button("Export Prometheus metrics")
+                    metrics_text = gr.Textbox(label="Prometheus metrics", lines=8)
+
             with gr.Column():
+                gr.Markdown(value=warmup.describe)
                 last_updated = gr.Markdown()
+                gr.Markdown(value=_ingestion_status, every=PROGRESS_POLL_SECONDS)
 
+    session_inputs = _session_inputs()
     update_files.click(
-        _feed_data_into_vector_store, [files_input], last_updated, show_progress=True
+        _feed_data_into_vector_store,
+        [files_input] + session_inputs,
+        last_updated,
+        show_progress=True,
+    )
+    memorize_button.click(
+        _ingest_data_into_persistent_db,
+        session_inputs,
+        last_updated,
+        show_progress=True,
     )
-    memorize_button.click(_ingest_data_into_persistent_db, show_progress=True)
+    cancel_ingestion.click(_cancel_ingestion, session_inputs, last_updated, show_progress=False)
     run_routine.click(_run_routine, [routine], last_updated, show_progress=False)
+    queue_maintenance.click(
+        _queue_maintenance, [maintenance_job], last_updated, show_progress=False
+    )
+    routine_status.click(_get_routine_status, None, last_updated, show_progress=False)
     update_context_store_config.click(
         _update_context_store_config,
         [inference_specific_context, model_persistent_context],
         last_updated,
         show_progress=False,
     )
+    refresh_stats.click(_get_stats, session_inputs, last_updated, show_progress=False)
+    instrumentation.change(_set_instrumentation, instrumentation, None)
+    export_metrics.click(export_prometheus, None, metrics_text, show_progress=False)
     # clear_button.click(_clear_data, [files_input], last_updated, show_progress=True)
@@ -0,0 +1,195 @@
+"""Local BM25 inverted index used next to the dense stores for hybrid retrieval."""
+
+from collections import Counter
+import heapq
+import math
+from pathlib import Path
+import pickle
+import re
+import threading
+
+from .utils import atomic_write_path
+
+# words, and identifiers joined by - . : / (e.g. ERR-42, v1.2.3, foo.bar)
+_TOKEN = re.compile(r"\w+(?:[-.:/]\w+)*")
+_IDENTIFIER = re.compile(r"^(?=.*\d)\w+(?:[-.:/]\w+)*$|^\w+(?:[-.:/_]\w+)+$|^\w*[a-z][A-Z]\w*$")
+# queries of at most this many tokens may be pure keyword lookups
+KEYWORD_QUERY_MAX_TOKENS = 3
+RRF_K = 60
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercase terms of text. Identifiers are kept whole, their parts are added as well."""
+    terms = []
+    for token in _TOKEN.findall(text.lower()):
+        terms.append(token)
+        if not token.isalnum():
+            terms.extend(part for part in re.split(r"[-.:/_]", token) if part)
+    return terms
+
+
+def is_keyword_query(query: str) -> bool:
+    """Whether query is a lookup of exact identifiers (error codes, names, versions).
+
+    Such queries are a few tokens that are quoted, or all look like identifiers
+    (contain a digit, a separator or camelCase).
+    """
+    query = query.strip()
+    if len(query) > 2 and query[0] == query[-1] and query[0] in "\"'`":
+        return True
+    tokens = query.split()
+    return 0 < len(tokens) <= KEYWORD_QUERY_MAX_TOKENS and all(
+        _IDENTIFIER.match(token.strip("?!,;")) for token in tokens
+    )
+
+
+class BM25Index:
+    """
+    Incrementally updated Okapi BM25 index over short documents (chunks).
+
+    Documents are addressed by string ids (docstore ids, point ids) that are mapped to
+    dense integers internally to keep the postings compact.
+
+    Args:
+        k1: Term frequency saturation.
+        b: Document length normalization.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75) -> None:
+        self.k1 = k1
+        self.b = b
+        self._postings: dict[str, dict[int, int]] = {}
+        self._doc_ids: list[str | None] = []
+        self._doc_numbers: dict[str, int] = {}
+        self._doc_lengths: dict[int, int] = {}
+        self._total_length = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._doc_lengths)
+
+    def add(self, doc_id: str, text: str) -> None:
+        """Indexes text under doc_id, replacing a previous document with the same id."""
+        self.add_many([(doc_id, text)])
+
+    def add_many(self, docs: list[tuple[str, str]]) -> None:
+        with self._lock:
+            for doc_id, text in docs:
+                if doc_id in self._doc_numbers:
+                    self._remove(doc_id)
+                number = len(self._doc_ids)
+                self._doc_ids.append(doc_id)
+                self._doc_numbers[doc_id] = number
+                terms = Counter(tokenize(text))
+                for term, tf in terms.items():
+                    self._postings.setdefault(term, {})[number] = tf
+                length = sum(terms.values())
+                self._doc_lengths[number] = length
+                self._total_length += length
+
+    def remove(self, doc_ids) -> None:
+        with self._lock:
+            for doc_id in doc_ids:
+                self._remove(doc_id)
+
+    def _remove(self, doc_id: str) -> None:
+        number = self._doc_numbers.pop(doc_id, None)
+        if number is None:
+            return
+        self._doc_ids[number] = None
+        self._total_length -= self._doc_lengths.pop(number)
+        # postings are cleaned up lazily, see search
+        if len(self._doc_ids) > 2 * len(self._doc_lengths) + 1024:
+            self._compact()
+
+    def _compact(self) -> None:
+        """Renumbers live documents and drops postings of removed ones."""
+        renumber = {}
+        doc_ids = []
+        for number, doc_id in enumerate(self._doc_ids):
+            if doc_id is not None:
+                renumber[number] = len(doc_ids)
+                doc_ids.append(doc_id)
+        self._postings = {
+            term: {renumber[n]: tf for n, tf in posting.items() if n in renumber}
+            for term, posting in self._postings.items()
+        }
+        self._postings = {term: posting for term, posting in self._postings.items() if posting}
+        self._doc_lengths = {renumber[n]: length for n, length in self._doc_lengths.items()}
+        self._doc_ids = doc_ids
+        self._doc_numbers = {doc_id: number for number, doc_id in enumerate(doc_ids)}
+
+    def search(self, query: str, k: int) -> list[tuple[str, float]]:
+        """Top k documents for query by BM25 score.
+
+        Args:
+            query: Query text.
+            k: Number of results.
+
+        Returns:
+            (doc id, score) pairs, best first. Documents sharing no term with the query
+            are not returned.
+        """
+        with self._lock:
+            n_docs = len(self._doc_lengths)
+            if n_docs == 0:
+                return []
+            avg_length = self._total_length / n_docs
+            scores: dict[int, float] = {}
+            for term in set(tokenize(query)):
+                posting = self._postings.get(term)
+                if not posting:
+                    continue
+                live = [(n, tf) for n, tf in posting.items() if n in self._doc_lengths]
+                if not live:
+                    continue
+                idf = math.log(1 + (n_docs - len(live) + 0.5) / (len(live) + 0.5))
+                for number, tf in live:
+                    norm = self.k1 * (1 - self.b + self.b * self._doc_lengths[number] / avg_length)
+                    scores[number] = scores.get(number, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+            best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+            return [(self._doc_ids[number], score) for number, score in best]
+
+    def save(self, path: str | Path) -> None:
+        # serialized under the lock, written without it so searches only wait for the copy
+        with self._lock:
+            state = (self._postings, self._doc_ids, self._doc_lengths, self._total_length)
+            data = pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+        with atomic_write_path(path) as tmp:
+            with open(tmp, "wb") as f:
+                f.write(data)
+
+    @classmethod
+    def load(cls, path: str | Path) -> "BM25Index | None":
+        """Loads an index saved with save, or returns None if there is none."""
+        try:
+            with open(path, "rb") as f:
+                postings, doc_ids, doc_lengths, total_length = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+            return None
+        index = cls()
+        index._postings = postings
+        index._doc_ids = doc_ids
+        index._doc_lengths = doc_lengths
+        index._total_length = total_length
+        index._doc_numbers = {
+            doc_id: number for number, doc_id in enumerate(doc_ids) if doc_id is not None
+        }
+        return index
+
+
+def reciprocal_rank_fusion(*rankings: list[str], k: int = RRF_K) -> list[tuple[str, float]]:
+    """Fuses rankings of ids by reciprocal rank: score = sum of 1 / (k + rank).
+
+    Args:
+        *rankings: Lists of ids, best first.
+        k: Damping of the contribution of top ranks.
+
+    Returns:
+        (id, fused score) pairs, best first.
+    """
+    scores: dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
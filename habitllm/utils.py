@@ -1,7 +1,10 @@
 """Extra helper functions for extension."""
 
+from contextlib import contextmanager
+import os
 from pathlib import Path
 import shutil
+from typing import Iterator
 import warnings
 
 
@@ -59,3 +62,28 @@ def delete_files_from_dest(dest: str, files: list[str]) -> list[str]:
     deleted_files = {_delete_valid_files(f) for f in files}
     deleted_files.discard("")
     return list(deleted_files)
+
+
+@contextmanager
+def atomic_write_path(path: str | Path) -> Iterator[Path]:
+    """Yields a temporary path that replaces path once the block exits without error.
+
+    The temporary file lives next to path so the final rename is atomic; readers
+    either see the old file or the complete new one.
+
+    Args:
+        path: Final location of the file.
+
+    Yields:
+        Temporary path to write to.
+    """
+    target = Path(path)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_name(f".{target.name}.tmp")
+    try:
+        yield tmp
+        with open(tmp, "rb") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp, target)
+    finally:
+        tmp.unlink(missing_ok=True)
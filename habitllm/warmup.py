@@ -0,0 +1,74 @@
+"""Background warm-up of the extension's heavy dependencies."""
+
+import logging
+import threading
+import time
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+STARTING = "starting"
+READY = "ready"
+DEGRADED = "degraded"
+
+
+class Warmup:
+    """
+    Runs named warm-up steps (model loads, store connections) on a background thread.
+
+    A failing step does not stop the others; it marks the extension as degraded instead
+    so the webui keeps serving without that component.
+    """
+
+    def __init__(self) -> None:
+        self.state = READY
+        self.errors: dict[str, str] = {}
+        self.durations: dict[str, float] = {}
+        self._thread: threading.Thread | None = None
+
+    def start(self, steps: dict[str, Callable[[], None]]) -> threading.Thread:
+        """Starts running steps, in order, on a daemon thread.
+
+        Args:
+            steps: Mapping of step name to the function performing it.
+
+        Returns:
+            The warm-up thread.
+        """
+        self.state = STARTING
+        self.errors = {}
+        self.durations = {}
+        self._thread = threading.Thread(
+            target=self._run, args=(steps,), name="habitllm-warmup", daemon=True
+        )
+        self._thread.start()
+        return self._thread
+
+    def _run(self, steps: dict[str, Callable[[], None]]) -> None:
+        for name, step in steps.items():
+            start = time.perf_counter()
+            try:
+                step()
+            except Exception as e:
+                logger.exception(f"Warm-up step '{name}' failed.")
+                self.errors[name] = str(e) or type(e).__name__
+            self.durations[name] = time.perf_counter() - start
+        self.state = DEGRADED if self.errors else READY
+        logger.info(f"Warm-up finished: {self.describe()}")
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """Blocks until warm-up finished. Returns whether it did within timeout."""
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self.state != STARTING
+
+    def describe(self) -> str:
+        """Markdown summary of the warm-up state for the UI."""
+        lines = [f"**Status:** {self.state}"]
+        for name, seconds in self.durations.items():
+            outcome = f"failed ({self.errors[name]})" if name in self.errors else "ok"
+            lines.append(f"- {name}: {outcome} in {seconds:.2f}s")
+        return "\n".join(lines)
+
+
+warmup = Warmup()
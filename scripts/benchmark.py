@@ -0,0 +1,325 @@
+"""Offline benchmark of ingestion and retrieval for both context systems.
+
+Runs without network access: embeddings come from a deterministic hashing stand-in
+and the persistent context uses an embedded Qdrant (local path or :memory:).
+Measures ingestion throughput, query latency percentiles for several k, context
+assembly latency, prompt prefix reuse per prompt layout, index size and peak RSS on
+a synthetic corpus, and writes the results as JSON. Pass --baseline to compare against the JSON of an earlier run.
+
+Usage:
+    python scripts/benchmark.py --files 200 --output bench.json
+    python scripts/benchmark.py --baseline bench.json --tolerance 0.1
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+import random
+import resource
+import sys
+import tempfile
+import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+from habitllm import parameters  # noqa: E402
+
+parameters.CONFIG_PATH = REPO_ROOT / "habitllm" / "config.json"
+
+from habitllm.context_assembler import Candidate, assemble_context  # noqa: E402
+from habitllm.embedding_service import set_embedding_service  # noqa: E402
+from habitllm.prompt_layout import PrefixReuse, StableContextBlocks, render_context  # noqa: E402
+
+# metrics where a larger value is an improvement, everything else is lower-is-better
+HIGHER_IS_BETTER = ("files_per_sec", "chunks_per_sec", "prefix_reuse")
+# describe the workload rather than performance
+INFORMATIONAL = ("chunks", "block_kept_fraction")
+
+
+class HashingEmbeddings(Embeddings):
+    """Deterministic stand-in embedder: feature hashing of lowercase tokens, L2 normalized."""
+
+    def __init__(self, dim: int = 768) -> None:
+        self.dim = dim
+
+    def _embed(self, text: str) -> list[float]:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for token in text.lower().split():
+            digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+            h = int.from_bytes(digest, "little")
+            vector[h % self.dim] += 1.0 if (h >> 32) & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._embed(text)
+
+
+def make_corpus(
+    directory: Path, n_files: int, paragraphs: int, seed: int
+) -> tuple[list[str], list[str]]:
+    """Writes a synthetic corpus and returns its filepaths and sample queries."""
+    rng = random.Random(seed)
+    vocabulary = [f"w{i}" for i in range(5000)] + [f"E{i:04d}" for i in range(200)]
+    directory.mkdir(parents=True, exist_ok=True)
+    files, sentences = [], []
+    for i in range(n_files):
+        paras = []
+        for _ in range(paragraphs):
+            sentence = " ".join(rng.choices(vocabulary, k=rng.randint(40, 120)))
+            paras.append(sentence)
+            sentences.append(sentence)
+        path = directory / f"doc_{i:05d}.txt"
+        path.write_text("\n\n".join(paras))
+        files.append(str(path))
+    queries = [" ".join(s.split()[:12]) for s in rng.sample(sentences, min(200, len(sentences)))]
+    return files, queries
+
+
+def keyword_queries(queries: list[str]) -> list[str]:
+    """Identifier lookups (E#### codes) taken from the queries, served by the keyword index."""
+    return [token for query in queries for token in query.split() if token.startswith("E")][:200]
+
+
+def percentiles(samples: list[float]) -> dict[str, float]:
+    p50, p95, p99 = np.percentile(np.asarray(samples) * 1000, [50, 95, 99])
+    return {"p50_ms": float(p50), "p95_ms": float(p95), "p99_ms": float(p99)}
+
+
+def time_queries(search, queries: list[str]) -> dict[str, float]:
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        search(query)
+        latencies.append(time.perf_counter() - start)
+    return percentiles(latencies)
+
+
+def dir_size(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+
+
+def bench_inference_specific_context(
+    files: list[str], queries: list[str], ks: list[int], workdir: Path
+) -> dict:
+    from habitllm.inference_specific_context_system import InferenceContextStore
+
+    store = InferenceContextStore(
+        str((workdir / "isc_upload").resolve()), str((workdir / "isc_index").resolve())
+    )
+
+    report = store.add_files(files)
+    results = {
+        "files_per_sec": report.files_per_sec,
+        "chunks_per_sec": report.chunks_per_sec,
+        "chunks": report.chunks,
+        "index_bytes": dir_size(Path(store.index_dir)),
+    }
+    store.wait_for_migration()
+    for k in ks:
+        results[f"query_k{k}"] = time_queries(
+            lambda q: store.similarity_search(q, k=k), queries
+        )
+        results[f"hybrid_query_k{k}"] = time_queries(
+            lambda q: store.hybrid_search_with_vectors(q, k=k), queries
+        )
+        results[f"keyword_query_k{k}"] = time_queries(
+            lambda q: store.hybrid_search_with_vectors(q, k=k, dense=False),
+            keyword_queries(queries),
+        )
+    index_stats = store.index_stats()
+    results["index_factory"] = index_stats["factory"]
+    results["bytes_per_vector"] = index_stats["bytes_per_vector"]
+    return results
+
+
+def bench_model_persistent_context(
+    files: list[str],
+    queries: list[str],
+    ks: list[int],
+    workdir: Path,
+    in_memory: bool,
+    backend: str = "qdrant-local",
+) -> dict:
+    from habitllm.model_persistent_context_system import ModelPersistentContext
+
+    in_memory = in_memory and backend != "faiss-sqlite"
+    storage = workdir / backend
+    mpc = ModelPersistentContext(
+        address=":memory:",
+        backend="qdrant" if in_memory else backend,
+        path=None if in_memory else str(storage),
+        file_dir=str(workdir / "mpc_files"),
+        batch_size=parameters.get_embedding_batch_size(),
+    )
+    start = time.perf_counter()
+    mpc.add_files_to_vector_store(files)
+    seconds = time.perf_counter() - start
+    chunks = mpc.client.count(mpc.collection, exact=True).count
+    results = {
+        "files_per_sec": len(files) / seconds,
+        "chunks_per_sec": chunks / seconds,
+        "chunks": chunks,
+        "backend": "qdrant (in memory)" if in_memory else backend,
+        "index_bytes": dir_size(storage) if not in_memory else None,
+    }
+    for k in ks:
+        results[f"query_k{k}"] = time_queries(
+            lambda q: mpc.perform_similarity_search(q, retrieve_num=k), queries
+        )
+        results[f"hybrid_query_k{k}"] = time_queries(
+            lambda q: mpc.perform_hybrid_search_with_vectors(q, retrieve_num=k), queries
+        )
+        results[f"keyword_query_k{k}"] = time_queries(
+            lambda q: mpc.perform_hybrid_search_with_vectors(q, retrieve_num=k, dense=False),
+            keyword_queries(queries),
+        )
+    mpc.client.close()
+    return results
+
+
+def bench_context_assembly(embedder: Embeddings, queries: list[str], k: int) -> dict:
+    rng = np.random.default_rng(0)
+    latencies = []
+    for query in queries:
+        query_vector = np.asarray(embedder.embed_query(query))
+        candidates = [
+            Candidate(
+                content=" ".join(query.split()[::-1]) * (i + 1),
+                score=0.0,
+                store="ISC",
+                vector=query_vector + rng.normal(scale=0.1, size=query_vector.shape),
+            )
+            for i in range(2 * k)
+        ]
+        start = time.perf_counter()
+        assemble_context(query_vector, candidates, 1024, lambda text: len(text) // 4)
+        latencies.append(time.perf_counter() - start)
+    return percentiles(latencies)
+
+
+def bench_prompt_layouts(files: list[str], k: int, turns: int = 20, seed: int = 0) -> dict:
+    """Share of prompt tokens reused from the previous turn over a simulated chat, per layout.
+
+    Words stand in for tokens. Each turn the retrieved persistent context drifts by at
+    most one chunk and comes back in a different relevance order, the history grows by
+    one exchange and one per-turn chunk is added.
+    """
+    rng = random.Random(seed)
+    pool = []
+    for file in files:
+        text = Path(file).read_text()
+        for start, paragraph in enumerate(text.split("\n\n")):
+            pool.append(
+                Candidate(paragraph, 0.0, "MPC", np.zeros(1), {"source": file, "start_index": start})
+            )
+    retrieved = rng.sample(pool, k)
+    history = ""
+    reuse = {"inline": PrefixReuse(), "prefix-cache": PrefixReuse()}
+    vocabulary: dict[str, int] = {}
+    blocks = StableContextBlocks(threshold=parameters.get_stable_context_overlap())
+    for turn in range(turns):
+        if rng.random() < 0.3:
+            retrieved[rng.randrange(k)] = rng.choice(pool)
+        rng.shuffle(retrieved)
+        per_turn = Candidate(f"upload excerpt {turn} " + rng.choice(pool).content, 0.0, "ISC", np.zeros(1))
+        user = f"question {turn}"
+        inline = f"system\n{history}Context:\n{render_context(retrieved + [per_turn])}\n\n{user}"
+        block, _ = blocks.update("chat", retrieved)
+        in_block = {chunk.content_hash for chunk in block}
+        fresh = [chunk for chunk in retrieved if chunk.content_hash not in in_block] + [per_turn]
+        layered = (
+            f"system\n\nContext:\n{render_context(block)}\n{history}"
+            f"Context:\n{render_context(fresh)}\n\n{user}"
+        )
+        for name, prompt in (("inline", inline), ("prefix-cache", layered)):
+            reuse[name].observe("chat", [vocabulary.setdefault(w, len(vocabulary)) for w in prompt.split()])
+        history += f"{user}\nanswer {turn}\n"
+    return {
+        "inline": {"prefix_reuse": reuse["inline"].ratio},
+        "prefix_cache": {"prefix_reuse": reuse["prefix-cache"].ratio},
+        "block_kept_fraction": blocks.kept / turns,
+    }
+
+
+def compare(current: dict, baseline: dict, tolerance: float, prefix: str = "") -> list[str]:
+    """Lists metrics that regressed by more than tolerance relative to baseline."""
+    regressions = []
+    for key, value in current.items():
+        name = f"{prefix}{key}"
+        base = baseline.get(key)
+        if isinstance(value, dict) and isinstance(base, dict):
+            regressions += compare(value, base, tolerance, f"{name}.")
+        elif isinstance(value, (int, float)) and isinstance(base, (int, float)) and base:
+            change = (value - base) / base
+            worse = -change if key in HIGHER_IS_BETTER else change
+            marker = "REGRESSION" if worse > tolerance and key not in INFORMATIONAL else ""
+            print(f"{name:<50} {base:>14.3f} -> {value:>14.3f} ({change:+.1%}) {marker}")
+            if marker:
+                regressions.append(name)
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=100)
+    parser.add_argument("--paragraphs", type=int, default=20)
+    parser.add_argument("--ks", type=int, nargs="+", default=[1, 4, 10])
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--qdrant-in-memory", action="store_true")
+    parser.add_argument(
+        "--mpc-backend", choices=["qdrant-local", "faiss-sqlite"], default="qdrant-local"
+    )
+    parser.add_argument("--output", default="bench_output.json")
+    parser.add_argument("--baseline", default=None)
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    embedder = HashingEmbeddings(args.dim)
+    set_embedding_service(embedder)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        files, queries = make_corpus(workdir / "corpus", args.files, args.paragraphs, args.seed)
+        results = {
+            "config": vars(args),
+            "inference_specific_context": bench_inference_specific_context(
+                files, queries, args.ks, workdir
+            ),
+            "model_persistent_context": bench_model_persistent_context(
+                files, queries, args.ks, workdir, args.qdrant_in_memory, args.mpc_backend
+            ),
+            "context_assembly": bench_context_assembly(embedder, queries, max(args.ks)),
+            "prompt_layouts": bench_prompt_layouts(files, max(args.ks), seed=args.seed),
+            # ru_maxrss is in KiB on Linux
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        }
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Wrote results to {os.path.abspath(args.output)}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        results.pop("config")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} metrics regressed by more than {args.tolerance:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""CPU benchmark of the per-token overhead of the retrieval logit bias processor.
+
+Times one generation step's worth of logits processing for:
+
+    passthrough   the previous MyLogits, returning the scores unchanged
+    sparse-bias   RetrievalLogitBias: one index_add_ of the cached sparse bias
+    dense-bias    adding a full vocabulary sized bias tensor, for comparison
+
+and the cost of building the bias for a turn on a cache miss and a hit. Token ids of
+the context are random stand-ins, so no tokenizer or model is needed.
+
+Usage:
+    python scripts/benchmark_logit_bias.py --vocab 32000 --context-tokens 2048
+    python scripts/benchmark_logit_bias.py --vocab 128256 --batch 4 --output bias.json
+"""
+
+import argparse
+import json
+import os
+from pathlib import Path
+import sys
+import time
+
+import numpy as np
+import torch
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+from habitllm.logit_bias import LogitBiasCache, RetrievalLogitBias, build_bias  # noqa: E402
+
+
+def time_steps(processor, scores: torch.Tensor, steps: int) -> dict:
+    input_ids = torch.zeros((scores.shape[0], 1), dtype=torch.int64)
+    # the first step prepares the bias for the scores' device and dtype
+    processor(input_ids, scores.clone())
+    latencies = []
+    for _ in range(steps):
+        step_scores = scores.clone()
+        start = time.perf_counter()
+        processor(input_ids, step_scores)
+        latencies.append(time.perf_counter() - start)
+    p50, p99 = np.percentile(latencies, [50, 99]) * 1e6
+    return {"p50_us": float(p50), "p99_us": float(p99)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--vocab", type=int, default=32000)
+    parser.add_argument("--batch", type=int, default=1)
+    parser.add_argument("--context-tokens", type=int, default=2048)
+    parser.add_argument("--max-tokens", type=int, default=2048)
+    parser.add_argument("--steps", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.threads)
+    rng = np.random.default_rng(args.seed)
+    context = rng.integers(0, args.vocab, size=args.context_tokens).tolist()
+    # one text per 256 tokens, "tokenized" by looking its slice up
+    texts = [str(start) for start in range(0, len(context), 256)]
+    tokenize = lambda text: context[int(text) : int(text) + 256]  # noqa: E731
+    scores = torch.randn(args.batch, args.vocab)
+
+    indices, values = build_bias(context, 1.0, args.max_tokens)
+    dense = torch.zeros(args.vocab)
+    dense[indices] = values
+
+    results = {"config": vars(args), "biased_tokens": len(indices)}
+    results["passthrough"] = time_steps(lambda input_ids, s: s, scores, args.steps)
+    results["sparse-bias"] = time_steps(RetrievalLogitBias(indices, values), scores, args.steps)
+    results["dense-bias"] = time_steps(lambda input_ids, s: s.add_(dense), scores, args.steps)
+
+    cache = LogitBiasCache()
+    for name in ("build_miss_us", "build_hit_us"):
+        start = time.perf_counter()
+        cache.get(texts, tokenize, 1.0, args.max_tokens)
+        results[name] = (time.perf_counter() - start) * 1e6
+
+    print(f"{len(indices)} biased tokens of a {args.vocab} token vocabulary, batch {args.batch}")
+    for name in ("passthrough", "sparse-bias", "dense-bias"):
+        print(f"{name:>12}: p50 {results[name]['p50_us']:8.1f}us, p99 {results[name]['p99_us']:8.1f}us")
+    print(f"bias build: {results['build_miss_us']:.0f}us on a miss, {results['build_hit_us']:.0f}us on a hit")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Wrote results to {os.path.abspath(args.output)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""Benchmark of bulk point upload into the persistent context's Qdrant collection.
+
+Uploads the same synthetic points (random vectors with a chunk sized text payload)
+through ModelPersistentContext.upload_points in several transport configurations and
+reports points/sec for each:
+
+    sequential  REST, 64 points per request, one request at a time (the previous path)
+    rest-bulk   REST, --batch-size points per request, --workers requests in flight
+    grpc-bulk   gRPC, --batch-size points per request, --workers requests in flight
+
+Run it against a local Qdrant stand-in, e.g. `docker run -p 6333:6333 -p 6334:6334
+qdrant/qdrant`. With --in-memory it uses an embedded Qdrant instead, which only checks
+the code path: there is no transport to measure, so the gRPC mode is skipped.
+
+The bulk modes have not been measured against a Qdrant server yet, so the config keeps
+the sequential settings (64 points per request, one worker, REST). Run the benchmark
+against the server you deploy and raise "mpc upload batch size", "mpc upload workers"
+and "mpc prefer grpc" in config.json if it shows a gain there.
+
+Usage:
+    python scripts/benchmark_mpc_upload.py --url http://localhost:6333 --points 50000
+    python scripts/benchmark_mpc_upload.py --in-memory --points 2000
+"""
+
+import argparse
+import json
+import logging
+import os
+from pathlib import Path
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+from habitllm import parameters  # noqa: E402
+
+parameters.CONFIG_PATH = REPO_ROOT / "habitllm" / "config.json"
+
+from qdrant_client.http import models  # noqa: E402
+
+from habitllm.model_persistent_context_system import ModelPersistentContext  # noqa: E402
+
+
+def make_points(n: int, dim: int, seed: int) -> list[models.PointStruct]:
+    rng = np.random.default_rng(seed)
+    words = random.Random(seed)
+    vectors = rng.normal(size=(n, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return [
+        models.PointStruct(
+            id=i,
+            vector=vector.tolist(),
+            payload={
+                "page_content": " ".join(f"w{words.randrange(5000)}" for _ in range(80)),
+                "metadata": {"source": f"doc_{i // 20:05d}.txt"},
+            },
+        )
+        for i, vector in enumerate(vectors)
+    ]
+
+
+def bench_mode(
+    name: str, points: list[models.PointStruct], dim: int, workdir: Path, **options
+) -> dict:
+    mpc = ModelPersistentContext(
+        collection=f"upload_bench_{name.replace('-', '_')}",
+        file_dir=str(workdir / "files"),
+        manifest_path=str(workdir / f"{name}_manifest.json"),
+        **options,
+    )
+    if mpc.client.collection_exists(mpc.collection):
+        mpc.client.delete_collection(mpc.collection)
+    mpc._ensure_collection(dim)
+
+    start = time.perf_counter()
+    mpc.upload_points(points)
+    seconds = time.perf_counter() - start
+    stored = mpc.client.count(mpc.collection, exact=True).count
+    mpc.client.delete_collection(mpc.collection)
+    if stored != len(points):
+        raise RuntimeError(f"{name}: uploaded {len(points)} points but {stored} are stored")
+    result = {"seconds": seconds, "points_per_sec": len(points) / seconds}
+    print(f"{name:>10}: {result['points_per_sec']:10.1f} points/sec ({seconds:.2f}s)")
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:6333")
+    parser.add_argument("--port", type=int, default=6333)
+    parser.add_argument("--grpc-port", type=int, default=parameters.get_mpc_grpc_port())
+    parser.add_argument("--in-memory", action="store_true")
+    parser.add_argument("--points", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    points = make_points(args.points, args.dim, args.seed)
+    connection = (
+        {"address": ":memory:"}
+        if args.in_memory
+        else {"address": args.url, "port": args.port, "grpc_port": args.grpc_port}
+    )
+    modes = {
+        "sequential": {"upload_batch_size": 64, "upload_workers": 1},
+        "rest-bulk": {"upload_batch_size": args.batch_size, "upload_workers": args.workers},
+    }
+    if not args.in_memory:
+        modes["grpc-bulk"] = {**modes["rest-bulk"], "prefer_grpc": True}
+
+    results = {"config": vars(args)}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, options in modes.items():
+            results[name] = bench_mode(name, points, args.dim, Path(tmp), **connection, **options)
+    baseline = results["sequential"]["points_per_sec"]
+    for name in modes:
+        results[name]["speedup"] = results[name]["points_per_sec"] / baseline
+    print(", ".join(f"{name}: {results[name]['speedup']:.2f}x" for name in modes))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Wrote results to {os.path.abspath(args.output)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""Checks retrieval recall and speed of an embedding backend against the fp32 baseline.
+
+Embeds a corpus with the fp32 torch backend and with the candidate backend, runs the
+same queries against both and reports recall@k of the candidate's neighbours against
+the baseline's, document throughput per batch size and query latency. Exits non-zero
+if recall drops below 1 - tolerance.
+
+The corpus is the .txt files of --docs, chunked like ingestion does, or a synthetic
+corpus if none is given. Queries are the opening words of random chunks.
+
+Usage:
+    python scripts/check_embedding_recall.py --backend onnx-int8 --docs data/ --threads 4
+    python scripts/check_embedding_recall.py --backend onnx --batch-sizes 16 32 64 128
+"""
+
+import argparse
+import json
+from pathlib import Path
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+from habitllm import parameters  # noqa: E402
+
+parameters.CONFIG_PATH = REPO_ROOT / "habitllm" / "config.json"
+
+from habitllm.chunker import TokenChunker, embedder_token_offsets  # noqa: E402
+from habitllm.embedding_backends import BACKENDS, load_embeddings  # noqa: E402
+from habitllm.embedding_service import DEFAULT_EMBEDDER  # noqa: E402
+
+sys.path.insert(0, str(REPO_ROOT / "scripts"))
+from benchmark import make_corpus, percentiles  # noqa: E402
+
+
+def load_chunks(files: list[str], baseline, max_chunks: int) -> list[str]:
+    token_offsets, window = embedder_token_offsets(baseline)
+    chunker = TokenChunker(token_offsets, chunk_tokens=window)
+    chunks = []
+    for file in files:
+        chunks.extend(doc.page_content for doc in chunker.split_file(file))
+        if len(chunks) >= max_chunks:
+            break
+    return chunks[:max_chunks]
+
+
+def normalize(vectors) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+def top_k(doc_vectors: np.ndarray, query_vectors: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k most cosine-similar documents of each query."""
+    similarity = query_vectors @ doc_vectors.T
+    return np.argsort(-similarity, axis=1)[:, :k]
+
+
+def recall_at_k(baseline: np.ndarray, candidate: np.ndarray) -> float:
+    k = baseline.shape[1]
+    return float(np.mean([len(set(b) & set(c)) / k for b, c in zip(baseline, candidate)]))
+
+
+def measure(
+    embedder, chunks: list[str], queries: list[str], batch_sizes: list[int]
+) -> tuple[dict, np.ndarray, np.ndarray]:
+    """Embeds chunks at each batch size and times the queries one by one.
+
+    Returns:
+        Throughput and latency results, and the normalized document and query vectors.
+    """
+    results = {"docs_per_sec": {}}
+    vectors = None
+    for batch_size in batch_sizes:
+        embedder.batch_size = batch_size
+        start = time.perf_counter()
+        vectors = embedder.embed_documents(chunks)
+        results["docs_per_sec"][batch_size] = len(chunks) / (time.perf_counter() - start)
+    latencies = []
+    query_vectors = []
+    for query in queries:
+        start = time.perf_counter()
+        query_vectors.append(embedder.embed_query(query))
+        latencies.append(time.perf_counter() - start)
+    results["query"] = percentiles(latencies)
+    return results, normalize(vectors), normalize(query_vectors)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backend", choices=BACKENDS, default="onnx-int8")
+    parser.add_argument("--model", default=DEFAULT_EMBEDDER)
+    parser.add_argument("--docs", default=None, help="Directory of .txt files to use as corpus")
+    parser.add_argument("--max-chunks", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--threads", type=int, default=0)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[32])
+    parser.add_argument("--tolerance", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    baseline = load_embeddings(args.model, backend="torch", threads=args.threads)
+    candidate = load_embeddings(args.model, backend=args.backend, threads=args.threads)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.docs:
+            files = sorted(str(path) for path in Path(args.docs).rglob("*.txt"))
+        else:
+            files, _ = make_corpus(Path(tmp), n_files=50, paragraphs=10, seed=args.seed)
+        chunks = load_chunks(files, baseline, args.max_chunks)
+    rng = random.Random(args.seed)
+    queries = [" ".join(chunk.split()[:12]) for chunk in rng.sample(chunks, min(args.queries, len(chunks)))]
+    k = min(args.k, len(chunks))
+    print(f"{len(chunks)} chunks, {len(queries)} queries, k={k}")
+
+    results = {"config": vars(args)}
+    neighbours = {}
+    for name, embedder in (("torch", baseline), (args.backend, candidate)):
+        results[name], doc_vectors, query_vectors = measure(embedder, chunks, queries, args.batch_sizes)
+        neighbours[name] = top_k(doc_vectors, query_vectors, k)
+        throughput = ", ".join(
+            f"batch {batch_size}: {rate:.1f}" for batch_size, rate in results[name]["docs_per_sec"].items()
+        )
+        print(f"{name:>10}: docs/sec {throughput}; query p50 {results[name]['query']['p50_ms']:.1f}ms")
+
+    recall = recall_at_k(neighbours["torch"], neighbours[args.backend])
+    results["recall_at_k"] = recall
+    print(f"recall@{k} of {args.backend} against torch fp32: {recall:.3f}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if recall < 1 - args.tolerance:
+        print(f"Recall is below the tolerance of {args.tolerance:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
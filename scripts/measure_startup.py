@@ -0,0 +1,92 @@
+"""Measures how long habitllm blocks webui startup.
+
+Compares an eager startup (imports, embedding model load, context store restore and
+Qdrant connection all done before setup() returns) against the lazy startup used by
+script.setup() (light imports, everything else warmed up on a background thread).
+Each measurement runs in a fresh interpreter so import caches do not skew results.
+
+Usage:
+    python scripts/measure_startup.py [--repeats 3] [--qdrant-address :memory:]
+"""
+
+import argparse
+import json
+from pathlib import Path
+import statistics
+import subprocess
+import sys
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+_PRELUDE = """
+import json, sys, time
+sys.path.insert(0, {repo_root!r})
+from habitllm import parameters
+parameters.CONFIG_PATH = {repo_root!r} + "/habitllm/config.json"
+start = time.perf_counter()
+"""
+
+_EAGER = """
+import habitllm.inference_specific_context_system as isc
+import habitllm.model_persistent_context_system as mpc
+from habitllm.embedding_service import get_embedding_service
+get_embedding_service().embed_query("warm-up")
+isc.restore_vector_store()
+mpc.ModelPersistentContext(address={address!r}, file_dir={file_dir!r})
+blocking = time.perf_counter() - start
+print(json.dumps({{"blocking": blocking, "ready": blocking}}))
+"""
+
+_LAZY = """
+import habitllm.inference_specific_context_system as isc
+import habitllm.context_assembler, habitllm.retrieval
+from habitllm.embedding_service import get_embedding_service
+from habitllm.warmup import warmup
+
+def _connect():
+    import habitllm.model_persistent_context_system as mpc
+    mpc.ModelPersistentContext(address={address!r}, file_dir={file_dir!r})
+
+warmup.start({{
+    "embedding model": lambda: get_embedding_service().embed_query("warm-up"),
+    "inference specific context": isc.restore_vector_store,
+    "model persistent context": _connect,
+}})
+blocking = time.perf_counter() - start
+warmup.wait()
+print(json.dumps({{"blocking": blocking, "ready": time.perf_counter() - start, "state": warmup.state}}))
+"""
+
+
+def _measure(body: str, address: str, file_dir: str) -> dict:
+    code = _PRELUDE.format(repo_root=str(REPO_ROOT)) + body.format(
+        address=address, file_dir=file_dir
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], check=True, stdout=subprocess.PIPE, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--qdrant-address", default=":memory:")
+    parser.add_argument("--file-dir", default="cache/measure_startup_files")
+    args = parser.parse_args()
+
+    Path(args.file_dir).mkdir(parents=True, exist_ok=True)
+    for mode, body in (("eager", _EAGER), ("lazy", _LAZY)):
+        runs = [
+            _measure(body, args.qdrant_address, args.file_dir)
+            for _ in range(args.repeats)
+        ]
+        blocking = statistics.median(run["blocking"] for run in runs)
+        ready = statistics.median(run["ready"] for run in runs)
+        print(
+            f"{mode:>5}: setup blocks for {blocking:.2f}s, components ready after {ready:.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
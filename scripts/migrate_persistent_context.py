@@ -0,0 +1,78 @@
+"""Copies the model persistent context from one storage backend to another.
+
+Points keep their ids, vectors and payloads, so nothing is re-embedded and the
+ingestion manifest and keyword index stay valid for the new backend. Afterwards set
+"mpc backend" (and "mpc storage path" for the local backends) in habitllm/config.json.
+
+Stop the webui first: embedded Qdrant storage can only be opened by one process.
+
+Usage:
+    python scripts/migrate_persistent_context.py --from-backend qdrant \\
+        --to-backend faiss-sqlite --to-path cache/habitllm_persistent_context
+    python scripts/migrate_persistent_context.py --from-backend faiss-sqlite \\
+        --from-path cache/habitllm_persistent_context --to-backend qdrant-local \\
+        --to-path cache/habitllm_persistent_context_qdrant
+"""
+
+import argparse
+import logging
+from pathlib import Path
+import sys
+import time
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+from habitllm.model_persistent_context_system import (  # noqa: E402
+    BACKENDS,
+    copy_collection,
+    get_client,
+)
+
+
+def open_client(side: str, backend: str, address: str, port: int, path: str | None):
+    if backend != "qdrant" and path is None:
+        sys.exit(f"The {backend} backend needs --{side}-path")
+    return get_client(address, port, path=path, backend=backend)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--from-backend", choices=BACKENDS, required=True)
+    parser.add_argument("--from-address", default="localhost")
+    parser.add_argument("--from-port", type=int, default=6333)
+    parser.add_argument("--from-path", default=None)
+    parser.add_argument("--to-backend", choices=BACKENDS, required=True)
+    parser.add_argument("--to-address", default="localhost")
+    parser.add_argument("--to-port", type=int, default=6333)
+    parser.add_argument("--to-path", default=None)
+    parser.add_argument("--collection", default="model_persistent_context")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument(
+        "--overwrite", action="store_true", help="Replace the collection if the target has it."
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    source = open_client("from", args.from_backend, args.from_address, args.from_port, args.from_path)
+    target = open_client("to", args.to_backend, args.to_address, args.to_port, args.to_path)
+    if not source.collection_exists(args.collection):
+        sys.exit(f"The source has no collection {args.collection!r}")
+    if target.collection_exists(args.collection):
+        if not args.overwrite:
+            sys.exit(f"The target already has a collection {args.collection!r}, see --overwrite")
+        target.delete_collection(args.collection)
+
+    start = time.perf_counter()
+    copied = copy_collection(source, target, args.collection, args.batch_size)
+    expected = source.count(args.collection, exact=True).count
+    stored = target.count(args.collection, exact=True).count
+    source.close()
+    target.close()
+    if stored != expected:
+        sys.exit(f"Copied {copied} points but the target holds {stored} of {expected}")
+    print(f"Copied {copied} points in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Exports the model persistent context as a snapshot bundle, or imports one.
+
+The bundle holds the stored vectors (float16 or int8 .npy), payloads in columns, the
+ingestion manifest and the ingested files, see
+habitllm/model_persistent_context_system/snapshot.py. Importing it uploads the vectors
+as they are, so a new node is ready without re-embedding the corpus.
+
+The connection options default to those in habitllm/config.json.
+
+Usage:
+    python scripts/snapshot_persistent_context.py export bundle/ --vector-dtype int8
+    python scripts/snapshot_persistent_context.py import bundle/ \\
+        --backend faiss-sqlite --path cache/habitllm_persistent_context
+"""
+
+import argparse
+import logging
+from pathlib import Path
+import sys
+import time
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+from habitllm import parameters  # noqa: E402
+
+parameters.CONFIG_PATH = REPO_ROOT / "habitllm" / "config.json"
+
+from habitllm.model_persistent_context_system import BACKENDS, ModelPersistentContext  # noqa: E402
+from habitllm.model_persistent_context_system.snapshot import VECTOR_DTYPES  # noqa: E402
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command", choices=["export", "import"])
+    parser.add_argument("bundle", help="Snapshot bundle directory.")
+    parser.add_argument("--backend", choices=BACKENDS, default=parameters.get_mpc_backend())
+    parser.add_argument("--address", default="http://habitllm-persistent-context-store-1:6333")
+    parser.add_argument("--port", type=int, default=6333)
+    parser.add_argument("--path", default=parameters.get_mpc_storage_path())
+    parser.add_argument("--collection", default="model_persistent_context")
+    parser.add_argument("--file-dir", default="/persistent/model_context/files")
+    parser.add_argument("--manifest-path", default=None)
+    parser.add_argument("--vector-dtype", choices=VECTOR_DTYPES, default="float16")
+    parser.add_argument("--overwrite", action="store_true", help="Replace an existing collection.")
+    parser.add_argument(
+        "--force", action="store_true", help="Import vectors of another embedding model."
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    mpc = ModelPersistentContext(
+        collection=args.collection,
+        address=args.address,
+        port=args.port,
+        path=args.path if args.backend != "qdrant" else None,
+        backend=args.backend,
+        file_dir=args.file_dir,
+        manifest_path=args.manifest_path,
+        upload_batch_size=parameters.get_mpc_upload_batch_size(),
+        upload_workers=parameters.get_mpc_upload_workers(),
+        max_retries=parameters.get_mpc_max_retries(),
+    )
+    start = time.perf_counter()
+    if args.command == "export":
+        manifest = mpc.export_snapshot(args.bundle, args.vector_dtype)
+        size = sum(file.stat().st_size for file in Path(args.bundle).rglob("*") if file.is_file())
+        print(
+            f"Exported {manifest['count']} points ({manifest['vector_dtype']}, "
+            f"{size / 2**20:.1f} MiB) in {time.perf_counter() - start:.1f}s"
+        )
+    else:
+        count = mpc.import_snapshot(args.bundle, overwrite=args.overwrite, force=args.force)
+        print(f"Imported {count} points in {time.perf_counter() - start:.1f}s")
+    mpc.client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+import hashlib
+from pathlib import Path
+
+from langchain_core.embeddings import Embeddings
+import numpy as np
+import pytest
+
+from habitllm import parameters
+from habitllm.embedding_service import set_embedding_service
+
+# the extension reads its config relative to the webui root, tests run from the repo root
+parameters.CONFIG_PATH = Path(__file__).resolve().parents[1] / "habitllm" / "config.json"
+
+
+class HashingEmbeddings(Embeddings):
+    """Deterministic stand-in embedder: feature hashing of lowercase tokens."""
+
+    dim = 64
+
+    def _embed(self, text: str) -> list[float]:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for token in text.lower().split():
+            digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+            vector[int.from_bytes(digest, "little") % self.dim] += 1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._embed(text)
+
+
+@pytest.fixture(autouse=True)
+def embeddings():
+    embeddings = HashingEmbeddings()
+    set_embedding_service(embeddings)
+    return embeddings
+
+
+@pytest.fixture
+def files(tmp_path):
+    paths = []
+    for i, topic in enumerate(["harbour cranes", "glacier melt", "violin strings"]):
+        path = tmp_path / f"doc{i}.txt"
+        path.write_text("\n\n".join(f"notes on {topic}, part {j}" for j in range(5)))
+        paths.append(str(path))
+    return paths
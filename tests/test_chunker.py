@@ -0,0 +1,94 @@
+"""TokenChunker: chunks cover the text, respect the token limit and overlap, and do not
+depend on how the text is split into blocks."""
+
+import random
+
+import pytest
+
+from habitllm import chunker as chunker_module
+from habitllm.chunker import TokenChunker, _word_offsets
+
+
+def _text(n_words: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    parts = []
+    for i in range(n_words):
+        parts.append(f"w{rng.randrange(10_000)}")
+        parts.append(rng.choice([" ", " ", " ", "\n", "\n\n", "  "]))
+    return "".join(parts)
+
+
+def _blocks(text: str, size: int):
+    return (text[start : start + size] for start in range(0, len(text), size))
+
+
+def _token_spans(text: str, chunks) -> list[tuple[int, int]]:
+    """First and last (exclusive) token index of each chunk in the whole text."""
+    starts = {start: i for i, (start, _) in enumerate(_word_offsets(text))}
+    ends = {end: i + 1 for i, (_, end) in enumerate(_word_offsets(text))}
+    return [(starts[start], ends[end]) for _, start, end in chunks]
+
+
+@pytest.mark.parametrize("chunk_tokens, overlap_tokens", [(16, 0), (50, 10), (64, 63)])
+def test_chunks_cover_the_text_within_the_limit(chunk_tokens, overlap_tokens):
+    text = _text(3000)
+    chunker = TokenChunker(chunk_tokens=chunk_tokens, overlap_tokens=overlap_tokens)
+    chunks = list(chunker.split_stream([text]))
+    spans = _token_spans(text, chunks)
+
+    for chunk, start, end in chunks:
+        assert text[start:end] == chunk
+        assert len(_word_offsets(chunk)) <= chunk_tokens
+    # no gaps: every token is in a chunk, from the first to the last
+    assert spans[0][0] == 0
+    assert spans[-1][1] == len(_word_offsets(text))
+    for (previous_start, previous_end), (start, end) in zip(spans, spans[1:]):
+        # each chunk moves forward and shares at most overlap_tokens with the previous
+        assert previous_start < start <= previous_end < end
+        assert previous_end - start <= overlap_tokens
+
+
+def test_overlap_is_exact():
+    text = _text(2000, seed=1)
+    chunks = list(TokenChunker(chunk_tokens=40, overlap_tokens=8).split_stream([text]))
+    spans = _token_spans(text, chunks)
+    assert all(previous_end - start == 8 for (_, previous_end), (start, _) in zip(spans, spans[1:]))
+
+
+def test_chunks_prefer_ending_at_line_breaks():
+    text = "\n".join(" ".join(f"line{i}word{j}" for j in range(10)) for i in range(50))
+    chunks = list(TokenChunker(chunk_tokens=24).split_stream([text]))
+    # 24 tokens would cut lines of 10 words, the chunk ends at the line break before
+    assert all(len(_word_offsets(chunk)) == 20 for chunk, _, _ in chunks[:-1])
+
+
+def test_block_boundaries_do_not_change_the_chunks(monkeypatch):
+    monkeypatch.setattr(chunker_module, "READ_BLOCK_CHARS", 4096)
+    text = _text(20_000, seed=2)
+    chunker = TokenChunker(chunk_tokens=48, overlap_tokens=6)
+    whole = list(chunker.split_stream([text]))
+    # blocks that cut tokens in half, and blocks much smaller than the read buffer
+    assert list(chunker.split_stream(_blocks(text, 4097))) == whole
+    assert list(chunker.split_stream(_blocks(text, 333))) == whole
+
+
+def test_file_larger_than_the_read_buffer(tmp_path):
+    text = _text(60_000, seed=3)
+    assert len(text) > 5 * chunker_module.READ_BLOCK_CHARS
+    path = tmp_path / "big.txt"
+    path.write_text(text)
+    chunker = TokenChunker(chunk_tokens=64, overlap_tokens=16)
+
+    docs = list(chunker.split_file(str(path)))
+
+    streamed = [
+        (doc.page_content, doc.metadata["start_index"], doc.metadata["end_index"]) for doc in docs
+    ]
+    assert streamed == list(chunker.split_stream([text]))
+    assert all(doc.metadata["source"] == str(path) for doc in docs)
+    assert docs[-1].metadata["end_index"] == len(text.rstrip())
+
+
+def test_overlap_must_be_smaller_than_the_chunk():
+    with pytest.raises(ValueError):
+        TokenChunker(chunk_tokens=8, overlap_tokens=8)
@@ -0,0 +1,122 @@
+"""Cross-store dedup, MMR reranking and token budget packing of retrieved chunks."""
+
+import numpy as np
+import pytest
+
+from habitllm.context_assembler import (
+    Candidate,
+    TokenCountCache,
+    assemble_context,
+    deduplicate,
+    mmr_order,
+    pack_into_budget,
+)
+from habitllm.retrieval import relevance_from_cosine
+
+
+def _count_words(text: str) -> int:
+    return len(text.split())
+
+
+def _candidates(query: np.ndarray, n: int, seed: int = 0, store: str = "ISC") -> list[Candidate]:
+    rng = np.random.default_rng(seed)
+    vectors = rng.normal(size=(n, len(query))).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return [
+        Candidate(
+            content=" ".join(f"{store}{seed}word{i}" for _ in range(1 + i % 7)),
+            score=relevance_from_cosine(float(vector @ query)),
+            store=store,
+            vector=vector,
+        )
+        for i, vector in enumerate(vectors)
+    ]
+
+
+@pytest.fixture
+def query() -> np.ndarray:
+    vector = np.random.default_rng(42).normal(size=16).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def test_duplicates_across_stores_are_kept_once(query):
+    vector = np.ones(16, dtype=np.float32)
+    mpc = Candidate("The quota is  10 GB\nper user.", 0.9, "MPC", vector)
+    isc = Candidate("The quota is 10 GB per user.", 0.8, "ISC", vector)
+    other = Candidate("Quotas reset monthly.", 0.7, "ISC", vector)
+
+    assert deduplicate([mpc, isc, other]) == [mpc, other]
+    selected = assemble_context(query, [mpc, isc, other], budget=100, count_tokens=_count_words)
+    assert sorted(candidate.content for candidate in selected) == sorted(
+        [mpc.content, other.content]
+    )
+
+
+@pytest.mark.parametrize("budget", [0, 1, 5, 17, 40, 1000])
+def test_packed_context_never_exceeds_the_budget(query, budget):
+    candidates = _candidates(query, 30) + _candidates(query, 30, seed=1, store="MPC")
+    selected = assemble_context(query, candidates, budget=budget, count_tokens=_count_words)
+
+    assert sum(_count_words(candidate.content) + 2 for candidate in selected) <= budget
+    if budget >= 1000:
+        assert len(selected) == len(candidates)
+
+
+def test_packing_skips_chunks_that_do_not_fit_and_keeps_order():
+    vector = np.zeros(4, dtype=np.float32)
+    candidates = [Candidate(" ".join(["w"] * n), 0.5, "ISC", vector) for n in (3, 10, 2, 4)]
+    packed = pack_into_budget(candidates, budget=12, count_tokens=_count_words)
+    # 3 + 2 and 2 + 2 fit, the 10 word chunk does not, the last one no longer does
+    assert [_count_words(candidate.content) for candidate in packed] == [3, 2]
+
+
+def test_mmr_with_lambda_one_is_score_order(query):
+    candidates = _candidates(query, 25)
+    vectors = np.asarray([candidate.vector for candidate in candidates])
+
+    order = mmr_order(query, vectors, lambda_mult=1.0)
+    by_score = sorted(range(len(candidates)), key=lambda i: candidates[i].score, reverse=True)
+    assert order == by_score
+    selected = assemble_context(
+        query, candidates, budget=10_000, count_tokens=_count_words, lambda_mult=1.0
+    )
+    assert [candidate.score for candidate in selected] == sorted(
+        (candidate.score for candidate in candidates), reverse=True
+    )
+
+
+def test_mmr_demotes_near_duplicates(query):
+    orthogonal = np.roll(query, 1) - (np.roll(query, 1) @ query) * query
+    orthogonal /= np.linalg.norm(orthogonal)
+    best = query
+    near_duplicate = query + 0.01 * orthogonal
+    different = 0.8 * query + 0.6 * orthogonal
+    vectors = np.asarray([best, near_duplicate, different])
+
+    assert mmr_order(query, vectors, lambda_mult=1.0) == [0, 1, 2]
+    assert mmr_order(query, vectors, lambda_mult=0.5) == [0, 2, 1]
+
+
+def test_without_query_vector_chunks_are_ranked_by_score(query):
+    candidates = _candidates(query, 10)
+    selected = assemble_context(None, candidates, budget=10_000, count_tokens=_count_words)
+    assert [candidate.score for candidate in selected] == sorted(
+        (candidate.score for candidate in candidates), reverse=True
+    )
+
+
+def test_token_counts_are_cached_per_tokenizer():
+    calls = []
+
+    def count(text: str) -> int:
+        calls.append(text)
+        return len(text)
+
+    cache = TokenCountCache(count, max_size=2)
+    assert cache.count("abc", "model-a") == 3
+    assert cache.count("abc ", "model-a") == 3  # same content, whitespace normalized
+    assert cache.count("abc", "model-b") == 3
+    assert len(calls) == 2
+    cache.count("other", "model-a")
+    cache.count("abc", "model-a")  # evicted meanwhile
+    assert len(calls) == 4
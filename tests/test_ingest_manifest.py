@@ -0,0 +1,59 @@
+"""The ingestion manifest only skips files the collection actually holds."""
+
+from habitllm.model_persistent_context_system import ModelPersistentContext
+
+
+def _options(tmp_path, store: str = "db") -> dict:
+    return {
+        "backend": "faiss-sqlite",
+        "path": str(tmp_path / store),
+        "file_dir": str(tmp_path / "files"),
+    }
+
+
+def _count(mpc) -> int:
+    return mpc.client.count(mpc.collection, exact=True).count
+
+
+def test_new_store_sharing_file_dir_ingests_again(files, tmp_path):
+    first = ModelPersistentContext(**_options(tmp_path, "a"))
+    added = first.add_files_to_vector_store(files)
+    assert added > 0
+
+    second = ModelPersistentContext(**_options(tmp_path, "b"))
+    assert second.add_files_to_vector_store(files) == added
+    assert _count(second) == added
+
+
+def test_collections_keep_their_own_manifest(files, tmp_path):
+    options = _options(tmp_path)
+    first = ModelPersistentContext(**options)
+    added = first.add_files_to_vector_store(files)
+
+    other = ModelPersistentContext(collection="other", **options)
+    assert other.add_files_to_vector_store(files) == added
+    assert _count(other) == added
+    # the first collection still skips its unchanged files
+    assert ModelPersistentContext(**options).add_files_to_vector_store(files) == 0
+
+
+def test_wiped_collection_ingests_again(files, tmp_path):
+    options = _options(tmp_path)
+    mpc = ModelPersistentContext(**options)
+    added = mpc.add_files_to_vector_store(files)
+    mpc.client.delete_collection(mpc.collection)
+
+    reopened = ModelPersistentContext(**options)
+    assert reopened.manifest == {}
+    assert reopened.add_files_to_vector_store(files) == added
+    assert _count(reopened) == added
+
+
+def test_legacy_manifest_is_checked_against_the_collection(files, tmp_path):
+    options = _options(tmp_path)
+    mpc = ModelPersistentContext(**options)
+    mpc.add_files_to_vector_store(files)
+    mpc.manifest_path.rename(tmp_path / "ingest_manifest.json")
+
+    # a manifest matching the collection is carried over
+    assert ModelPersistentContext(**options).add_files_to_vector_store(files) == 0
@@ -0,0 +1,132 @@
+"""The faiss-sqlite backend behaves like Qdrant for everything the persistent context does."""
+
+import shutil
+from pathlib import Path
+
+import pytest
+
+from habitllm.model_persistent_context_system import ModelPersistentContext
+
+QUERY = "glacier melt notes"
+
+
+def _open(location: str, root: Path, name: str) -> ModelPersistentContext:
+    options = (
+        {"address": ":memory:"}
+        if location == "memory"
+        else {"backend": "faiss-sqlite", "path": str(root / name / "db")}
+    )
+    (root / name).mkdir(parents=True, exist_ok=True)
+    return ModelPersistentContext(file_dir=str(root / name / "files"), **options)
+
+
+def _count(mpc: ModelPersistentContext) -> int:
+    return mpc.client.count(mpc.collection, exact=True).count
+
+
+def _search(mpc: ModelPersistentContext) -> list[tuple[str, str, float]]:
+    results = [
+        (Path(doc.metadata["source"]).name, doc.page_content, round(score, 4))
+        for doc, score in mpc.perform_similarity_search(QUERY, retrieve_num=4)
+    ]
+    # equally similar chunks (the duplicate) come in any order
+    return sorted(results, key=lambda result: (-result[2], result[0]))
+
+
+def _scenario(location: str, files: list[str], tmp_path: Path) -> dict:
+    """Runs every operation on one backend and records what it observed."""
+    root = tmp_path / location
+    mpc = _open(location, root, "store")
+    seen = {}
+
+    seen["added"] = mpc.add_files_to_vector_store(files)
+    seen["count"] = _count(mpc)
+    seen["search"] = _search(mpc)
+    seen["re-added"] = mpc.add_files_to_vector_store(files)
+
+    with open(files[0], "a") as f:
+        f.write("\n\nappendix on harbour cranes and tides")
+    seen["modified"] = mpc.add_files_to_vector_store(files)
+    seen["count after modify"] = _count(mpc)
+    seen["concept"] = sorted(mpc.get_ids_from_concept("glacier melt", threshold=0.5))
+
+    seen["duplicates"] = sorted(
+        len(duplicates) for _, duplicates, _ in mpc.scan_duplicates(page_size=2) if duplicates
+    )
+
+    mpc.delete_files_from_vector_store([files[2]])
+    seen["count after delete"] = _count(mpc)
+    seen["deleted file ids"] = mpc.lookup_file_ids(files[2])
+
+    # a file removed behind the store's back is dropped by compaction
+    Path(mpc._source_for(files[1])).unlink()
+    mpc.compact_vector_store(wait_timeout=10)
+    seen["count after compact"] = _count(mpc)
+    seen["sources after compact"] = sorted(Path(source).name for source in mpc.manifest)
+    seen["search after compact"] = _search(mpc)
+
+    bundle = root / "bundle"
+    mpc.export_snapshot(str(bundle), vector_dtype="float32")
+    restored = _open(location, root, "restored")
+    seen["imported"] = restored.import_snapshot(str(bundle))
+    seen["search after import"] = _search(restored)
+    kept = {Path(source).name for source in restored.manifest}
+    seen["re-added after import"] = restored.add_files_to_vector_store(
+        [file for file in files if Path(file).name in kept]
+    )
+    for store in (mpc, restored):
+        store.client.close()
+    return seen
+
+
+@pytest.fixture
+def corpus(files, tmp_path):
+    # a copy of a file under another name, so dedup has something to find
+    duplicate = tmp_path / "copy_of_doc1.txt"
+    shutil.copyfile(files[1], duplicate)
+    return files + [str(duplicate)]
+
+
+def _copies(corpus: list[str], directory: Path) -> list[str]:
+    directory.mkdir()
+    return [shutil.copy(file, directory) for file in corpus]
+
+
+def test_faiss_sqlite_matches_qdrant(corpus, tmp_path):
+    qdrant = _scenario("memory", _copies(corpus, tmp_path / "qdrant_corpus"), tmp_path)
+    faiss_sqlite = _scenario("faiss-sqlite", _copies(corpus, tmp_path / "faiss_corpus"), tmp_path)
+
+    assert qdrant["added"] > 0
+    assert qdrant["re-added"] == 0
+    assert qdrant["modified"] > 0
+    assert qdrant["duplicates"]
+    assert qdrant["deleted file ids"] == []
+    assert qdrant["imported"] == qdrant["count after compact"]
+    assert qdrant["re-added after import"] == 0
+    assert faiss_sqlite == qdrant
+
+
+def test_switching_backend_ingests_into_the_new_store(files, tmp_path):
+    file_dir = str(tmp_path / "files")
+    faiss_path = str(tmp_path / "faiss")
+    # an older faiss-sqlite store holding the first file and others
+    others = []
+    for name in ("other0.txt", "other1.txt"):
+        other = tmp_path / name
+        other.write_text(f"unrelated notes kept in {name}")
+        others.append(str(other))
+    stale = ModelPersistentContext(backend="faiss-sqlite", path=faiss_path, file_dir=file_dir)
+    stale.add_files_to_vector_store(files[:1] + others)
+
+    qdrant = ModelPersistentContext(
+        backend="qdrant-local", path=str(tmp_path / "qdrant"), file_dir=file_dir
+    )
+    added = qdrant.add_files_to_vector_store(files)
+    assert added == qdrant.client.count(qdrant.collection, exact=True).count
+    qdrant.client.close()
+
+    # back on faiss-sqlite, only the files it does not hold are ingested again
+    switched = ModelPersistentContext(backend="faiss-sqlite", path=faiss_path, file_dir=file_dir)
+    first_file_chunks = len(switched.lookup_file_ids(files[0]))
+    assert switched.add_files_to_vector_store(files) == added - first_file_chunks
+    assert switched.client.count(switched.collection, exact=True).count == added + len(others)
@@ -0,0 +1,55 @@
+"""reindex_vector_store against an embedded Qdrant (in memory and on disk)."""
+
+import pytest
+
+from habitllm.model_persistent_context_system import ModelPersistentContext
+from habitllm.model_persistent_context_system.model_persistent_context import (
+    INDEXED_PAYLOAD_FIELDS,
+    ReindexReport,
+)
+
+
+@pytest.fixture(params=["memory", "path"])
+def mpc(request, tmp_path):
+    location = (
+        {"address": ":memory:"}
+        if request.param == "memory"
+        else {"backend": "qdrant-local", "path": str(tmp_path / "db")}
+    )
+    mpc = ModelPersistentContext(file_dir=str(tmp_path / "files"), **location)
+    yield mpc
+    mpc.client.close()
+
+
+def test_reindex_without_collection(mpc):
+    assert mpc.reindex_vector_store() is None
+
+
+def test_reindex_keeps_points_and_indexes_payload(mpc, files, monkeypatch):
+    mpc.add_files_to_vector_store(files)
+    stored = mpc.client.count(mpc.collection, exact=True).count
+    assert stored > 0
+
+    # embedded Qdrant accepts payload indexes but does not record them in the
+    # collection info, so the requests are checked instead
+    indexed = {}
+    create_payload_index = mpc.client.create_payload_index
+
+    def record_payload_index(collection_name, field_name, field_schema=None, **kwargs):
+        indexed[field_name] = field_schema
+        return create_payload_index(
+            collection_name, field_name=field_name, field_schema=field_schema, **kwargs
+        )
+
+    monkeypatch.setattr(mpc.client, "create_payload_index", record_payload_index)
+
+    report = mpc.reindex_vector_store(hnsw_m=32, ef_construct=200, quantize=True, wait_timeout=10)
+
+    assert isinstance(report, ReindexReport)
+    assert report.before.vectors == report.after.vectors == stored
+    assert report.after.segments >= 1
+    assert report.after.search_latency_ms > 0
+    assert indexed == INDEXED_PAYLOAD_FIELDS
+    # the collection is still searchable after the rebuild
+    results = mpc.perform_similarity_search("glacier melt", retrieve_num=2)
+    assert results and results[0][0].metadata["source"].endswith("doc1.txt")
@@ -0,0 +1,41 @@
+"""Both context systems score the same chunk for the same query alike."""
+
+import pytest
+
+from habitllm.inference_specific_context_system import InferenceContextStore
+from habitllm.model_persistent_context_system import ModelPersistentContext
+from habitllm.retrieval import relevance_from_cosine, relevance_from_squared_l2
+
+
+def test_relevance_scales_agree():
+    assert relevance_from_cosine(1.0) == 1.0
+    assert relevance_from_cosine(0.0) == 0.5
+    assert relevance_from_cosine(-1.0) == 0.0
+    # unit vectors at cosine c are 2 - 2c apart, squared
+    for cosine in (-1.0, -0.3, 0.0, 0.42, 1.0):
+        expected = relevance_from_cosine(cosine)
+        assert relevance_from_squared_l2(2 - 2 * cosine) == pytest.approx(expected)
+
+
+def test_stores_score_the_same_chunk_alike(files, tmp_path, embeddings):
+    upload_dir = tmp_path / "uploads"
+    upload_dir.mkdir()
+    isc = InferenceContextStore(str(upload_dir), str(tmp_path / "index"))
+    isc.ensure_loaded()
+    isc.add_files(files)
+    mpc = ModelPersistentContext(address=":memory:", file_dir=str(tmp_path / "files"))
+    mpc.add_files_to_vector_store(files)
+
+    query = "glacier melt notes"
+    embedding = embeddings.embed_query(query)
+    isc_results = isc.similarity_search_with_vectors(query, 3, embedding)
+    mpc_results = mpc.perform_similarity_search_with_vectors(query, 3, embedding)
+    isc_scores = {doc.page_content: score for doc, score, _ in isc_results}
+    mpc_scores = {doc.page_content: score for doc, score, _ in mpc_results}
+    mpc.client.close()
+
+    shared = isc_scores.keys() & mpc_scores.keys()
+    assert shared
+    for content in shared:
+        assert 0.0 <= isc_scores[content] <= 1.0
+        assert isc_scores[content] == pytest.approx(mpc_scores[content], abs=1e-4)
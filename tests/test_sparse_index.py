@@ -0,0 +1,112 @@
+"""BM25 keyword index and its fusion with the dense search of the persistent context."""
+
+from habitllm.model_persistent_context_system import ModelPersistentContext
+from habitllm.sparse_index import BM25Index, is_keyword_query, reciprocal_rank_fusion, tokenize
+
+DOCS = {
+    "a": "The upload failed with ERR-4096 after the disk quota was exceeded.",
+    "b": "Errors are logged to the upload service log with their error code.",
+    "c": "Disk quotas are set per user in the storage settings.",
+    "d": "Release v1.2.3 fixed a crash in the upload retry loop.",
+}
+
+
+def _index(docs: dict[str, str] = DOCS) -> BM25Index:
+    index = BM25Index()
+    index.add_many(list(docs.items()))
+    return index
+
+
+def test_identifiers_are_kept_whole():
+    assert tokenize("ERR-4096 in v1.2.3") == [
+        "err-4096", "err", "4096", "in", "v1.2.3", "v1", "2", "3"
+    ]
+    assert is_keyword_query("ERR-4096")
+    assert is_keyword_query('"disk quota"')
+    assert not is_keyword_query("why did my upload fail")
+
+
+def test_exact_keyword_is_ranked_first():
+    index = _index()
+    assert index.search("ERR-4096", k=4)[0][0] == "a"
+    assert index.search("v1.2.3", k=4)[0][0] == "d"
+    # documents without any query term are not returned
+    assert index.search("nonexistent", k=4) == []
+
+
+def test_removed_documents_leave_the_index():
+    index = _index()
+    index.remove(["a"])
+    assert len(index) == 3
+    assert "a" not in [doc_id for doc_id, _ in index.search("ERR-4096 disk", k=4)]
+    # re-adding under the same id replaces the document
+    index.add("b", "now mentions ERR-4096")
+    assert len(index) == 3
+    assert index.search("ERR-4096", k=4)[0][0] == "b"
+
+
+def test_compaction_drops_removed_documents():
+    docs = {f"filler{i}": f"filler chunk number {i}" for i in range(2000)}
+    index = _index({**docs, **DOCS})
+    index.remove(list(docs))
+
+    assert len(index) == len(DOCS)
+    # removed documents are compacted away once they outnumber the live ones
+    assert len(index._doc_ids) <= 2 * len(DOCS) + 1024 < len(docs)
+    assert index.search("filler chunk", k=10) == []
+    assert index.search("ERR-4096", k=4)[0][0] == "a"
+
+
+def test_save_and_load_preserve_rankings(tmp_path):
+    index = _index()
+    index.remove(["c"])
+    path = tmp_path / "bm25.pkl"
+    index.save(path)
+
+    loaded = BM25Index.load(path)
+    assert len(loaded) == len(index)
+    for query in ("ERR-4096", "upload disk quota", "error code log", "v1.2.3"):
+        assert loaded.search(query, k=4) == index.search(query, k=4)
+    assert BM25Index.load(tmp_path / "missing.pkl") is None
+
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion(["x", "y", "z"], ["y", "w"], k=60)
+    assert [doc_id for doc_id, _ in fused] == ["y", "x", "w", "z"]
+    assert fused[0][1] == 1 / 61 + 1 / 62
+
+
+def _ingest(tmp_path) -> ModelPersistentContext:
+    paths = []
+    for name, text in DOCS.items():
+        path = tmp_path / f"{name}.txt"
+        path.write_text(text)
+        paths.append(str(path))
+    mpc = ModelPersistentContext(
+        backend="faiss-sqlite", path=str(tmp_path / "db"), file_dir=str(tmp_path / "files")
+    )
+    mpc.add_files_to_vector_store(paths)
+    return mpc
+
+
+def test_hybrid_search_ranks_the_exact_keyword_first(tmp_path):
+    mpc = _ingest(tmp_path)
+    for dense in (False, True):
+        results = mpc.perform_hybrid_search_with_vectors("ERR-4096", retrieve_num=3, dense=dense)
+        assert results[0][0].metadata["source"].endswith("a.txt")
+        assert results[0][2] is not None
+
+
+def test_deleted_files_leave_the_keyword_index(tmp_path):
+    mpc = _ingest(tmp_path)
+    assert len(mpc.sparse_index) == len(DOCS)
+    mpc.delete_files_from_vector_store([str(tmp_path / "a.txt")])
+
+    assert len(mpc.sparse_index) == len(DOCS) - 1
+    results = mpc.perform_hybrid_search_with_vectors("ERR-4096", retrieve_num=4, dense=False)
+    assert not any(doc.metadata["source"].endswith("a.txt") for doc, _, _ in results)
+    # and stay out once the index is loaded again
+    reopened = ModelPersistentContext(
+        backend="faiss-sqlite", path=str(tmp_path / "db"), file_dir=str(tmp_path / "files")
+    )
+    assert len(reopened.sparse_index) == len(DOCS) - 1